@@ -0,0 +1,244 @@
+# Helpers for writing the buildhistory output files
+#
+# Copyright (C) 2011-2016 Intel Corporation
+#
+
+import os
+import re
+import stat
+import subprocess
+import bb.utils
+
+def write_if_changed(path, data):
+    """
+    Write data (a string) to path unless the file already has exactly
+    that content, so that unchanged files keep their timestamps and git
+    does not need to rehash them. Returns True if the file was written.
+    """
+    try:
+        with open(path, 'r') as f:
+            if f.read() == data:
+                return False
+    except (IOError, UnicodeDecodeError):
+        pass
+    with open(path, 'w') as f:
+        f.write(data)
+    return True
+
+def record_written(d, path):
+    """
+    Record that path (a file or directory below BUILDHISTORY_DIR) has
+    been written to during this build, so that committing the changes
+    only needs to look at the recorded paths rather than the whole tree.
+    Nothing needs recording if the repository does not exist yet, since
+    the first commit has to look at everything anyway.
+    """
+    histdir = d.getVar('BUILDHISTORY_DIR')
+    gitdir = os.path.join(histdir, '.git')
+    if not os.path.isdir(gitdir):
+        return
+    lock = bb.utils.lockfile(os.path.join(gitdir, 'buildhistory-written.lock'))
+    try:
+        with open(os.path.join(gitdir, 'buildhistory-written'), 'a') as f:
+            f.write('%s\n' % os.path.relpath(path, histdir))
+    finally:
+        bb.utils.unlockfile(lock)
+
+def stage_written(d):
+    """
+    Stage the changes to the paths recorded by record_written() in the
+    index of the buildhistory repository, including the removal of paths
+    which no longer exist. Returns False without staging anything if the
+    whole tree needs to be looked at instead, because there is no usable
+    record of what was written.
+    """
+    histdir = d.getVar('BUILDHISTORY_DIR')
+    gitdir = os.path.join(histdir, '.git')
+    writtenfile = os.path.join(gitdir, 'buildhistory-written')
+    if d.getVar('BUILDHISTORY_RESET') or not os.path.exists(writtenfile):
+        return False
+    with open(writtenfile, 'r') as f:
+        paths = set(f.read().splitlines())
+    if '.' in paths:
+        return False
+
+    existing = sorted(path for path in paths if os.path.lexists(os.path.join(histdir, path)))
+    removed = sorted(path for path in paths if not os.path.lexists(os.path.join(histdir, path)))
+    # Paths are names, not patterns
+    env = dict(os.environ, GIT_LITERAL_PATHSPECS='1')
+    try:
+        for i in range(0, len(existing), 1000):
+            subprocess.check_call(['git', 'add', '-A', '--'] + existing[i:i+1000], cwd=histdir, env=env)
+        for i in range(0, len(removed), 1000):
+            subprocess.check_call(['git', 'rm', '-r', '-q', '--cached', '--ignore-unmatch', '--'] + removed[i:i+1000],
+                                  cwd=histdir, env=env)
+    except subprocess.CalledProcessError:
+        return False
+    os.unlink(writtenfile)
+    return True
+
+def invalidate_written(d):
+    """
+    Mark the record of written paths as unusable, e.g. because changes
+    were made without being committed
+    """
+    gitdir = os.path.join(d.getVar('BUILDHISTORY_DIR'), '.git')
+    if os.path.isdir(gitdir):
+        with open(os.path.join(gitdir, 'buildhistory-written'), 'w') as f:
+            f.write('.\n')
+
+def format_file_list(entries):
+    """
+    Format (mode, user, group, size, path, linktarget) tuples in the
+    same way as:
+      find . ! -path . -printf "%M %-10u %-10g %10s %p -> %l\n" | sort -k5 | sed 's/ * -> $//'
+    """
+    lines = []
+    for mode, user, group, size, path, link in sorted(entries, key=lambda e: e[4]):
+        line = '%s %-10s %-10s %10s %s' % (mode, user, group, size, path)
+        if link:
+            line += ' -> %s' % link
+        lines.append(line + '\n')
+    return ''.join(lines)
+
+def list_file_entries(rootdir):
+    """
+    Return (mode, user, group, size, path, linktarget) tuples for
+    everything below rootdir, using a single scandir pass. Ownership is
+    whatever lstat() reports, i.e. it comes from pseudo when called from
+    a fakeroot task.
+    """
+    import pwd
+    import grp
+
+    users = {}
+    groups = {}
+    def username(uid):
+        if uid not in users:
+            try:
+                users[uid] = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                users[uid] = str(uid)
+        return users[uid]
+    def groupname(gid):
+        if gid not in groups:
+            try:
+                groups[gid] = grp.getgrgid(gid).gr_name
+            except KeyError:
+                groups[gid] = str(gid)
+        return groups[gid]
+
+    entries = []
+    pending = ['.']
+    while pending:
+        reldir = pending.pop()
+        with os.scandir(os.path.join(rootdir, reldir)) as it:
+            for entry in it:
+                relpath = reldir + '/' + entry.name
+                st = entry.stat(follow_symlinks=False)
+                link = ''
+                if stat.S_ISLNK(st.st_mode):
+                    link = os.readlink(entry.path)
+                elif stat.S_ISDIR(st.st_mode):
+                    pending.append(relpath)
+                entries.append((stat.filemode(st.st_mode), username(st.st_uid),
+                                groupname(st.st_gid), st.st_size, relpath, link))
+    return entries
+
+def list_files(rootdir, outfile):
+    """
+    Write the list of files below rootdir to outfile in the format used
+    by files-in-image.txt/files-in-sdk.txt/files-in-package.txt
+    """
+    return write_if_changed(outfile, format_file_list(list_file_entries(rootdir)))
+
+def list_subdir_entries_fakeroot(rootdir, d):
+    """
+    Like list_file_entries(), but for each subdirectory of rootdir and
+    with ownership read through pseudo, since the caller is not running
+    under fakeroot. A single find process is used for all subdirectories.
+    Returns a dict mapping subdirectory names to entry lists.
+    """
+    env = os.environ.copy()
+    for var in (d.getVar('FAKEROOTENV') or '').split():
+        key, value = var.split('=', 1)
+        env[key] = value
+    cmd = d.getVar('FAKEROOTCMD').split()
+    cmd += ['find', '.', '-mindepth', '2', '-printf', r'%M\0%u\0%g\0%s\0%P\0%l\0']
+    output = subprocess.check_output(cmd, cwd=rootdir, env=env)
+
+    fields = output.decode('utf-8', errors='surrogateescape').split('\0')
+    result = {}
+    for i in range(0, len(fields) - 1, 6):
+        mode, user, group, size, path, link = fields[i:i+6]
+        subdir, path = path.split('/', 1)
+        result.setdefault(subdir, []).append((mode, user, group, size, './' + path, link))
+    return result
+
+def _write_file_list(arg):
+    entries, outfile = arg
+    write_if_changed(outfile, format_file_list(entries))
+
+def list_pkg_files(d):
+    """
+    Create files-in-package.txt for each package of the current recipe
+    """
+    import oe.utils
+
+    pkgdest = d.getVar('PKGDEST')
+    pkghistdir = d.getVar('BUILDHISTORY_DIR_PACKAGE')
+    pkgentries = list_subdir_entries_fakeroot(pkgdest, d)
+    jobs = []
+    for pkgname in os.listdir(pkgdest):
+        if not os.path.isdir(os.path.join(pkgdest, pkgname)):
+            continue
+        outfolder = os.path.join(pkghistdir, pkgname)
+        # Make sure the output folder exists so we can create the file
+        if not os.path.isdir(outfolder):
+            bb.debug(2, "Folder %s does not exist, file files-in-package.txt not created" % outfolder)
+            continue
+        jobs.append((pkgentries.get(pkgname, []), os.path.join(outfolder, 'files-in-package.txt')))
+    oe.utils.multiprocess_exec(jobs, _write_file_list)
+
+def format_depends_dot(deplines):
+    """
+    Produce a dot dependency graph from "pkg|dep [REC]" / "pkg|dep >= ver"
+    lines as written by oe.utils.format_pkg_list(..., "deps")
+    """
+    edges = set()
+    for line in deplines:
+        # Remove lines with rpmlib(...) and config(...) dependencies
+        if not line or 'rpmlib(' in line or 'config(' in line:
+            continue
+        # Quote each name to handle characters that cause issues for dot,
+        # change the delimiter from pipe to "->", set the style for
+        # recommend lines and turn versioned dependencies into edge labels
+        line = re.sub(r'([^| ]+)', r'"\1"', line)
+        line = line.replace('|', ' -> ', 1)
+        line = line.replace('"[REC]"', '[style=dotted]')
+        line = re.sub(r'"([<>=]+)" "([^"]*)"', r'[label="\1 \2"]', line, count=1)
+        edges.add(line + '\n')
+    return 'digraph depends {\n    node [shape=plaintext]\n%s}\n' % ''.join(sorted(edges))
+
+def format_package_sizes(pkgs, pkgdata_dir):
+    """
+    Produce the installed-package-sizes.txt content (sizes in KiB,
+    largest first) for the given installed package names
+    """
+    sizes = []
+    for pkg in pkgs:
+        revlink = os.path.join(pkgdata_dir, 'runtime-reverse', pkg)
+        if not os.path.exists(revlink):
+            continue
+        mappedpkg = os.path.basename(os.readlink(revlink))
+        value = ''
+        with open(revlink, 'r') as f:
+            for line in f:
+                if line.startswith('PKGSIZE:') or line.startswith('PKGSIZE_%s:' % mappedpkg):
+                    value = line.split(': ', 1)[1].rstrip()
+        if not value:
+            continue
+        # PKGSIZE is in bytes, but we want it in KiB
+        sizes.append(((int(value) + 1024 // 2) // 1024, pkg))
+    sizes.sort(reverse=True)
+    return ''.join('%d\tKiB\t%s\n' % (size, pkg) for size, pkg in sizes)
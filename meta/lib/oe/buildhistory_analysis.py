@@ -39,6 +39,8 @@ related_fields['FILELIST'] = ['FILES']
 related_fields['PKGSIZE'] = ['FILELIST']
 related_fields['files-in-image.txt'] = ['installed-package-names.txt', 'USER_CLASSES', 'IMAGE_CLASSES', 'ROOTFS_POSTPROCESS_COMMAND', 'IMAGE_POSTPROCESS_COMMAND']
 related_fields['installed-package-names.txt'] = ['IMAGE_FEATURES', 'IMAGE_LINGUAS', 'IMAGE_INSTALL', 'BAD_RECOMMENDATIONS', 'NO_RECOMMENDATIONS', 'PACKAGE_EXCLUDE']
+# Minimum number of package info files to compare before using a process pool
+pool_threshold = 200
 
 
 class ChangeRecord:
@@ -54,6 +56,18 @@ class ChangeRecord:
     def __str__(self):
         return self._str_internal(True)
 
+    def as_dict(self, outer=True):
+        chgdict = {'path': self.path,
+                   'fieldname': self.fieldname,
+                   'oldvalue': self.oldvalue,
+                   'newvalue': self.newvalue,
+                   'monitored': bool(self.monitored)}
+        if self.filechanges:
+            chgdict['filechanges'] = [fchg.as_dict() for fchg in self.filechanges]
+        if outer:
+            chgdict['related'] = [chg.as_dict(False) for chg in self.related]
+        return chgdict
+
     def _str_internal(self, outer):
         if outer:
             if '/image-files/' in self.path:
@@ -222,6 +236,12 @@ class FileChange:
         else:
             return '%s changed (unknown)' % self.path
 
+    def as_dict(self):
+        return {'path': self.path,
+                'changetype': self.changetype,
+                'oldvalue': self.oldvalue,
+                'newvalue': self.newvalue}
+
 
 def blob_to_dict(blob):
     alines = [line for line in blob.data_stream.read().decode('utf-8').splitlines()]
@@ -511,6 +531,58 @@ def compare_siglists(a_blob, b_blob, taskdiff=False):
     return '\n'.join(out)
 
 
+_worker_repo = None
+
+def _init_compare_worker(repopath):
+    global _worker_repo
+    _worker_repo = git.Repo(repopath)
+
+def _compare_dict_blobs_worker(args):
+    path, asha, bsha, report_all, report_ver = args
+    ablob = git.Blob(_worker_repo, asha)
+    bblob = git.Blob(_worker_repo, bsha)
+    return compare_dict_blobs(path, ablob, bblob, report_all, report_ver)
+
+def compare_pkg_dict_blobs(repopath, items, report_all, report_ver):
+    """
+    Run compare_dict_blobs() on a list of (path, ablob, bblob) items,
+    using a pool of processes (each with their own repository object)
+    if there are enough of them to make it worthwhile. Returns a list
+    of change lists in the same order as items.
+    """
+    if len(items) < pool_threshold:
+        return [compare_dict_blobs(path, ablob, bblob, report_all, report_ver) for path, ablob, bblob in items]
+
+    import multiprocessing
+    args = [(path, ablob.binsha, bblob.binsha, report_all, report_ver) for path, ablob, bblob in items]
+    with multiprocessing.Pool(initializer=_init_compare_worker, initargs=(repopath,)) as pool:
+        return pool.map(_compare_dict_blobs_worker, args, chunksize=32)
+
+def link_related_changes(changes):
+    """
+    Record related changes (as per related_fields, and version changes
+    of the same package) against each monitored change
+    """
+    # Index changes by (path, fieldname) so that we only need to look
+    # up the fields that may be related rather than comparing every pair
+    index = collections.defaultdict(list)
+    for i, chg in enumerate(changes):
+        index[(chg.path, chg.fieldname)].append((i, chg))
+
+    for chg in changes:
+        if chg.monitored:
+            related = []
+            # (Check dirname in the case of fields from recipe info files)
+            for path in set([chg.path, os.path.dirname(chg.path)]):
+                for fieldname in related_fields.get(chg.fieldname, []):
+                    related.extend(index.get((path, fieldname), []))
+            if chg.path.startswith('packages/'):
+                for fieldname in ['PE', 'PV', 'PR']:
+                    if fieldname not in related_fields.get(chg.fieldname, []):
+                        related.extend(index.get((chg.path, fieldname), []))
+            # Keep the order in which the changes were found
+            chg.related.extend(chg2 for _, chg2 in sorted(related, key=lambda item: item[0]))
+
 def process_changes(repopath, revision1, revision2='HEAD', report_all=False, report_ver=False,
                     sigs=False, sigsdiff=False, exclude_path=None):
     repo = git.Repo(repopath)
@@ -526,12 +598,17 @@ def process_changes(repopath, revision1, revision2='HEAD', report_all=False, rep
                 changes.append(compare_siglists(d.a_blob, d.b_blob, taskdiff=sigsdiff))
         return changes
 
+    # Package info files are independent of each other, so compare them
+    # all at once (possibly in parallel) and slot the results back in
+    # afterwards in order to keep the output order stable
+    pkgitems = []
     for d in diff.iter_change_type('M'):
         path = os.path.dirname(d.a_blob.path)
         if path.startswith('packages/'):
             filename = os.path.basename(d.a_blob.path)
             if filename == 'latest':
-                changes.extend(compare_dict_blobs(path, d.a_blob, d.b_blob, report_all, report_ver))
+                changes.append(len(pkgitems))
+                pkgitems.append((path, d.a_blob, d.b_blob))
             elif filename.startswith('latest.'):
                 chg = ChangeRecord(path, filename, d.a_blob.data_stream.read().decode('utf-8'), d.b_blob.data_stream.read().decode('utf-8'), True)
                 changes.append(chg)
@@ -563,10 +640,19 @@ def process_changes(repopath, revision1, revision2='HEAD', report_all=False, rep
                 chg = ChangeRecord(path, filename, d.a_blob.data_stream.read().decode('utf-8'), d.b_blob.data_stream.read().decode('utf-8'), True)
                 changes.append(chg)
 
+    pkgchanges = compare_pkg_dict_blobs(repopath, pkgitems, report_all, report_ver)
+    allchanges = []
+    for chg in changes:
+        if isinstance(chg, int):
+            allchanges.extend(pkgchanges[chg])
+        else:
+            allchanges.append(chg)
+    changes = allchanges
+
     # Look for added preinst/postinst/prerm/postrm
     # (without reporting newly added recipes)
     addedpkgs = []
-    addedchanges = []
+    addedscripts = []
     for d in diff.iter_change_type('A'):
         path = os.path.dirname(d.b_blob.path)
         if path.startswith('packages/'):
@@ -574,15 +660,11 @@ def process_changes(repopath, revision1, revision2='HEAD', report_all=False, rep
             if filename == 'latest':
                 addedpkgs.append(path)
             elif filename.startswith('latest.'):
-                chg = ChangeRecord(path, filename[7:], '', d.b_blob.data_stream.read().decode('utf-8'), True)
-                addedchanges.append(chg)
-    for chg in addedchanges:
-        found = False
-        for pkg in addedpkgs:
-            if chg.path.startswith(pkg):
-                found = True
-                break
-        if not found:
+                addedscripts.append((path, filename, d.b_blob))
+    for path, filename, blob in addedscripts:
+        # Only read the blob if we are going to report it
+        if not any(path.startswith(pkg) for pkg in addedpkgs):
+            chg = ChangeRecord(path, filename[7:], '', blob.data_stream.read().decode('utf-8'), True)
             changes.append(chg)
 
     # Look for cleared preinst/postinst/prerm/postrm
@@ -594,16 +676,7 @@ def process_changes(repopath, revision1, revision2='HEAD', report_all=False, rep
                 chg = ChangeRecord(path, filename[7:], d.a_blob.data_stream.read().decode('utf-8'), '', True)
                 changes.append(chg)
 
-    # Link related changes
-    for chg in changes:
-        if chg.monitored:
-            for chg2 in changes:
-                # (Check dirname in the case of fields from recipe info files)
-                if chg.path == chg2.path or os.path.dirname(chg.path) == chg2.path:
-                    if chg2.fieldname in related_fields.get(chg.fieldname, []):
-                        chg.related.append(chg2)
-                    elif chg.path == chg2.path and chg.path.startswith('packages/') and chg2.fieldname in ['PE', 'PV', 'PR']:
-                        chg.related.append(chg2)
+    link_related_changes(changes)
 
     # filter out unwanted paths
     if exclude_path:
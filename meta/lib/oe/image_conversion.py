@@ -0,0 +1,124 @@
+# Shell commands for the conversions applied to an image by do_image_<type>
+#
+# Copyright (C) 2017 Intel Corporation
+#
+
+class Conversion(object):
+    """
+    An image file created from its parent's file by a conversion. cmd
+    reads the parent's file and writes this one, streamcmd (if set) is an
+    equivalent filter from stdin to stdout. Unless keep is set the file
+    is only wanted as input to the children and is removed at the end.
+    """
+    def __init__(self, filename, keep, cmd=None, streamcmd=None):
+        self.filename = filename
+        self.keep = keep
+        self.cmd = cmd
+        self.streamcmd = streamcmd
+        self.children = []
+
+    def add(self, child):
+        for c in self.children:
+            if c.filename == child.filename:
+                return c
+        self.children.append(child)
+        return child
+
+    def streamed(self):
+        return [c for c in self.children if c.streamcmd]
+
+    def unstreamed(self):
+        return [c for c in self.children if not c.streamcmd]
+
+def _run_concurrently(jobs, fifos, tmpdir):
+    if len(jobs) == 1 and not fifos:
+        return ['\t' + jobs[0]]
+    cmds = []
+    if fifos:
+        cmds.append('\tfifodir=$(mktemp -d %s/image-conversion.XXXXXX)' % tmpdir)
+        cmds.append('\tmkfifo ' + ' '.join(fifos))
+    cmds.append('\tpids=""')
+    for job in jobs:
+        cmds.append('\t( %s ) & pids="$pids $!"' % job)
+    cmds.append('\tfor pid in $pids; do wait $pid; done')
+    if fifos:
+        cmds.append('\trm -rf $fifodir')
+    return cmds
+
+def conversion_commands(image, tmpdir):
+    """
+    Return the shell commands that create everything below image, a
+    Conversion whose file already exists, and then remove the files which
+    are not to be kept.
+
+    The streamed conversions of a file are chained through named pipes
+    created below tmpdir, so that the file is read once for all of them
+    and intermediate files are only written if they are kept or needed
+    as input for an unstreamed conversion. Conversions which read the
+    same file run concurrently; conversions of files which have to be
+    written first run once those exist.
+    """
+    cmds = []
+    ondisk = [image]
+    current = [(image, True)]
+    while current:
+        jobs = []
+        fifos = []
+        nextlevel = []
+
+        def newfifo():
+            fifo = '$fifodir/%d' % len(fifos)
+            fifos.append(fifo)
+            return fifo
+
+        def tee(targets, source):
+            if len(targets) == 1:
+                return targets[0]
+            if source is None:
+                source = newfifo()
+            jobs.append('tee %s < %s > %s' % (' '.join(targets[:-1]), source, targets[-1]))
+            return source
+
+        def output(node):
+            # Where the filter creating node writes to
+            targets = [streaminput(c) for c in node.streamed()]
+            if node.keep or node.unstreamed():
+                ondisk.append(node)
+                targets.append(node.filename)
+                if node.unstreamed():
+                    nextlevel.append((node, False))
+            if not targets:
+                targets.append('/dev/null')
+            return tee(targets, None)
+
+        def streaminput(node):
+            # Where the filter creating node reads from
+            fifo = newfifo()
+            jobs.append('(%s) < %s > %s' % (node.streamcmd, fifo, output(node)))
+            return fifo
+
+        for node, streams in current:
+            unstreamed = node.unstreamed()
+            streamed = node.streamed() if streams else []
+            if len(streamed) == 1 and not streamed[0].streamed():
+                # Nothing shares the input or the output of the conversion,
+                # so it can just as well work on the files
+                unstreamed += streamed
+                streamed = []
+            if len(streamed) == 1:
+                jobs.append('(%s) < %s > %s' % (streamed[0].streamcmd, node.filename, output(streamed[0])))
+            elif streamed:
+                tee([streaminput(c) for c in streamed], node.filename)
+            for child in unstreamed:
+                jobs.append(child.cmd)
+                ondisk.append(child)
+                nextlevel.append((child, True))
+
+        if jobs:
+            cmds.extend(_run_concurrently(jobs, fifos, tmpdir))
+        current = nextlevel
+
+    for node in ondisk:
+        if not node.keep:
+            cmds.append('\trm ' + node.filename)
+    return cmds
@@ -2,6 +2,9 @@
 """Code for parsing OpenEmbedded license strings"""
 
 import ast
+import functools
+import hashlib
+import os
 import re
 from fnmatch import fnmatchcase as fnmatch
 
@@ -68,38 +71,92 @@ class LicenseVisitor(ast.NodeVisitor):
     def visit_string(self, licensestr):
         self.visit_elements(self.get_elements(licensestr))
 
-class FlattenVisitor(LicenseVisitor):
-    """Flatten a license tree (parsed from a string) by selecting one of each
-    set of OR options, in the way the user specifies"""
-    def __init__(self, choose_licenses):
-        self.choose_licenses = choose_licenses
-        self.licenses = []
-        LicenseVisitor.__init__(self)
-
-    def visit_Str(self, node):
-        self.licenses.append(node.s)
-
-    def visit_BinOp(self, node):
-        if isinstance(node.op, ast.BitOr):
-            left = FlattenVisitor(self.choose_licenses)
-            left.visit(node.left)
-
-            right = FlattenVisitor(self.choose_licenses)
-            right.visit(node.right)
+# Size of the caches of compiled license strings and is_included() results
+license_cache_size = 8192
+
+@functools.lru_cache(maxsize=license_cache_size)
+def compile_license(licensestr):
+    """Compile a license string into an expression tree (or None for an
+    empty string). Leaves are license names, other nodes are tuples:
+    ('&', left, right), ('|', left, right) and ('()', node) for a
+    parenthesised expression. As with Python's operators, & binds more
+    tightly than | and both are left-associative; two licenses (or
+    parenthesised expressions) next to each other are implicitly ANDed.
+    Results are cached, so the tree must not be modified."""
+    tokens = [x for x in license_operator.split(licensestr) if x.strip()]
+    for token in tokens:
+        if not license_pattern.match(token) and not license_operator.match(token):
+            raise InvalidLicense(token)
+    if not tokens:
+        return None
+
+    pos = 0
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def parse_or():
+        nonlocal pos
+        node = parse_and()
+        while peek() == '|':
+            pos += 1
+            node = ('|', node, parse_and())
+        return node
+
+    def parse_and():
+        nonlocal pos
+        node = parse_atom()
+        while True:
+            token = peek()
+            if token == '&':
+                pos += 1
+            elif token is None or token in '|)':
+                return node
+            node = ('&', node, parse_atom())
+
+    def parse_atom():
+        nonlocal pos
+        token = peek()
+        if token is None:
+            raise SyntaxError('unexpected end of license string')
+        pos += 1
+        if token == '(':
+            node = parse_or()
+            if peek() != ')':
+                raise SyntaxError("missing ')'")
+            pos += 1
+            return ('()', node)
+        elif token in license_operator_chars:
+            raise SyntaxError("unexpected '%s'" % token)
+        return token
+
+    tree = parse_or()
+    if pos != len(tokens):
+        raise SyntaxError("unexpected '%s'" % tokens[pos])
+    return tree
+
+def _compile(licensestr):
+    try:
+        return compile_license(licensestr)
+    except SyntaxError as exc:
+        raise LicenseSyntaxError(licensestr, exc)
 
-            selected = self.choose_licenses(left.licenses, right.licenses)
-            self.licenses.extend(selected)
-        else:
-            self.generic_visit(node)
+def _flatten(node, choose_licenses):
+    if isinstance(node, str):
+        return [node]
+    elif node[0] == '|':
+        return list(choose_licenses(_flatten(node[1], choose_licenses),
+                                    _flatten(node[2], choose_licenses)))
+    elif node[0] == '&':
+        return _flatten(node[1], choose_licenses) + _flatten(node[2], choose_licenses)
+    else:
+        return _flatten(node[1], choose_licenses)
 
 def flattened_licenses(licensestr, choose_licenses):
     """Given a license string and choose_licenses function, return a flat list of licenses"""
-    flatten = FlattenVisitor(choose_licenses)
-    try:
-        flatten.visit_string(licensestr)
-    except SyntaxError as exc:
-        raise LicenseSyntaxError(licensestr, exc)
-    return flatten.licenses
+    tree = _compile(licensestr)
+    if tree is None:
+        return []
+    return _flatten(tree, choose_licenses)
 
 def is_included(licensestr, whitelist=None, blacklist=None):
     """Given a license string and whitelist and blacklist, determine if the
@@ -108,7 +165,11 @@ def is_included(licensestr, whitelist=None, blacklist=None):
     Returns a tuple holding the boolean state and a list of the applicable
     licenses which were excluded (or None, if the state is True)
     """
+    state, licenses = _is_included(licensestr, tuple(whitelist or ['*']), tuple(blacklist or []))
+    return state, list(licenses)
 
+@functools.lru_cache(maxsize=license_cache_size)
+def _is_included(licensestr, whitelist, blacklist):
     def include_license(license):
         return any(fnmatch(license, pattern) for pattern in whitelist)
 
@@ -125,111 +186,122 @@ def is_included(licensestr, whitelist=None, blacklist=None):
         else:
             return beta
 
-    if not whitelist:
-        whitelist = ['*']
-
-    if not blacklist:
-        blacklist = []
-
     licenses = flattened_licenses(licensestr, choose_licenses)
     excluded = [lic for lic in licenses if exclude_license(lic)]
     included = [lic for lic in licenses if include_license(lic)]
     if excluded:
-        return False, excluded
+        return False, tuple(excluded)
     else:
-        return True, included
-
-class ManifestVisitor(LicenseVisitor):
-    """Walk license tree (parsed from a string) removing the incompatible
-    licenses specified"""
-    def __init__(self, dont_want_licenses, canonical_license, d):
-        self._dont_want_licenses = dont_want_licenses
-        self._canonical_license = canonical_license
-        self._d = d
-        self._operators = []
-
-        self.licenses = []
-        self.licensestr = ''
-
-        LicenseVisitor.__init__(self)
-
-    def visit(self, node):
-        if isinstance(node, ast.Str):
-            lic = node.s
-
-            if license_ok(self._canonical_license(self._d, lic),
-                    self._dont_want_licenses) == True:
-                if self._operators:
-                    ops = []
-                    for op in self._operators:
-                        if op == '[':
-                            ops.append(op)
-                        elif op == ']':
-                            ops.append(op)
-                        else:
-                            if not ops:
-                                ops.append(op)
-                            elif ops[-1] in ['[', ']']:
-                                ops.append(op)
-                            else:
-                                ops[-1] = op 
-
-                    for op in ops:
-                        if op == '[' or op == ']':
-                            self.licensestr += op
-                        elif self.licenses:
-                            self.licensestr += ' ' + op + ' '
-
-                    self._operators = []
-
-                self.licensestr += lic
-                self.licenses.append(lic)
-        elif isinstance(node, ast.BitAnd):
-            self._operators.append("&")
-        elif isinstance(node, ast.BitOr):
-            self._operators.append("|")
-        elif isinstance(node, ast.List):
-            self._operators.append("[")
-        elif isinstance(node, ast.Load):
-            self.licensestr += "]"
-
-        self.generic_visit(node)
+        return True, tuple(included)
 
 def manifest_licenses(licensestr, dont_want_licenses, canonical_license, d):
     """Given a license string and dont_want_licenses list,
        return license string filtered and a list of licenses"""
-    manifest = ManifestVisitor(dont_want_licenses, canonical_license, d)
-
-    try:
-        elements = manifest.get_elements(licensestr)
-
-        # Replace '()' to '[]' for handle in ast as List and Load types.
-        elements = ['[' if e == '(' else e for e in elements]
-        elements = [']' if e == ')' else e for e in elements]
-
-        manifest.visit_elements(elements)
-    except SyntaxError as exc:
-        raise LicenseSyntaxError(licensestr, exc)
-
-    # Replace '[]' to '()' for output correct license.
-    manifest.licensestr = manifest.licensestr.replace('[', '(').replace(']', ')')
-
-    return (manifest.licensestr, manifest.licenses)
-
-class ListVisitor(LicenseVisitor):
-    """Record all different licenses found in the license string"""
-    def __init__(self):
-        self.licenses = set()
+    licenses = []
+    out = []
+    operators = []
+
+    def visit(node):
+        if isinstance(node, str):
+            if license_ok(canonical_license(d, node), dont_want_licenses):
+                # Keep brackets, but collapse operators left over from
+                # removed licenses into the last one
+                ops = []
+                for op in operators:
+                    if op in '()' or not ops or ops[-1] in '()':
+                        ops.append(op)
+                    else:
+                        ops[-1] = op
+                for op in ops:
+                    if op in '()':
+                        out.append(op)
+                    elif licenses:
+                        out.append(' %s ' % op)
+                del operators[:]
+
+                out.append(node)
+                licenses.append(node)
+        elif node[0] == '()':
+            operators.append('(')
+            visit(node[1])
+            out.append(')')
+        else:
+            visit(node[1])
+            operators.append(node[0])
+            visit(node[2])
 
-    def visit_Str(self, node):
-        self.licenses.add(node.s)
+    tree = _compile(licensestr)
+    if tree is not None:
+        visit(tree)
+    return (''.join(out), licenses)
 
 def list_licenses(licensestr):
     """Simply get a list of all licenses mentioned in a license string.
        Binary operators are not applied or taken into account in any way"""
-    visitor = ListVisitor()
-    try:
-        visitor.visit_string(licensestr)
-    except SyntaxError as exc:
-        raise LicenseSyntaxError(licensestr, exc)
-    return visitor.licenses
+    licenses = set()
+    pending = [_compile(licensestr)]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, str):
+            licenses.add(node)
+        elif node is not None:
+            pending.extend(node[1:])
+    return licenses
+
+# Checksums of license files (or line ranges thereof) computed so far in
+# this process, so that e.g. the license QA checks don't need to read the
+# files again after do_populate_lic has copied them
+_license_file_checksums = {}
+
+def _license_file_key(path, beginline, endline):
+    st = os.stat(path)
+    return (os.path.realpath(path), int(beginline or 0), int(endline or 0),
+            st.st_mtime_ns, st.st_size)
+
+def _license_file_data(f, beginline, endline):
+    """Yield the data of lines beginline to endline (counting from 1,
+    inclusive) of the binary file object f, or all of it if neither is set"""
+    beginline = int(beginline or 0)
+    endline = int(endline or 0)
+    if not beginline and not endline:
+        yield from iter(lambda: f.read(65536), b'')
+        return
+    for lineno, line in enumerate(f, 1):
+        if lineno < beginline:
+            continue
+        if endline and lineno > endline:
+            break
+        yield line
+
+def read_license_file(path, beginline=None, endline=None):
+    """Return the content of lines beginline to endline of a license file"""
+    with open(path, 'rb') as f:
+        return b''.join(_license_file_data(f, beginline, endline))
+
+def license_file_checksums(path, beginline=None, endline=None):
+    """Return the md5 and sha256 hex digests of lines beginline to endline
+    of a license file, reading it in a single pass"""
+    key = _license_file_key(path, beginline, endline)
+    if key not in _license_file_checksums:
+        md5 = hashlib.md5()
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for data in _license_file_data(f, beginline, endline):
+                md5.update(data)
+                sha256.update(data)
+        _license_file_checksums[key] = (md5.hexdigest(), sha256.hexdigest())
+    return _license_file_checksums[key]
+
+def copy_license_file(path, dst, beginline=None, endline=None):
+    """Copy lines beginline to endline of a license file to dst, reading it
+    only once. Its checksums are computed on the way and remembered for
+    license_file_checksums()."""
+    key = _license_file_key(path, beginline, endline)
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f, open(dst, 'wb') as dst_f:
+        for data in _license_file_data(f, beginline, endline):
+            md5.update(data)
+            sha256.update(data)
+            dst_f.write(data)
+    _license_file_checksums[key] = (md5.hexdigest(), sha256.hexdigest())
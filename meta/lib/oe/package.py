@@ -1,3 +1,6 @@
+import os
+import stat
+
 def runstrip(arg):
     # Function to strip a single file, called from split_and_strip_files below
     # A working 'file' (one which works on the target architecture)
@@ -150,6 +153,422 @@ def strip_execs(pn, dstdir, strip_cmd, libdir, base_libdir, qa_already_stripped=
 
 
 
+def chunk_files(files, count):
+    """
+    Distribute files over at most count chunks of about the same total
+    size (largest files first, each going to the smallest chunk so far)
+    """
+    chunks = [[] for i in range(min(count, len(files)))]
+    sizes = [0] * len(chunks)
+    for size, f in sorted(((os.path.getsize(f[0]), f) for f in files), key=lambda x: x[0], reverse=True):
+        i = sizes.index(min(sizes))
+        chunks[i].append(f)
+        sizes[i] += size
+    return chunks
+
+def splitdebuginfo_chunk(arg):
+    """
+    Split the debug information of a chunk of ELF files into separate files
+    and link the two, called through oe.utils.multiprocess_exec(). All files
+    of the chunk are processed by a single shell, so the (large) parent
+    process only needs to be forked once per chunk. If debugedit is set,
+    the debug source information gets extracted to sourcefile as well.
+    Returns an error message on failure.
+    """
+    import shlex, subprocess
+
+    (files, objcopy, debugedit, sourcefile) = arg
+
+    def command(*args):
+        cmd = ' '.join(shlex.quote(a) for a in args)
+        return '%s || { echo "command failed with exit code $?: %s"; exit 1; }\n' % (cmd, cmd.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$').replace('`', '\\`'))
+
+    script = ''
+    for (file, debugfile) in files:
+        if debugedit:
+            script += command(debugedit, '-i', '-l', sourcefile, file)
+        script += command(objcopy, '--only-keep-debug', file, debugfile)
+        # Set the debuglink to have the view of the file path on the target
+        script += command(objcopy, '--add-gnu-debuglink=%s' % debugfile, file)
+
+    # The files need to be readable and writable while being processed
+    origmodes = {}
+    for (file, debugfile) in files:
+        if not os.access(file, os.W_OK) or os.access(file, os.R_OK):
+            origmodes[file] = os.stat(file).st_mode
+            os.chmod(file, origmodes[file] | stat.S_IWRITE | stat.S_IREAD)
+    try:
+        subprocess.check_output(['sh', '-c', script], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        return e.output.decode('utf-8', errors='replace').rstrip()
+    finally:
+        for file, mode in origmodes.items():
+            os.chmod(file, mode)
+
+def read_debug_sources(sourcefile, workbasedir, prefix):
+    """
+    Read the NUL separated list of sources written by "debugedit -l" and
+    return the unique entries which belong to the recipe (containing
+    workbasedir as a word, not from a recipe sysroot and not compiler
+    internal), with prefix removed. Paths are returned as bytes.
+    """
+    import re
+
+    ignore = re.compile(br'((<internal>|<built-in>)$|/.*recipe-sysroot.*/)')
+    ours = re.compile(br'(?<!\w)' + re.escape(os.fsencode(workbasedir)) + br'(?!\w)')
+    prefix = os.fsencode(prefix)
+    with open(sourcefile, 'rb') as f:
+        sources = set(f.read().split(b'\0'))
+    sources.discard(b'')
+    return sorted(source.replace(prefix, b'') for source in sources
+                  if ours.search(source) and not ignore.search(source))
+
+def copy_debug_sources(sources, srcdir, destdir):
+    """
+    Copy the given paths below srcdir into destdir like
+    "cpio -pd0mlL --no-preserve-owner" would: symlinks get resolved, files
+    hardlinked where possible and copied with their modification time
+    otherwise. Missing sources are skipped, as are files which already
+    exist in destdir. Empty directories are removed from destdir afterwards.
+    """
+    import shutil
+
+    srcdir = os.fsencode(srcdir)
+    destdir = os.fsencode(destdir)
+    createddirs = set()
+    def mkdir(path):
+        if path not in createddirs:
+            os.makedirs(path, exist_ok=True)
+            createddirs.add(path)
+
+    for path in sources:
+        src = os.path.join(srcdir, path)
+        dest = os.path.join(destdir, path.lstrip(b'/'))
+        try:
+            st = os.stat(src)
+        except OSError:
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            mkdir(dest)
+            continue
+        if not stat.S_ISREG(st.st_mode):
+            continue
+        mkdir(os.path.dirname(dest))
+        if os.path.lexists(dest):
+            continue
+        try:
+            os.link(os.path.realpath(src), dest)
+        except OSError:
+            shutil.copy2(src, dest)
+
+    for root, dirs, files in os.walk(destdir, topdown=False):
+        if not os.listdir(root):
+            os.rmdir(root)
+
+class FileTree(object):
+    """
+    Cached view of the directory tree below rootdir, used to expand FILES
+    style patterns. Each directory is read with a single scandir() call the
+    first time it is needed, after that globbing, listings and file type
+    checks are answered from memory. Paths are relative to rootdir and
+    start with "./", like the ones files_from_filevars() works with. The
+    tree must not change while the FileTree is in use.
+    """
+    def __init__(self, rootdir):
+        self.rootdir = rootdir
+        # normalised path -> 'd' (directory), 'l' (symlink), 'f' (anything else)
+        self.types = {'.': 'd'}
+        self.listings = {}
+
+    def _normpath(self, path):
+        if path.startswith('./') and '//' not in path and '/.' not in path[1:] and path[-1] != '/':
+            return path[2:]
+        return os.path.normpath(path)
+
+    def listdir(self, path):
+        path = self._normpath(path)
+        names = self.listings.get(path)
+        if names is None:
+            names = []
+            prefix = '' if path == '.' else path + '/'
+            try:
+                with os.scandir(os.path.join(self.rootdir, path)) as it:
+                    for entry in it:
+                        names.append(entry.name)
+                        if entry.is_symlink():
+                            self.types[prefix + entry.name] = 'l'
+                        elif entry.is_dir(follow_symlinks=False):
+                            self.types[prefix + entry.name] = 'd'
+                        else:
+                            self.types[prefix + entry.name] = 'f'
+            except OSError:
+                pass
+            self.listings[path] = names
+        return names
+
+    def _type(self, path):
+        path = self._normpath(path)
+        if path not in self.types:
+            parent = os.path.dirname(path) or '.'
+            if self._type(parent) == 'd':
+                self.listdir(parent)
+                return self.types.get(path)
+            # Below a symlink, ask the filesystem
+            try:
+                mode = os.lstat(os.path.join(self.rootdir, path)).st_mode
+                if stat.S_ISLNK(mode):
+                    self.types[path] = 'l'
+                elif stat.S_ISDIR(mode):
+                    self.types[path] = 'd'
+                else:
+                    self.types[path] = 'f'
+            except OSError:
+                self.types[path] = None
+        return self.types[path]
+
+    def lexists(self, path):
+        return self._type(path) is not None
+
+    def islink(self, path):
+        return self._type(path) == 'l'
+
+    def isdir(self, path):
+        """Whether path is a directory, without following symlinks"""
+        return self._type(path) == 'd'
+
+    def glob(self, pattern):
+        """
+        Equivalent of glob.glob() for a "./" prefixed pattern. Patterns which
+        need to look behind a symlink are passed on to glob.glob().
+        """
+        import fnmatch, glob
+
+        parts = pattern.split('/')
+        if parts[0] != '.' or '' in parts[1:] or '..' in parts:
+            return self._realglob(pattern)
+        matches = ['.']
+        for part in parts[1:]:
+            magic = glob.has_magic(part)
+            found = []
+            for match in matches:
+                filetype = self._type(match)
+                if filetype == 'l':
+                    return self._realglob(pattern)
+                if filetype != 'd':
+                    continue
+                if magic:
+                    names = self.listdir(match)
+                    if part[0] != '.':
+                        names = [name for name in names if name[0] != '.']
+                    found.extend(match + '/' + name for name in fnmatch.filter(names, part))
+                elif self.lexists(match + '/' + part):
+                    found.append(match + '/' + part)
+            matches = found
+        return matches
+
+    def _realglob(self, pattern):
+        import glob
+        prefix = os.path.join(self.rootdir, '')
+        return [path[len(prefix):] for path in glob.glob(glob.escape(prefix) + pattern)]
+
+    def walk(self):
+        """
+        Yield everything below rootdir, in the order of a top-down os.walk()
+        (per directory the files first, then the directories)
+        """
+        pending = ['.']
+        while pending:
+            path = pending.pop()
+            dirs = []
+            subdirs = []
+            for name in self.listdir(path):
+                relpath = name if path == '.' else path + '/' + name
+                filetype = self.types[relpath]
+                if filetype == 'd':
+                    dirs.append(relpath)
+                    subdirs.append(relpath)
+                elif filetype == 'l' and os.path.isdir(os.path.join(self.rootdir, relpath)):
+                    dirs.append(relpath)
+                else:
+                    yield './' + relpath
+            for relpath in dirs:
+                yield './' + relpath
+            pending.extend(reversed(subdirs))
+
+def files_from_filevars(filevars, tree=None):
+    """
+    Get a list of files from file vars (e.g. FILES) by searching files under
+    the current working directory, or under the root of the given FileTree.
+    The list contains symlinks, directories and normal files. Also returns
+    the entries which had to be truncated because they are below a
+    directory symlink.
+    """
+    import glob
+
+    if tree is None:
+        tree = FileTree(os.getcwd())
+    files = []
+    for f in filevars:
+        if os.path.isabs(f):
+            f = '.' + f
+        if not f.startswith("./"):
+            f = './' + f
+        if glob.has_magic(f):
+            globbed = tree.glob(f)
+            if globbed:
+                if [ f ] != globbed:
+                    files += globbed
+                    continue
+        files.append(f)
+
+    symlink_paths = []
+    # Lowest level symlink in each directory path, if any
+    symlink_parents = {}
+    for ind, f in enumerate(files):
+        # Handle directory symlinks. Truncate path to the lowest level symlink
+        dirpath = f.rsplit('/', 1)[0]
+        if dirpath not in symlink_parents:
+            symlink_parents[dirpath] = None
+            parent = ''
+            for dirname in dirpath.split('/'):
+                parent = os.path.join(parent, dirname)
+                if dirname == '.':
+                    continue
+                if tree.islink(parent):
+                    symlink_parents[dirpath] = parent
+                    break
+        parent = symlink_parents[dirpath]
+        if parent:
+            bb.warn("FILES contains file '%s' which resides under a "
+                    "directory symlink. Please fix the recipe and use the "
+                    "real path for the file." % f[1:])
+            symlink_paths.append(f)
+            files[ind] = parent
+            f = parent
+
+        if tree.isdir(f):
+            prefix = os.path.join(f, '')
+            files += [ prefix + x for x in tree.listdir(f) ]
+
+    return files, symlink_paths
+
+class FsPermsRules(object):
+    """
+    The directory entries of the fs-perms tables (objects with the path,
+    mode, uid, gid, walk, fmode, fuid and fgid attributes of fixup_perms'
+    fs_perms_entry) compiled into a trie of path components, so that they
+    can all be applied in a single pass over a tree.
+
+    The result is the same as applying the entries in the given order one
+    after the other: an entry sets mode, uid and gid of the directory at
+    its path and, if walk is 'true', of every directory below it, and
+    fmode, fuid and fgid of everything else below it. Like os.walk(),
+    walking does not descend into symlinks to directories. A mode of None
+    and an id of -1 leave that attribute alone, symlinks are never
+    chmod'ed.
+    """
+    class Node(object):
+        __slots__ = ('rule', 'children')
+
+        def __init__(self):
+            self.rule = None
+            self.children = {}
+
+    def __init__(self, entries):
+        self.root = self.Node()
+        for index, entry in enumerate(entries):
+            node = self.root
+            for name in entry.path.split('/'):
+                if name:
+                    node = node.children.setdefault(name, self.Node())
+            node.rule = (index, entry)
+
+    @staticmethod
+    def _wanted(rules):
+        # rules is a list of (index, entry, (mode, uid, gid)), the last
+        # entry setting an attribute wins
+        mode = uid = gid = None
+        for index, entry, (m, u, g) in sorted(rules, key=lambda rule: rule[0]):
+            if m:
+                mode = (m, entry)
+            if u != -1:
+                uid = (u, entry)
+            if g != -1:
+                gid = (g, entry)
+        return mode, uid, gid
+
+    @staticmethod
+    def _dirattrs(rule):
+        index, entry = rule
+        return (index, entry, (entry.mode, entry.uid, entry.gid))
+
+    @staticmethod
+    def _fileattrs(rule):
+        index, entry = rule
+        return (index, entry, (entry.fmode, entry.fuid, entry.fgid))
+
+    def _fix(self, path, relpath, st, wanted, changed):
+        mode, uid, gid = wanted
+        responsible = []
+        if mode and not stat.S_ISLNK(st.st_mode) and stat.S_IMODE(st.st_mode) != mode[0]:
+            os.chmod(path, mode[0])
+            responsible.append(mode[1])
+        newuid = newgid = -1
+        if uid and st.st_uid != uid[0]:
+            newuid = uid[0]
+            responsible.append(uid[1])
+        if gid and st.st_gid != gid[0]:
+            newgid = gid[0]
+            responsible.append(gid[1])
+        if newuid != -1 or newgid != -1:
+            os.lchown(path, newuid, newgid)
+        for entry in responsible:
+            changed.setdefault(entry.path, set()).add(relpath)
+
+    def _visit(self, dirpath, reldir, node, walkrules, changed):
+        # dirpath is a directory, node its trie node (or None) and
+        # walkrules the walking rules which reach into it
+        dirwanted = self._wanted([self._dirattrs(rule) for rule in walkrules])
+        filewanted = self._wanted([self._fileattrs(rule) for rule in walkrules])
+        with os.scandir(dirpath) as it:
+            entries = list(it)
+        for entry in entries:
+            child = node.children.get(entry.name) if node else None
+            if not child and not walkrules:
+                continue
+            relpath = reldir + '/' + entry.name
+            isdir = entry.is_dir()
+            if not isdir:
+                self._fix(entry.path, relpath, entry.stat(follow_symlinks=False), filewanted, changed)
+                continue
+
+            childwalk = [] if entry.is_symlink() else walkrules
+            wanted = dirwanted
+            if child and child.rule:
+                wanted = self._wanted([self._dirattrs(rule) for rule in walkrules + [child.rule]])
+                if child.rule[1].walk == 'true':
+                    childwalk = childwalk + [child.rule]
+            self._fix(entry.path, relpath, entry.stat(follow_symlinks=False), wanted, changed)
+            if childwalk or (child and child.children):
+                self._visit(entry.path, relpath, child, childwalk, changed)
+
+    def apply(self, rootdir):
+        """
+        Apply the rules to the tree below rootdir, only changing modes and
+        owners which differ from the wanted ones. Return a dict mapping the
+        path of each entry which changed anything to the set of paths (as
+        absolute paths within rootdir) it changed.
+        """
+        changed = {}
+        walkrules = []
+        if self.root.rule and os.path.isdir(rootdir):
+            self._fix(rootdir, '/', os.lstat(rootdir), self._wanted([self._dirattrs(self.root.rule)]), changed)
+            if self.root.rule[1].walk == 'true':
+                walkrules = [self.root.rule]
+        if os.path.isdir(rootdir):
+            self._visit(rootdir, '', self.root, walkrules, changed)
+        return changed
+
 def file_translate(file):
     ft = file.replace("@", "@at@")
     ft = ft.replace(" ", "@space@")
@@ -159,29 +578,88 @@ def file_translate(file):
     ft = ft.replace("_", "@underscore@")
     return ft
 
+def files_hash(paths):
+    """
+    Return a hash of the contents of paths, which can be files or
+    directories (hashed recursively, in name order)
+    """
+    import hashlib
+
+    h = hashlib.sha256()
+    def add(path):
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                add(os.path.join(path, name))
+        elif os.path.exists(path):
+            h.update(os.path.basename(path).encode('utf-8', 'surrogateescape') + b'\0')
+            with open(path, 'rb') as f:
+                for data in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(data)
+    for path in paths:
+        add(path)
+    return h.hexdigest()
+
+def filedeps_cache_key(path, relpath):
+    """
+    Return the key for the rpmdeps results of the file at path, which
+    depend on where it gets installed (relpath), its mode and its content
+    (the target for symlinks)
+    """
+    import hashlib
+
+    st = os.lstat(path)
+    h = hashlib.sha256()
+    h.update(('%s\0%o\0' % (relpath, st.st_mode)).encode('utf-8', 'surrogateescape'))
+    if stat.S_ISLNK(st.st_mode):
+        h.update(os.readlink(path).encode('utf-8', 'surrogateescape'))
+    elif stat.S_ISREG(st.st_mode):
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(data)
+    return h.hexdigest()
+
+def filedeps_tools_hash(libdir, magic):
+    """
+    Return a hash identifying the rpm libraries, rpmdeps, dependency
+    generator configuration (fileattrs) and magic data in the native
+    sysroot with library directory libdir. Files that sstate relocates,
+    like the rpm macros (which contain the path of the sysroot), are left
+    out so that the hash is the same for all recipes using the same tools.
+    """
+    import glob
+
+    rpmdir = os.path.join(libdir, 'rpm')
+    return files_hash(sorted(glob.glob(os.path.join(libdir, 'librpm*.so*'))) +
+                      [os.path.join(rpmdir, 'rpmdeps'), os.path.join(rpmdir, 'fileattrs'), magic])
+
 def filedeprunner(arg):
-    import re, subprocess, shlex
+    """
+    Run rpmdeps on the files of pkg and return (pkg, provides, requires,
+    cached) with the per-file provides and requires. If cachedir is set,
+    the results for each file are looked up there first and rpmdeps only
+    gets run on the files not found, whose results are added to the cache
+    afterwards. cached is the number of files found in the cache.
+    """
+    import re, subprocess, shlex, json
 
-    (pkg, pkgfiles, rpmdeps, pkgdest, magic) = arg
-    provides = {}
-    requires = {}
+    (pkg, pkgfiles, rpmdeps, pkgdest, magic, cachedir) = arg
+    prefix = pkgdest + "/" + pkg
+    filedeps = {}
 
     r = re.compile(r'[<>=]+ +[^ ]*')
 
-    def process_deps(pipe, pkg, pkgdest, provides, requires):
+    def process_deps(pipe):
         for line in pipe:
             f = line.decode("utf-8").split(" ", 1)[0].strip()
             line = line.decode("utf-8").split(" ", 1)[1].strip()
 
             if line.startswith("Requires:"):
-                i = requires
+                i = 1
             elif line.startswith("Provides:"):
-                i = provides
+                i = 0
             else:
                 continue
 
-            file = f.replace(pkgdest + "/" + pkg, "")
-            file = file_translate(file)
             value = line.split(":", 1)[1].strip()
             value = r.sub(r'(\g<0>)', value)
 
@@ -189,53 +667,154 @@ def filedeprunner(arg):
                 continue
             if value == "python":
                 continue
-            if file not in i:
-                i[file] = []
-            i[file].append(value)
-
-        return provides, requires
-
-    env = os.environ.copy()
-    env["MAGIC"] = magic
+            filedeps.setdefault(f, ([], []))[i].append(value)
+
+    pkgfileset = set(pkgfiles)
+    keys = {}
+    uncached = []
+    for f in pkgfiles:
+        if cachedir:
+            key = filedeps_cache_key(f, f[len(prefix):])
+            try:
+                with open(os.path.join(cachedir, key[:2], key[2:]), 'r') as cachefile:
+                    filedeps[f] = json.load(cachefile)
+                continue
+            except (OSError, ValueError):
+                keys[f] = key
+        uncached.append(f)
+
+    if uncached:
+        env = os.environ.copy()
+        env["MAGIC"] = magic
+
+        try:
+            dep_popen = subprocess.Popen(shlex.split(rpmdeps) + uncached, stdout=subprocess.PIPE, env=env)
+            process_deps(dep_popen.stdout)
+            dep_popen.stdout.close()
+        except OSError as e:
+            bb.error("rpmdeps: '%s' command failed, '%s'" % (shlex.split(rpmdeps) + uncached, e))
+            raise e
+
+        # Only complete results for the files as passed in can be cached
+        if dep_popen.wait() == 0 and all(f in pkgfileset for f in filedeps):
+            for f, key in keys.items():
+                cachepath = os.path.join(cachedir, key[:2], key[2:])
+                try:
+                    os.makedirs(os.path.dirname(cachepath), exist_ok=True)
+                    with open(cachepath + '.%d' % os.getpid(), 'w') as cachefile:
+                        json.dump(filedeps.get(f, ([], [])), cachefile)
+                    os.replace(cachepath + '.%d' % os.getpid(), cachepath)
+                except OSError:
+                    # The cache is only an optimisation, and may get cleaned
+                    # up meanwhile
+                    pass
+
+    # Go through the files in the given order, so that the result does not
+    # depend on which of them were cached
+    provides = {}
+    requires = {}
+    for f in pkgfiles + [f for f in filedeps if f not in pkgfileset]:
+        if f not in filedeps:
+            continue
+        file = file_translate(f.replace(prefix, ""))
+        for i, values in zip((provides, requires), filedeps[f]):
+            if values:
+                i.setdefault(file, []).extend(values)
+
+    return (pkg, provides, requires, len(pkgfiles) - len(uncached))
+
+# Per-process cache of read_shlibs_dir(), maps each shlibs directory to
+# its mtime and the data read
+_shlibs_dir_cache = {}
+
+def _read_shlibs_list(path):
+    provides = []
+    with open(path) as f:
+        for l in f:
+            s = l.strip().split(":")
+            if len(s) >= 3:
+                provides.append(s[:3])
+    return provides
+
+def read_shlibs_dir(shlibs_dir):
+    """
+    Return a dict mapping each package with a .list file in shlibs_dir to
+    the [soname, path, version] lists read from it.
+
+    The data is kept in an index file next to the directory
+    ("<shlibs_dir>.index") along with the directory's mtime. Only if that
+    mtime changed are the .list files stat'ed again, and only those which
+    were added or replaced since are read. The .list files are expected
+    to be added and removed by sstate, not modified in place, and
+    PACKAGELOCK should be held exclusively so that does not happen
+    meanwhile.
+    """
+    import json, time
 
     try:
-        dep_popen = subprocess.Popen(shlex.split(rpmdeps) + pkgfiles, stdout=subprocess.PIPE, env=env)
-        provides, requires = process_deps(dep_popen.stdout, pkg, pkgdest, provides, requires)
-    except OSError as e:
-        bb.error("rpmdeps: '%s' command failed, '%s'" % (shlex.split(rpmdeps) + pkgfiles, e))
-        raise e
-
-    return (pkg, provides, requires)
-
+        dirmtime = os.stat(shlibs_dir).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _shlibs_dir_cache.get(shlibs_dir)
+    if cached and cached[0] == dirmtime:
+        return cached[1]
+
+    indexfile = shlibs_dir.rstrip('/') + '.index'
+    try:
+        with open(indexfile) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {'dirmtime': None, 'files': {}}
+
+    if index['dirmtime'] != dirmtime:
+        files = {}
+        with os.scandir(shlibs_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.list'):
+                    continue
+                pkg = entry.name[:-5]
+                try:
+                    st = entry.stat()
+                    stamp = [st.st_mtime_ns, st.st_size, st.st_ino]
+                    old = index['files'].get(pkg)
+                    if old and old[0] == stamp:
+                        files[pkg] = old
+                    else:
+                        files[pkg] = [stamp, _read_shlibs_list(entry.path)]
+                except OSError:
+                    # During a build unrelated shlib files may be deleted, so
+                    # handle files disappearing between the scandir and open.
+                    continue
+        # The directory could still change within the resolution of its
+        # mtime if it was modified just now, in which case the index is
+        # written but not trusted without checking the files next time
+        if time.time() - dirmtime / 1e9 < 2:
+            dirmtime = None
+        index = {'dirmtime': dirmtime, 'files': files}
+        tmpfile = '%s.%d' % (indexfile, os.getpid())
+        try:
+            with open(tmpfile, 'w') as f:
+                json.dump(index, f, separators=(',', ':'))
+            os.rename(tmpfile, indexfile)
+        except OSError:
+            pass
+
+    shlibs = dict((pkg, provides) for pkg, (stamp, provides) in index['files'].items())
+    if index['dirmtime'] is not None:
+        _shlibs_dir_cache[shlibs_dir] = (index['dirmtime'], shlibs)
+    return shlibs
 
 def read_shlib_providers(d):
-    import re
-
     shlib_provider = {}
     shlibs_dirs = d.getVar('SHLIBSDIRS').split()
-    list_re = re.compile('^(.*)\.list$')
     # Go from least to most specific since the last one found wins
     for dir in reversed(shlibs_dirs):
         bb.debug(2, "Reading shlib providers in %s" % (dir))
-        if not os.path.exists(dir):
-            continue
-        for file in os.listdir(dir):
-            m = list_re.match(file)
-            if m:
-                dep_pkg = m.group(1)
-                try:
-                    fd = open(os.path.join(dir, file))
-                except IOError:
-                    # During a build unrelated shlib files may be deleted, so
-                    # handle files disappearing between the listdirs and open.
-                    continue
-                lines = fd.readlines()
-                fd.close()
-                for l in lines:
-                    s = l.strip().split(":")
-                    if s[0] not in shlib_provider:
-                        shlib_provider[s[0]] = {}
-                    shlib_provider[s[0]][s[1]] = (dep_pkg, s[2])
+        for dep_pkg, provides in read_shlibs_dir(dir).items():
+            for soname, path, ver in provides:
+                if soname not in shlib_provider:
+                    shlib_provider[soname] = {}
+                shlib_provider[soname][path] = (dep_pkg, ver)
     return shlib_provider
 
 
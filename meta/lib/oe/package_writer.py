@@ -0,0 +1,178 @@
+# In-process writers for ipk and deb packages
+#
+# Both formats are an ar archive holding debian-binary, the control
+# tarball and the data tarball. Rather than running opkg-build or
+# dpkg-deb (which run tar, a compressor and ar in turn, going through
+# temporary files) the tarballs are compressed while they are streamed
+# straight into their ar members, the member sizes are filled in
+# afterwards.
+#
+# Copyright (C) 2017 Intel Corporation
+#
+
+import gzip
+import lzma
+import os
+import re
+import tarfile
+
+class ArWriter(object):
+    """
+    Write an ar archive with the member names, ownership and modes that
+    deterministic GNU ar and dpkg-deb use, but with a zero timestamp
+    """
+    HEADER_SIZE = 60
+
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+        self.f.write(b'!<arch>\n')
+
+    def _header(self, name, size):
+        return ('%-16s%-12d%-6d%-6d%-8s%-10d`\n' % (name, 0, 0, 0, '100644', size)).encode('ascii')
+
+    def _pad(self, size):
+        if size % 2:
+            self.f.write(b'\n')
+
+    def add(self, name, data):
+        self.f.write(self._header(name, len(data)))
+        self.f.write(data)
+        self._pad(len(data))
+
+    def stream(self, name, compression, compresslevel=None):
+        """
+        Start a member written through the returned file object, which
+        compresses with 'gz' or 'xz'. The member is complete once that
+        file object has been closed and end_stream() has been called.
+        """
+        self.start = self.f.tell()
+        self.f.write(self._header(name, 0))
+        self.name = name
+        if compression == 'gz':
+            # No file name and no timestamp in the header, like "tar -z"
+            return gzip.GzipFile(filename='', mode='wb', fileobj=self.f, mtime=0,
+                                 compresslevel=compresslevel or 6)
+        elif compression == 'xz':
+            return lzma.LZMAFile(self.f, 'wb', preset=compresslevel or 6)
+        raise ValueError('Unsupported compression %s' % compression)
+
+    def end_stream(self):
+        end = self.f.tell()
+        size = end - self.start - self.HEADER_SIZE
+        self.f.seek(self.start)
+        self.f.write(self._header(self.name, size))
+        self.f.seek(end)
+        self._pad(size)
+
+    def close(self):
+        self.f.close()
+
+def _add_tree(tar, rootdir, exclude, owner=None):
+    """
+    Add rootdir to tar as "./" followed by everything below it, sorted by
+    name within each directory like "tar --sort=name". Paths (relative,
+    starting with "./") for which exclude returns True are left out along
+    with anything below them. If owner is set, it is (uid, gid, name) for
+    all entries.
+    """
+    def add(path, arcname):
+        tarinfo = tar.gettarinfo(path, arcname)
+        if tarinfo is None:
+            # Sockets are skipped, GNU tar does the same
+            return None
+        if owner:
+            tarinfo.uid, tarinfo.gid = owner[:2]
+            tarinfo.uname = tarinfo.gname = owner[2]
+        if tarinfo.isreg():
+            with open(path, 'rb') as f:
+                tar.addfile(tarinfo, f)
+        else:
+            tar.addfile(tarinfo)
+        return tarinfo
+
+    def add_dir(reldir):
+        dirpath = os.path.join(rootdir, reldir)
+        for name in sorted(os.listdir(dirpath)):
+            relpath = reldir + '/' + name
+            if exclude(relpath):
+                continue
+            tarinfo = add(os.path.join(dirpath, name), relpath)
+            if tarinfo is not None and tarinfo.isdir():
+                add_dir(relpath)
+
+    add(rootdir, '.')
+    add_dir('.')
+
+def read_control(controlfile):
+    """
+    Return the fields of a control file as a dict, ignoring continuation
+    lines
+    """
+    fields = {}
+    with open(controlfile, 'r') as f:
+        for line in f:
+            if line[:1] not in (' ', '\t') and ':' in line:
+                key, value = line.split(':', 1)
+                fields[key] = value.strip()
+    return fields
+
+def _write_package(pkgfile, pkgdir, controlname, exclude, control_compression, data_compression):
+    ar = ArWriter(pkgfile)
+    try:
+        ar.add('debian-binary', b'2.0\n')
+        for member, rootdir, compression, owner, excludefn in [
+                ('control.tar', os.path.join(pkgdir, controlname), control_compression,
+                 (0, 0, 'root'), lambda path: False),
+                ('data.tar', pkgdir, data_compression, None, exclude)]:
+            fileobj = ar.stream('%s.%s' % (member, compression[0]), *compression)
+            with tarfile.open(fileobj=fileobj, mode='w', format=tarfile.GNU_FORMAT) as tar:
+                _add_tree(tar, rootdir, excludefn, owner)
+            fileobj.close()
+            ar.end_stream()
+        ar.close()
+    except:
+        ar.close()
+        os.unlink(pkgfile)
+        raise
+
+def write_ipk(pkgdir, outdir):
+    """
+    Build an ipk from pkgdir, which contains the control files in its
+    CONTROL subdirectory, in outdir the same way "opkg-build pkgdir outdir"
+    does and return the path to it. Like opkg-build, files with names
+    ending in "~" are not packaged.
+    """
+    fields = read_control(os.path.join(pkgdir, 'CONTROL', 'control'))
+    for field in ('Package', 'Version', 'Architecture'):
+        if not fields.get(field):
+            raise ValueError('Required field %s missing from control file in %s' % (field, pkgdir))
+    # opkg-build drops single digit epochs from the file name only
+    version = re.sub('^.:', '', fields['Version'])
+    pkgfile = os.path.join(outdir, '%s_%s_%s.ipk' % (fields['Package'], version, fields['Architecture']))
+
+    def exclude(path):
+        return path == './CONTROL' or path.endswith('~')
+
+    _write_package(pkgfile, pkgdir, 'CONTROL', exclude, ('gz',), ('gz',))
+    return pkgfile
+
+def write_deb(pkgdir, outdir):
+    """
+    Build a deb from pkgdir, which contains the control files in its
+    DEBIAN subdirectory, in outdir with the default compression of
+    "dpkg-deb -b pkgdir outdir" (gzip for the control and xz for the data
+    tarball) and return the path to it. Unlike dpkg-deb, the control
+    files are not checked.
+    """
+    fields = read_control(os.path.join(pkgdir, 'DEBIAN', 'control'))
+    for field in ('Package', 'Version', 'Architecture'):
+        if not fields.get(field):
+            raise ValueError('Required field %s missing from control file in %s' % (field, pkgdir))
+    version = re.sub('^[0-9]+:', '', fields['Version'])
+    pkgfile = os.path.join(outdir, '%s_%s_%s.deb' % (fields['Package'], version, fields['Architecture']))
+
+    def exclude(path):
+        return path == './DEBIAN'
+
+    _write_package(pkgfile, pkgdir, 'DEBIAN', exclude, ('gz', 9), ('xz',))
+    return pkgfile
@@ -24,6 +24,74 @@ def read_pkgdatafile(fn):
 
     return pkgdata
 
+def encode_pkgdata_value(value):
+    """Encode a value for a pkgdata file, the reverse of read_pkgdatafile()"""
+    return codecs.getencoder("unicode_escape")(value)[0].decode("latin1")
+
+def write_file_atomic(fn, data):
+    """
+    Write data (a string) to fn with a single write to a temporary file,
+    which is then renamed to fn
+    """
+    tmpfn = '%s.tmp%d' % (fn, os.getpid())
+    with open(tmpfn, 'w') as f:
+        f.write(data)
+    os.rename(tmpfn, fn)
+
+def emit_subpkgdata(arg):
+    """
+    Write the runtime pkgdata of one package for emit_pkgdata() in
+    package.bbclass, without access to the datastore so that it can run
+    through oe.utils.multiprocess_exec(). entries are the (name, value)
+    pairs for the file in order, FILES_INFO (with a value of None) and
+    PKGSIZE are computed here from the files of the package. Also creates
+    the runtime-rprovides links and, unless the package is empty and not
+    allowed to be, the runtime-reverse link and the .packaged marker.
+    Returns (pkg, files) with the sorted files of the package if it is
+    packaged and (pkg, None) otherwise.
+    """
+    import json
+    import oe.path
+
+    (pkg, pkgval, entries, pkgfiles, pkgdest, pkgdatadir, rprovides, allow_empty) = arg
+
+    pkgdestpkg = os.path.join(pkgdest, pkg)
+    files = {}
+    total_size = 0
+    seen = set()
+    for f in pkgfiles:
+        fstat = os.lstat(f)
+        files[os.sep + os.path.relpath(f, pkgdestpkg)] = fstat.st_size
+        if fstat.st_ino not in seen:
+            seen.add(fstat.st_ino)
+            total_size += fstat.st_size
+
+    lines = []
+    for name, value in entries:
+        if value is None:
+            value = json.dumps(files)
+        lines.append('%s: %s\n' % (name, encode_pkgdata_value(value)))
+    lines.append('PKGSIZE_%s: %d\n' % (pkg, total_size))
+    write_file_atomic(os.path.join(pkgdatadir, 'runtime', pkg), ''.join(lines))
+
+    # Symlinks needed for rprovides lookup
+    for p in rprovides:
+        linkdir = os.path.join(pkgdatadir, 'runtime-rprovides', p)
+        os.makedirs(linkdir, exist_ok=True)
+        oe.path.symlink('../../runtime/%s' % pkg, os.path.join(linkdir, pkg), True)
+
+    try:
+        empty = all(name.startswith('.') for name in os.listdir(pkgdestpkg))
+    except FileNotFoundError:
+        empty = True
+    if empty and allow_empty != '1':
+        return (pkg, None)
+
+    # Symlink needed for reverse lookups (from the final package name)
+    oe.path.symlink('../runtime/%s' % pkg, os.path.join(pkgdatadir, 'runtime-reverse', pkgval), True)
+    open(os.path.join(pkgdatadir, 'runtime', pkg + '.packaged'), 'w').close()
+    return (pkg, sorted(files))
+
 def get_subpkgedata_fn(pkg, d):
     return d.expand('${PKGDATA_DIR}/runtime/%s' % pkg)
 
@@ -93,3 +161,128 @@ def recipename(pkg, d):
     """Return the recipe name for the given binary package name."""
 
     return pkgmap(d).get(pkg)
+
+def _search_record_fields(record):
+    """
+    Return the fields devtool search matches against (each on its own) for
+    the search record of a recipe (as written by emit_pkgdata): the recipe
+    name and summary, package names, package descriptions, packaged file
+    paths and per-file runtime provides
+    """
+    fields = [record['PN'], record['SUMMARY'] or ''] + record['PACKAGES']
+    for pkg, info in sorted(record['packaged'].items()):
+        fields.append(info['PKG'])
+        fields.append(info['DESCRIPTION'])
+        fields.extend(info['files'])
+        fields.extend(info['rprovides'])
+    return tuple(fields)
+
+def _search_fields_trigrams(fields):
+    return set(field[j:j+3] for field in fields for j in range(len(field) - 2))
+
+def read_search_index(pkgdatadir, cachefile=None):
+    """
+    Return an index of the search records in pkgdatadir/search as a dict:
+      'slots': dict mapping the name of each record to its index in the
+               lists below, which have None for unused indexes
+      'mtimes': modification time of the record
+      'recipes': (PN, PV, PR, SUMMARY) tuple of the record
+      'fields': tuple of the texts to match against for the record
+      'trigrams': dict mapping each three character sequence in the fields
+                  to a bitmask of the records (by index) containing it
+    If cachefile is specified the index is stored there. When it is read
+    again only the records added, changed or removed since are (re)indexed.
+    """
+    import json
+    import pickle
+
+    searchdir = os.path.join(pkgdatadir, 'search')
+    records = {}
+    if os.path.isdir(searchdir):
+        with os.scandir(searchdir) as it:
+            for entry in it:
+                if entry.is_file():
+                    records[entry.name] = entry.stat().st_mtime_ns
+
+    index = None
+    if cachefile:
+        try:
+            with open(cachefile, 'rb') as f:
+                index = pickle.load(f)
+            if index['pkgdatadir'] != pkgdatadir or 'fields' not in index:
+                index = None
+        except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+            index = None
+    if index is None:
+        index = {'pkgdatadir': pkgdatadir, 'slots': {}, 'mtimes': [], 'recipes': [], 'fields': [], 'trigrams': {}}
+    slots = index['slots']
+    trigrams = index['trigrams']
+    changed = False
+
+    # Drop the records which were removed or changed
+    for name, i in list(slots.items()):
+        if records.get(name) == index['mtimes'][i]:
+            continue
+        mask = ~(1 << i)
+        for trigram in _search_fields_trigrams(index['fields'][i]):
+            value = trigrams[trigram] & mask
+            if value:
+                trigrams[trigram] = value
+            else:
+                del trigrams[trigram]
+        del slots[name]
+        index['mtimes'][i] = index['recipes'][i] = index['fields'][i] = None
+        changed = True
+
+    # Add the new (versions of) records, reusing the unused indexes
+    free = [i for i, mtime in enumerate(index['mtimes']) if mtime is None]
+    free.reverse()
+    for name in sorted(records):
+        if name in slots:
+            continue
+        with open(os.path.join(searchdir, name), 'r') as f:
+            record = json.load(f)
+        fields = _search_record_fields(record)
+        if free:
+            i = free.pop()
+        else:
+            i = len(index['mtimes'])
+            for key in ('mtimes', 'recipes', 'fields'):
+                index[key].append(None)
+        slots[name] = i
+        index['mtimes'][i] = records[name]
+        index['recipes'][i] = (record['PN'], record['PV'], record['PR'], record['SUMMARY'])
+        index['fields'][i] = fields
+        bit = 1 << i
+        for trigram in _search_fields_trigrams(fields):
+            trigrams[trigram] = trigrams.get(trigram, 0) | bit
+        changed = True
+
+    if cachefile and changed:
+        try:
+            with open(cachefile + '.new', 'wb') as f:
+                pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(cachefile + '.new', cachefile)
+        except OSError:
+            pass
+    return index
+
+def search_index(index, keyword):
+    """
+    Return the (PN, PV, PR, SUMMARY) tuples of the recipes in a search
+    index with a field matching the regular expression keyword. For
+    keywords without special characters only the recipes containing all
+    of the keyword's three character sequences are searched.
+    """
+    import re
+    keyword_rc = re.compile(keyword)
+    candidates = [index['slots'][name] for name in sorted(index['slots'])]
+    if len(keyword) >= 3 and not re.search(r'[][.^$*+?{}\\|()]', keyword):
+        mask = -1
+        for j in range(len(keyword) - 2):
+            mask &= index['trigrams'].get(keyword[j:j+3], 0)
+            if not mask:
+                return []
+        candidates = [i for i in candidates if mask >> i & 1]
+    return [index['recipes'][i] for i in candidates
+            if any(keyword_rc.search(field) for field in index['fields'][i])]
@@ -22,6 +22,8 @@ class Rootfs(object, metaclass=ABCMeta):
         self.deploydir = self.d.getVar('IMGDEPLOYDIR')
         self.progress_reporter = progress_reporter
         self.logcatcher = logcatcher
+        self.log_check_warn_regex = '^(warn|Warn|WARNING:)'
+        self._log_check_offset = 0
 
         self.install_order = Manifest.INSTALL_ORDER
 
@@ -41,32 +43,42 @@ class Rootfs(object, metaclass=ABCMeta):
     def _log_check(self):
         pass
 
-    def _log_check_common(self, type, match):
+    def _log_check_common(self):
         # Ignore any lines containing log_check to avoid recursion, and ignore
         # lines beginning with a + since sh -x may emit code which isn't
         # actually executed, but may contain error messages
         excludes = [ 'log_check', r'^\+' ]
         if hasattr(self, 'log_check_expected_regexes'):
             excludes.extend(self.log_check_expected_regexes)
-        excludes = [re.compile(x) for x in excludes]
-        r = re.compile(match)
+        exclude = re.compile('|'.join('(?:%s)' % x for x in excludes))
+        checks = [('warning', re.compile(self.log_check_warn_regex), []),
+                  ('error', re.compile(self.log_check_regex), [])]
+
+        # Messages already emitted through the logger end up in the logfile
+        # too; look them up in a set rather than scanning the list per line
+        caught = set()
+        if self.logcatcher:
+            caught = set(self.logcatcher.messages)
+
+        # Only scan what has been appended since the previous check and
+        # stop at the last complete line, the log may still be written to
         log_path = self.d.expand("${T}/log.do_rootfs")
-        messages = []
-        with open(log_path, 'r') as log:
-            for line in log:
-                if self.logcatcher and self.logcatcher.contains(line.rstrip()):
-                    continue
-                for ee in excludes:
-                    m = ee.search(line)
-                    if m:
-                        break
-                if m:
+        with open(log_path, 'rb') as log:
+            log.seek(self._log_check_offset)
+            for rawline in log:
+                if not rawline.endswith(b'\n'):
+                    break
+                self._log_check_offset += len(rawline)
+                line = rawline.decode('utf-8', errors='replace')
+                if line.rstrip() in caught or exclude.search(line):
                     continue
+                for _, r, messages in checks:
+                    if r.search(line):
+                        messages.append('[log_check] %s' % line)
 
-                m = r.search(line)
-                if m:
-                    messages.append('[log_check] %s' % line)
-        if messages:
+        for type, _, messages in checks:
+            if not messages:
+                continue
             if len(messages) == 1:
                 msg = '1 %s message' % type
             else:
@@ -78,12 +90,6 @@ class Rootfs(object, metaclass=ABCMeta):
             else:
                 bb.warn(msg)
 
-    def _log_check_warn(self):
-        self._log_check_common('warning', '^(warn|Warn|WARNING:)')
-
-    def _log_check_error(self):
-        self._log_check_common('error', self.log_check_regex)
-
     def _insert_feed_uris(self):
         if bb.utils.contains("IMAGE_FEATURES", "package-management",
                          True, False, self.d):
@@ -127,23 +133,42 @@ class Rootfs(object, metaclass=ABCMeta):
             bb.utils.mkdirhier(self.image_rootfs + os.path.dirname(dir))
             shutil.copytree(self.image_rootfs + '-orig' + dir, self.image_rootfs + dir, symlinks=True)
 
-        cpath = oe.cachedpath.CachedPath()
-        # Copy files located in /usr/lib/debug or /usr/src/debug
-        for dir in ["/usr/lib/debug", "/usr/src/debug"]:
-            src = self.image_rootfs + '-orig' + dir
-            if cpath.exists(src):
-                dst = self.image_rootfs + dir
-                bb.utils.mkdirhier(os.path.dirname(dst))
-                shutil.copytree(src, dst)
-
-        # Copy files with suffix '.debug' or located in '.debug' dir.
-        for root, dirs, files in cpath.walk(self.image_rootfs + '-orig'):
-            relative_dir = root[len(self.image_rootfs + '-orig'):]
-            for f in files:
-                if f.endswith('.debug') or '/.debug' in relative_dir:
-                    bb.utils.mkdirhier(self.image_rootfs + relative_dir)
-                    shutil.copy(os.path.join(root, f),
-                                self.image_rootfs + relative_dir)
+        # Hardlink files located in /usr/lib/debug or /usr/src/debug, the
+        # original rootfs was renamed so it is on the same filesystem
+        orig = self.image_rootfs + '-orig'
+        debugdirs = ["/usr/lib/debug", "/usr/src/debug"]
+        for dir in debugdirs:
+            src = orig + dir
+            if os.path.isdir(src):
+                oe.path.copyhardlinktree(src, self.image_rootfs + dir)
+
+        # Hardlink files with suffix '.debug' or located in '.debug' dir,
+        # collected in a single pass over the original rootfs so that the
+        # target directories can be created in one batch
+        skip = set(orig + dir for dir in debugdirs)
+        dbgdirs = set()
+        dbgfiles = []
+        pending = [orig]
+        while pending:
+            root = pending.pop()
+            relative_dir = root[len(orig):]
+            indebugdir = '/.debug' in relative_dir
+            with os.scandir(root) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        if not entry.is_symlink() and entry.path not in skip:
+                            pending.append(entry.path)
+                    elif indebugdir or entry.name.endswith('.debug'):
+                        dbgdirs.add(relative_dir)
+                        dbgfiles.append(relative_dir + '/' + entry.name)
+
+        for dir in sorted(dbgdirs):
+            bb.utils.mkdirhier(self.image_rootfs + dir)
+        for f in dbgfiles:
+            try:
+                os.link(orig + f, self.image_rootfs + f)
+            except OSError:
+                shutil.copy(orig + f, self.image_rootfs + f)
 
         bb.note("  Install complementary '*-dbg' packages...")
         self.pm.install_complementary('*-dbg')
@@ -512,8 +537,7 @@ class RpmRootfs(Rootfs):
         pass
 
     def _log_check(self):
-        self._log_check_warn()
-        self._log_check_error()
+        self._log_check_common()
 
     def _handle_intercept_failure(self, registered_pkgs):
         rpm_postinsts_dir = self.image_rootfs + self.d.expand('${sysconfdir}/rpm-postinsts/')
@@ -706,8 +730,7 @@ class DpkgRootfs(DpkgOpkgRootfs):
         self.pm.mark_packages("unpacked", registered_pkgs.split())
 
     def _log_check(self):
-        self._log_check_warn()
-        self._log_check_error()
+        self._log_check_common()
 
     def _cleanup(self):
         pass
@@ -977,8 +1000,7 @@ class OpkgRootfs(DpkgOpkgRootfs):
         self.pm.mark_packages("unpacked", registered_pkgs.split())
 
     def _log_check(self):
-        self._log_check_warn()
-        self._log_check_error()
+        self._log_check_common()
 
     def _cleanup(self):
         self.pm.remove_lists()
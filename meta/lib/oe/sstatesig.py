@@ -1,4 +1,5 @@
 import bb.siggen
+import os
 
 def sstate_rundepfilter(siggen, fn, recipename, task, dep, depname, dataCache):
     # Return True if we should keep the dependency, False to drop it
@@ -98,9 +99,8 @@ class SignatureGeneratorOEBasicHash(bb.siggen.SignatureGeneratorBasicHash):
         self.lockedhashfn = {}
         self.machine = data.getVar("MACHINE")
         self.mismatch_msgs = []
-        self.unlockedrecipes = (data.getVar("SIGGEN_UNLOCKED_RECIPES") or
-                                "").split()
-        self.unlockedrecipes = { k: "" for k in self.unlockedrecipes }
+        self.unlockedrecipes = set((data.getVar("SIGGEN_UNLOCKED_RECIPES") or
+                                    "").split())
         pass
 
     def tasks_resolved(self, virtmap, virtpnmap, dataCache):
@@ -146,23 +146,21 @@ class SignatureGeneratorOEBasicHash(bb.siggen.SignatureGeneratorBasicHash):
         self.lockedpnmap[fn] = recipename
         self.lockedhashfn[fn] = dataCache.hashfn[fn]
 
-        unlocked = False
-        if recipename in self.unlockedrecipes:
-            unlocked = True
-        else:
-            def recipename_from_dep(dep):
-                # The dep entry will look something like
-                # /path/path/recipename.bb.task, virtual:native:/p/foo.bb.task,
-                # ...
-                fn = dep.rsplit('.', 1)[0]
-                return dataCache.pkg_fn[fn]
-
+        unlocked = recipename in self.unlockedrecipes
+        if not unlocked and self.unlockedrecipes:
             # If any unlocked recipe is in the direct dependencies then the
-            # current recipe should be unlocked as well.
-            depnames = [ recipename_from_dep(x) for x in deps ]
-            if any(x in y for y in depnames for x in self.unlockedrecipes):
-                self.unlockedrecipes[recipename] = ''
-                unlocked = True
+            # current recipe should be unlocked as well. The hashes of the
+            # dependencies are always computed first, so this propagates
+            # the unlocking through the whole dependency graph. The dep
+            # entries look something like /path/path/recipename.bb.task,
+            # virtual:native:/p/foo.bb.task, ...
+            pkg_fn = dataCache.pkg_fn
+            unlockedrecipes = self.unlockedrecipes
+            for dep in deps:
+                if pkg_fn[dep.rsplit('.', 1)[0]] in unlockedrecipes:
+                    unlockedrecipes.add(recipename)
+                    unlocked = True
+                    break
 
         if not unlocked and recipename in self.lockedsigs:
             if task in self.lockedsigs[recipename]:
@@ -189,41 +187,39 @@ class SignatureGeneratorOEBasicHash(bb.siggen.SignatureGeneratorBasicHash):
 
     def dump_lockedsigs(self, sigfile, taskfilter=None):
         types = {}
+        typefn = {}
         for k in self.runtaskdeps:
             if taskfilter:
                 if not k in taskfilter:
                     continue
-            fn = k.rsplit(".",1)[0]
-            t = self.lockedhashfn[fn].split(" ")[1].split(":")[5]
-            t = 't-' + t.replace('_', '-')
-            if t not in types:
-                types[t] = []
-            types[t].append(k)
-
+            fn, task = k.rsplit(".", 1)
+            t = typefn.get(fn)
+            if t is None:
+                t = self.lockedhashfn[fn].split(" ")[1].split(":")[5]
+                t = typefn[fn] = 't-' + t.replace('_', '-')
+            tasks = types.setdefault(t, [])
+            if k in self.taskhash:
+                tasks.append((self.lockedpnmap[fn], k, task))
+
+        lines = []
+        l = sorted(types)
+        for t in l:
+            lines.append('SIGGEN_LOCKEDSIGS_%s = "\\\n' % t)
+            for (pn, k, task) in sorted(types[t]):
+                lines.append("    " + pn + ":" + task + ":" + self.taskhash[k] + " \\\n")
+            lines.append('    "\n')
+        lines.append('SIGGEN_LOCKEDSIGS_TYPES_%s = "%s"' % (self.machine, " ".join(l)))
         with open(sigfile, "w") as f:
-            l = sorted(types)
-            for t in l:
-                f.write('SIGGEN_LOCKEDSIGS_%s = "\\\n' % t)
-                types[t].sort()
-                sortedk = sorted(types[t], key=lambda k: self.lockedpnmap[k.rsplit(".",1)[0]])
-                for k in sortedk:
-                    fn = k.rsplit(".",1)[0]
-                    task = k.rsplit(".",1)[1]
-                    if k not in self.taskhash:
-                        continue
-                    f.write("    " + self.lockedpnmap[fn] + ":" + task + ":" + self.taskhash[k] + " \\\n")
-                f.write('    "\n')
-            f.write('SIGGEN_LOCKEDSIGS_TYPES_%s = "%s"' % (self.machine, " ".join(l)))
+            f.write("".join(lines))
 
     def dump_siglist(self, sigfile):
+        tasks = []
+        for taskitem, taskhash in self.taskhash.items():
+            (fn, task) = taskitem.rsplit(".", 1)
+            tasks.append((self.lockedpnmap[fn], task, fn, taskhash))
+        tasks.sort()
         with open(sigfile, "w") as f:
-            tasks = []
-            for taskitem in self.taskhash:
-                (fn, task) = taskitem.rsplit(".", 1)
-                pn = self.lockedpnmap[fn]
-                tasks.append((pn, task, fn, self.taskhash[taskitem]))
-            for (pn, task, fn, taskhash) in sorted(tasks):
-                f.write('%s.%s %s %s\n' % (pn, task, fn, taskhash))
+            f.write("".join('%s.%s %s %s\n' % task for task in tasks))
 
     def checkhashes(self, missed, ret, sq_fn, sq_task, sq_hash, sq_hashfn, d):
         warn_msgs = []
@@ -320,26 +316,45 @@ def find_siginfo(pn, taskname, taskhashlist, d):
 
     if not taskhashlist or (len(filedates) < 2 and not foundall):
         # That didn't work, look in sstate-cache
-        hashes = taskhashlist or ['*']
-        localdata = bb.data.createCopy(d)
-        for hashval in hashes:
-            localdata.setVar('PACKAGE_ARCH', '*')
-            localdata.setVar('TARGET_VENDOR', '*')
-            localdata.setVar('TARGET_OS', '*')
-            localdata.setVar('PN', pn)
-            localdata.setVar('PV', '*')
-            localdata.setVar('PR', '*')
-            localdata.setVar('BB_TASKHASH', hashval)
-            swspec = localdata.getVar('SSTATE_SWSPEC')
-            if taskname in ['do_fetch', 'do_unpack', 'do_patch', 'do_populate_lic', 'do_preconfigure'] and swspec:
-                localdata.setVar('SSTATE_PKGSPEC', '${SSTATE_SWSPEC}')
-            elif pn.endswith('-native') or "-cross-" in pn or "-crosssdk-" in pn:
-                localdata.setVar('SSTATE_EXTRAPATH', "${NATIVELSBSTRING}/")
-            sstatename = taskname[3:]
-            filespec = '%s_%s.*.siginfo' % (localdata.getVar('SSTATE_PKG'), sstatename)
-
-            matchedfiles = glob.glob(filespec)
-            for fullpath in matchedfiles:
+        index = load_siginfo_index(d)
+        if index is not None:
+            sstatedir = d.getVar('SSTATE_DIR')
+            indexed = index.get((pn, taskname), {})
+            hashes = taskhashlist or list(indexed.keys())
+            missing = []
+            for hashval in hashes:
+                if hashval in hashfiles:
+                    continue
+                if hashval not in indexed:
+                    missing.append(hashval)
+                    continue
+                fullpath = os.path.join(sstatedir, indexed[hashval])
+                try:
+                    # This also skips files removed since they were indexed
+                    mtime = os.stat(fullpath).st_mtime
+                except OSError:
+                    missing.append(hashval)
+                    continue
+                hashfiles[hashval] = fullpath
+                if not taskhashlist:
+                    filedates[fullpath] = mtime
+            # Files that are not in the index (e.g. written by a build not
+            # using it) can still be found the slow way
+            if not taskhashlist and not indexed:
+                missing = ['*']
+            for _, fullpath in glob_sstate_siginfo(pn, taskname, missing, d):
+                hashval = get_hashval(fullpath)
+                if hashval in hashfiles:
+                    continue
+                if not taskhashlist:
+                    try:
+                        filedates[fullpath] = os.stat(fullpath).st_mtime
+                    except OSError:
+                        continue
+                hashfiles[hashval] = fullpath
+                siginfo_index_add(d, fullpath)
+        else:
+            for hashval, fullpath in glob_sstate_siginfo(pn, taskname, taskhashlist or ['*'], d):
                 actual_hashval = get_hashval(fullpath)
                 if actual_hashval in hashfiles:
                     continue
@@ -357,6 +372,207 @@ def find_siginfo(pn, taskname, taskhashlist, d):
 
 bb.siggen.find_siginfo = find_siginfo
 
+def glob_sstate_siginfo(pn, taskname, hashes, d):
+    """
+    Search the sstate cache for the siginfo files of a task by globbing,
+    yielding (hash, path) tuples. The hashes may be wildcards.
+    """
+    import glob
+
+    localdata = bb.data.createCopy(d)
+    for hashval in hashes:
+        localdata.setVar('PACKAGE_ARCH', '*')
+        localdata.setVar('TARGET_VENDOR', '*')
+        localdata.setVar('TARGET_OS', '*')
+        localdata.setVar('PN', pn)
+        localdata.setVar('PV', '*')
+        localdata.setVar('PR', '*')
+        localdata.setVar('BB_TASKHASH', hashval)
+        swspec = localdata.getVar('SSTATE_SWSPEC')
+        if taskname in ['do_fetch', 'do_unpack', 'do_patch', 'do_populate_lic', 'do_preconfigure'] and swspec:
+            localdata.setVar('SSTATE_PKGSPEC', '${SSTATE_SWSPEC}')
+        elif pn.endswith('-native') or "-cross-" in pn or "-crosssdk-" in pn:
+            localdata.setVar('SSTATE_EXTRAPATH', "${NATIVELSBSTRING}/")
+        sstatename = taskname[3:]
+        filespec = '%s_%s.*.siginfo' % (localdata.getVar('SSTATE_PKG'), sstatename)
+
+        for fullpath in glob.glob(filespec):
+            yield hashval, fullpath
+
+def siginfo_index_entry(path):
+    """
+    Return the (pn, taskname, hash) a siginfo file in the sstate cache was
+    written for, based on its name, or None if it isn't one
+    """
+    fn = os.path.basename(path)
+    if not fn.startswith('sstate:') or not fn.endswith('.siginfo'):
+        return None
+    fields = fn.split(':')
+    if len(fields) < 3:
+        return None
+    hashval, _, rest = fields[-1].partition('_')
+    taskname = rest.split('.')[0]
+    if not hashval or not taskname:
+        return None
+    return (fields[1], 'do_' + taskname, hashval)
+
+# Loaded siginfo indexes by path: [offset read up to, number of lines read,
+# {(pn, taskname): {hash: relpath}}]
+_siginfo_indexes = {}
+
+def _read_siginfo_index(indexfile, index, offset):
+    """
+    Add the entries of indexfile from offset onwards to index, returning
+    the offset of the end of the last complete line and the number of
+    lines read
+    """
+    with open(indexfile, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    lines = data[:end].decode('utf-8', errors='replace').splitlines()
+    for line in lines:
+        fields = line.split(' ', 3)
+        if len(fields) == 4:
+            pn, taskname, hashval, relpath = fields
+            index.setdefault((pn, taskname), {})[hashval] = relpath
+    return offset + end, len(lines)
+
+def _write_siginfo_index(indexfile, lines):
+    """
+    Replace the contents of indexfile with lines, with the index lock held
+    """
+    with open(indexfile + '.new', 'w') as f:
+        f.write(''.join(lines))
+    os.rename(indexfile + '.new', indexfile)
+    _siginfo_indexes.pop(indexfile, None)
+
+def _siginfo_index_stale(sstatedir, mtime):
+    """
+    Return True if any of the directories in the sstate cache (i.e. the
+    hash prefix directories, also those below ${NATIVELSBSTRING}) has been
+    changed since mtime, which means that files have been added or removed
+    other than by the code keeping the index up to date
+    """
+    pending = [(sstatedir, 2)]
+    while pending:
+        path, depth = pending.pop()
+        try:
+            it = os.scandir(path)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if not entry.is_dir(follow_symlinks=False):
+                        continue
+                    if entry.stat(follow_symlinks=False).st_mtime > mtime:
+                        return True
+                except OSError:
+                    continue
+                if depth > 1 and len(entry.name) != 2:
+                    pending.append((entry.path, depth - 1))
+    return False
+
+def build_siginfo_index(d):
+    """
+    Create the siginfo index (SSTATE_SIGINFO_INDEX) from scratch by
+    scanning the whole sstate cache once
+    """
+    sstatedir = d.getVar('SSTATE_DIR')
+    indexfile = d.getVar('SSTATE_SIGINFO_INDEX')
+    lines = []
+    pending = [sstatedir]
+    while pending:
+        try:
+            it = os.scandir(pending.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                    continue
+                info = siginfo_index_entry(entry.name)
+                if info:
+                    lines.append('%s %s %s %s\n' % (info + (os.path.relpath(entry.path, sstatedir),)))
+
+    bb.utils.mkdirhier(os.path.dirname(indexfile))
+    lock = bb.utils.lockfile(indexfile + '.lock')
+    try:
+        _write_siginfo_index(indexfile, lines)
+    finally:
+        bb.utils.unlockfile(lock)
+
+def compact_siginfo_index(indexfile):
+    """
+    Rewrite the siginfo index without the entries which have been
+    superseded by entries appended later (e.g. for files which were
+    written more than once)
+    """
+    lock = bb.utils.lockfile(indexfile + '.lock')
+    try:
+        index = {}
+        _read_siginfo_index(indexfile, index, 0)
+        lines = []
+        for (pn, taskname), hashes in index.items():
+            for hashval, relpath in hashes.items():
+                lines.append('%s %s %s %s\n' % (pn, taskname, hashval, relpath))
+        _write_siginfo_index(indexfile, lines)
+    finally:
+        bb.utils.unlockfile(lock)
+
+def load_siginfo_index(d):
+    """
+    Return the siginfo index as a dict mapping (pn, taskname) to a dict
+    mapping task hashes to siginfo paths relative to SSTATE_DIR. Returns
+    None if the index is disabled. The index is built if it doesn't exist
+    yet, and rebuilt if files have been added to or removed from the sstate
+    cache since it was last written to, e.g. by a build not using it or by
+    sstate-cache-management.sh. Since the index is otherwise only appended
+    to, entries added after it was first loaded are read incrementally, and
+    it is compacted once most of its lines are duplicates.
+    """
+    indexfile = d.getVar('SSTATE_SIGINFO_INDEX')
+    sstatedir = d.getVar('SSTATE_DIR')
+    if not indexfile or not sstatedir:
+        return None
+    try:
+        mtime = os.stat(indexfile).st_mtime
+    except OSError:
+        mtime = None
+    if mtime is None or _siginfo_index_stale(sstatedir, mtime):
+        build_siginfo_index(d)
+    cached = _siginfo_indexes.setdefault(indexfile, [0, 0, {}])
+    if os.path.getsize(indexfile) < cached[0]:
+        # Rebuilt or compacted in the meantime
+        cached[:] = [0, 0, {}]
+    cached[0], lines = _read_siginfo_index(indexfile, cached[2], cached[0])
+    cached[1] += lines
+    if cached[1] > 1000 and cached[1] > 2 * sum(len(hashes) for hashes in cached[2].values()):
+        compact_siginfo_index(indexfile)
+        return load_siginfo_index(d)
+    return cached[2]
+
+def siginfo_index_add(d, path):
+    """
+    Record a siginfo file written to (or fetched into) the sstate cache in
+    the siginfo index, if the index is enabled and has been created
+    """
+    indexfile = d.getVar('SSTATE_SIGINFO_INDEX')
+    if not indexfile or not os.path.exists(indexfile):
+        return
+    info = siginfo_index_entry(path)
+    if not info:
+        return
+    relpath = os.path.relpath(path, d.getVar('SSTATE_DIR'))
+    lock = bb.utils.lockfile(indexfile + '.lock')
+    try:
+        with open(indexfile, 'a') as f:
+            f.write('%s %s %s %s\n' % (info + (relpath,)))
+    finally:
+        bb.utils.unlockfile(lock)
+
 
 def sstate_get_manifest_filename(task, d):
     """
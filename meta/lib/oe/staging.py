@@ -0,0 +1,403 @@
+# Installation of populate_sysroot sstate manifests into sysroots
+#
+# Copyright (C) 2017 Intel Corporation
+#
+
+import collections
+import errno
+import hashlib
+import os
+import shutil
+import string
+
+def read_manifest(manifest, stagingdir, targetdir):
+    """
+    Read a populate_sysroot sstate manifest and return an ordered dict
+    mapping the paths it lists below stagingdir to the corresponding
+    paths below targetdir, along with the list of fixmepath files it
+    contains. Directories end in "/" in both.
+    """
+    entries = collections.OrderedDict()
+    fixme = []
+    with open(manifest, "r") as f:
+        for l in f:
+            l = l.strip()
+            if l.endswith("/fixmepath"):
+                fixme.append(l)
+                continue
+            if l.endswith("/fixmepath.cmd"):
+                continue
+            dest = l.replace(stagingdir, "")
+            dest = targetdir + "/" + "/".join(dest.split("/")[3:])
+            entries[l] = dest
+    return entries, fixme
+
+def manifest_fingerprint(manifest):
+    """
+    Return a string which changes whenever sstate rewrites manifest, which
+    it does each time it installs the output of the task again. It is the
+    same for hardlinks and for copies made with bb.utils.copyfile() (which
+    keeps the mtime), so it can be compared to that of a manifest's copy
+    in a sysroot without reading either.
+    """
+    st = os.stat(manifest)
+    return "%d:%d" % (st.st_size, st.st_mtime_ns)
+
+def install_file(src, dest):
+    """
+    Hardlink (or copy, across filesystems) src to dest, or recreate it if
+    it is a symlink. A symlink that already exists with the same target is
+    accepted, anything else already at dest raises FileExistsError.
+    """
+    if os.path.islink(src):
+        linkto = os.readlink(src)
+        if os.path.lexists(dest):
+            if not os.path.islink(dest):
+                raise OSError(errno.EEXIST, "Link %s already exists as a file" % dest, dest)
+            if os.readlink(dest) == linkto:
+                return
+            raise OSError(errno.EEXIST, "Link %s already exists to a different location? (%s vs %s)" % (dest, os.readlink(dest), linkto), dest)
+        os.symlink(linkto, dest)
+    else:
+        try:
+            os.link(src, dest)
+        except OSError as err:
+            if err.errno == errno.EXDEV:
+                bb.utils.copyfile(src, dest)
+            else:
+                raise
+
+def _link_files(files):
+    # Hardlink each (src, dest) pair, a symlink as src gets hardlinked
+    # itself, which gives the same result as recreating it. Returns the
+    # pairs that need to go through install_file() instead.
+    failed = []
+    for src, dest in files:
+        try:
+            os.link(src, dest, follow_symlinks=False)
+        except OSError:
+            failed.append((src, dest))
+    return failed
+
+def install_manifest(entries, postinsts, seendirs, ignore_existing=False, threads=8, chunksize=1000):
+    """
+    Install the files and directories of a manifest read with
+    read_manifest(). The directories are created first, in sorted order
+    and skipping those in seendirs (which is updated), then the files are
+    hardlinked by up to threads threads in chunks of chunksize files.
+    Only files that cannot simply be hardlinked (because they exist
+    already or are on another filesystem) go through the slower checks of
+    install_file(), where existing files raise FileExistsError unless
+    ignore_existing is set. The postinst scripts found are appended to
+    postinsts.
+    """
+    dirs = set()
+    files = []
+    for src, dest in entries.items():
+        if src.endswith("/"):
+            dirs.add(dest.rstrip("/"))
+            continue
+        dirs.add(os.path.dirname(dest))
+        if "/usr/bin/postinst-" in src:
+            postinsts.append(dest)
+        files.append((src, dest))
+
+    for dir in sorted(dirs - seendirs):
+        os.makedirs(dir, exist_ok=True)
+    seendirs.update(dirs)
+
+    chunks = [files[i:i + chunksize] for i in range(0, len(files), chunksize)]
+    if len(chunks) > 1 and threads > 1:
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(_link_files, chunks))
+    else:
+        results = [_link_files(chunk) for chunk in chunks]
+
+    for failed in results:
+        for src, dest in failed:
+            try:
+                install_file(src, dest)
+            except FileExistsError:
+                if not ignore_existing:
+                    raise
+
+def remove_manifest(entries):
+    """
+    Remove what install_manifest() installed for entries, like
+    sstate_clean_manifest() does for the manifests written for recipe
+    sysroots: files first, then the directories which are empty then,
+    deepest first. Anything already gone is ignored.
+    """
+    dirs = []
+    for src, dest in entries.items():
+        if src.endswith("/"):
+            dirs.append(dest.rstrip("/"))
+            continue
+        try:
+            os.remove(dest)
+        except OSError:
+            pass
+    for dir in sorted(dirs, key=len, reverse=True):
+        try:
+            if os.path.islink(dir):
+                os.remove(dir)
+            elif not os.listdir(dir):
+                os.rmdir(dir)
+        except OSError:
+            pass
+
+# Shared native components
+#
+# Rather than hardlinking every file of a native dependency into each
+# recipe's native sysroot, the dependency's files can be hardlinked once
+# into a read-only tree under a shared directory (one per component and
+# taskhash) and the recipe sysroot composed from symlinks to the
+# directories of those trees, like GNU stow does: a directory only
+# provided by one component is a symlink to that component's directory,
+# directories provided by several components are real directories with
+# entries from each. Files listed in fixmepath need relocating for each
+# sysroot, so they (and the directories above them) are always real.
+
+def read_fixme_files(fixmepaths):
+    """
+    Return the set of paths (relative to the sysroot) listed in the
+    fixmepath files of a manifest
+    """
+    files = set()
+    for fixmepath in fixmepaths:
+        with open(fixmepath, "r") as f:
+            for l in f:
+                l = l.strip()
+                if "/" in l:
+                    files.add(l.split("/", 1)[1])
+    return files
+
+def _shared_tree_remove(path):
+    for root, dirs, files in os.walk(path):
+        os.chmod(root, 0o755)
+    shutil.rmtree(path)
+
+def _shared_tree_users(shareddir):
+    # The users of a shared tree are symlinks to the manifests of the
+    # sysroots it is installed in, which sstate_clean_manifest() removes
+    users = shareddir + ".users"
+    if not os.path.isdir(users):
+        return 0
+    return len([u for u in os.listdir(users) if os.path.exists(os.path.join(users, u))])
+
+def materialize_shared_component(entries, targetdir, sharedroot, name, taskmanifest, fixmefiles, threads=8):
+    """
+    Make sure the shared tree sharedroot/name exists for the files of a
+    manifest read with read_manifest() (for targetdir), except for those
+    in fixmefiles, and register taskmanifest (which has to exist for as
+    long as it is installed somewhere) as a user of it. Trees for
+    other taskhashes of the same component ("<pn>.<taskhash>" names) which
+    have no users left are removed. Returns the path of the shared tree.
+    """
+    shareddir = os.path.join(sharedroot, name)
+    component = name.rsplit(".", 1)[0]
+    os.makedirs(sharedroot, exist_ok=True)
+    lock = bb.utils.lockfile(os.path.join(sharedroot, component + ".lock"))
+    try:
+        if not os.path.isdir(shareddir):
+            tmpdir = "%s.tmp.%d" % (shareddir, os.getpid())
+            if os.path.exists(tmpdir):
+                _shared_tree_remove(tmpdir)
+            sharedentries = collections.OrderedDict()
+            for src, dest in entries.items():
+                rel = dest[len(targetdir) + 1:]
+                if rel.rstrip("/") not in fixmefiles:
+                    sharedentries[src] = os.path.join(tmpdir, rel)
+            os.mkdir(tmpdir)
+            install_manifest(sharedentries, [], set(), threads=threads)
+            # Nothing may write to the tree through the symlinks to it
+            for root, dirs, files in os.walk(tmpdir, topdown=False):
+                os.chmod(root, 0o555)
+            os.rename(tmpdir, shareddir)
+
+        users = shareddir + ".users"
+        os.makedirs(users, exist_ok=True)
+        user = os.path.join(users, hashlib.sha256(taskmanifest.encode("utf-8")).hexdigest())
+        if os.path.lexists(user):
+            os.unlink(user)
+        os.symlink(taskmanifest, user)
+
+        for other in os.listdir(sharedroot):
+            taskhash = other[len(component) + 1:]
+            if other == name or not other.startswith(component + ".") or not taskhash \
+                    or any(ch not in string.hexdigits for ch in taskhash):
+                continue
+            otherdir = os.path.join(sharedroot, other)
+            if _shared_tree_users(otherdir) == 0:
+                bb.note("Removing unused shared component %s" % otherdir)
+                _shared_tree_remove(otherdir)
+                if os.path.exists(otherdir + ".users"):
+                    shutil.rmtree(otherdir + ".users")
+    finally:
+        bb.utils.unlockfile(lock)
+    return shareddir
+
+class SharedComponentInstall(object):
+    """
+    Installation of a shared native component into a sysroot. plan()
+    works out which directories become symlinks to the shared tree and
+    which files get linked individually, without changing anything, so
+    the manifest can be written before execute() does the work.
+
+    Directories symlinked to the shared tree of another component which
+    this one also provides files in get replaced by real directories
+    ("unfolded"), the entries created for the other component in them are
+    appended to that component's manifest in depdir (named after the
+    shared tree) so that they are cleaned up along with it.
+
+    Components which cannot be shared (shareddir is None) are installed
+    the same way, but with real directories and links to the staged files
+    only, unfolding the directories of shared components as needed.
+    """
+    def __init__(self, entries, targetdir, shareddir, sharedroot, fixmefiles):
+        self.targetdir = targetdir
+        self.shareddir = shareddir
+        self.sharedroot = sharedroot
+        self.kinds = {}
+        self.sources = {}
+        self.children = {}
+        for src, dest in entries.items():
+            rel = dest[len(targetdir) + 1:]
+            if rel.endswith("/"):
+                rel = rel[:-1]
+                self.kinds[rel] = "d"
+            elif shareddir is None or rel in fixmefiles:
+                self.kinds[rel] = "r"
+            else:
+                self.kinds[rel] = "f"
+            self.sources[rel] = src
+        # Directories which need to be real since something below them is
+        self.mustbereal = set()
+        for rel, kind in list(self.kinds.items()):
+            parent = os.path.dirname(rel)
+            while parent:
+                if kind == "r":
+                    self.mustbereal.add(parent)
+                if parent not in self.kinds:
+                    self.kinds[parent] = "d"
+                parent = os.path.dirname(parent)
+        for rel in self.kinds:
+            self.children.setdefault(os.path.dirname(rel), []).append(rel)
+        self.planned = {}
+        self.ops = []
+        self.manifest = []
+        self.othermanifests = {}
+
+    def _state(self, rel):
+        # Returns ("shared", path) for symlinks into a shared tree,
+        # ("symlink", target) for other symlinks, ("dir", None),
+        # ("file", None) or (None, None) if nothing is there
+        if rel in self.planned:
+            return self.planned[rel]
+        path = os.path.join(self.targetdir, rel)
+        if os.path.islink(path):
+            target = os.readlink(path)
+            if target.startswith(self.sharedroot + "/"):
+                return ("shared", target)
+            if os.path.isdir(path):
+                return ("dir", None)
+            return ("symlink", target)
+        if os.path.isdir(path):
+            return ("dir", None)
+        if os.path.lexists(path):
+            return ("file", None)
+        return (None, None)
+
+    def _unfold(self, rel, shared):
+        name = shared[len(self.sharedroot) + 1:].split("/", 1)[0]
+        other = self.othermanifests.setdefault(name, [])
+        self.ops.append(("unfold", rel))
+        for child in sorted(os.listdir(shared)):
+            childrel = rel + "/" + child
+            childshared = shared + "/" + child
+            if os.path.islink(childshared):
+                target = os.readlink(childshared)
+                self.ops.append(("symlink", target, childrel))
+                self.planned[childrel] = ("symlink", target)
+            elif os.path.isdir(childshared):
+                self.ops.append(("symlink", childshared, childrel))
+                self.planned[childrel] = ("shared", childshared)
+            else:
+                self.ops.append(("link", childshared, childrel))
+                self.planned[childrel] = ("file", None)
+            other.append(childrel)
+        other.append(rel + "/")
+        self.planned[rel] = ("dir", None)
+
+    def _plan_dir(self, rel):
+        for child in sorted(self.children.get(rel, [])):
+            kind = self.kinds[child]
+            state, target = self._state(child)
+            if kind == "d":
+                if state is None:
+                    if child in self.mustbereal or self.shareddir is None:
+                        self.ops.append(("mkdir", child))
+                        self.planned[child] = ("dir", None)
+                    else:
+                        shared = self.shareddir + "/" + child
+                        self.ops.append(("symlink", shared, child))
+                        self.planned[child] = ("shared", shared)
+                        self.manifest.append(child)
+                        continue
+                elif state == "shared":
+                    self._unfold(child, target)
+                elif state != "dir":
+                    raise OSError(errno.EEXIST, "%s already exists and is not a directory" % child, child)
+                self.manifest.append(child + "/")
+                self._plan_dir(child)
+                continue
+
+            src = self.sources[child]
+            if os.path.islink(src):
+                linkto = os.readlink(src)
+                if state == "symlink" and target == linkto:
+                    self.manifest.append(child)
+                    continue
+                if state is not None:
+                    raise OSError(errno.EEXIST, "Link %s already exists" % child, child)
+                self.ops.append(("symlink", linkto, child))
+                self.planned[child] = ("symlink", linkto)
+            else:
+                if state is not None:
+                    raise OSError(errno.EEXIST, "File %s already exists" % child, child)
+                self.ops.append(("link", src if kind == "r" else self.shareddir + "/" + child, child))
+                self.planned[child] = ("file", None)
+            self.manifest.append(child)
+
+    def plan(self):
+        """
+        Work out the changes and return the manifest entries (relative to
+        targetdir, directories last and ending in "/")
+        """
+        self._plan_dir("")
+        files = [m for m in self.manifest if not m.endswith("/")]
+        dirs = [m for m in self.manifest if m.endswith("/")]
+        return files + sorted(dirs, key=len, reverse=True)
+
+    def execute(self, depdir, prefix):
+        """
+        Make the planned changes. The entries of other components are
+        added to their manifests in depdir, relative to prefix like the
+        manifests themselves.
+        """
+        for name, entries in self.othermanifests.items():
+            with open(os.path.join(depdir, name), "a") as f:
+                for entry in entries:
+                    f.write(os.path.join(self.targetdir, entry).replace(prefix + "/", "") + "\n")
+        for op in self.ops:
+            path = os.path.join(self.targetdir, op[-1])
+            if op[0] == "mkdir":
+                os.mkdir(path)
+            elif op[0] == "unfold":
+                os.unlink(path)
+                os.mkdir(path)
+            elif op[0] == "symlink":
+                os.symlink(op[1], path)
+            else:
+                install_file(op[1], path)
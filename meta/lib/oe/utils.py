@@ -1,3 +1,4 @@
+import os
 import subprocess
 
 def read_file(filename):
@@ -243,6 +244,69 @@ def multiprocess_exec(commands, function):
         pool.join()
         raise
 
+def multiprocess_launch(target, items, d, extraargs=None):
+    """
+    Call target(item, *extraargs) for each of items in its own forked
+    process, with at most BB_NUMBER_THREADS processes running at a time.
+    Unlike with multiprocess_exec() the target and its arguments (such as
+    the datastore) do not need to be picklable since they are inherited
+    through fork(), only the return values do. Waiting for a process to
+    finish blocks instead of polling. No more processes are started once
+    one has failed and the failures are reported with bb.fatal() after the
+    running ones have finished. Returns the non-None results.
+    """
+    import multiprocessing
+    import multiprocessing.connection
+    import traceback
+
+    max_process = int(d.getVar("BB_NUMBER_THREADS") or os.cpu_count() or 1)
+    context = multiprocessing.get_context("fork")
+
+    def run(conn, args):
+        try:
+            conn.send((target(*args), None))
+        except BaseException:
+            conn.send((None, traceback.format_exc()))
+        conn.close()
+
+    items = list(items)
+    running = {}
+    results = []
+    errors = []
+    while (items and not errors) or running:
+        while items and not errors and len(running) < max_process:
+            item = items.pop(0)
+            args = (item,) + tuple(extraargs or ())
+            reader, writer = context.Pipe(duplex=False)
+            p = context.Process(target=run, args=(writer, args))
+            p.start()
+            # Only the child may hold the write end, so that reading from
+            # the pipe sees EOF should the child die without a result
+            writer.close()
+            running[reader] = (p, item)
+
+        # The pipe becomes readable once the child has sent its result or
+        # exited, reading it here also avoids the child blocking on a
+        # full pipe (https://bugs.python.org/issue8426)
+        for reader in multiprocessing.connection.wait(list(running)):
+            p, item = running.pop(reader)
+            try:
+                result, error = reader.recv()
+            except EOFError:
+                result, error = None, None
+            reader.close()
+            p.join()
+            if error is None and p.exitcode:
+                error = "Process exited with code %s" % p.exitcode
+            if error is not None:
+                errors.append("%s: %s" % (item, error))
+            elif result is not None:
+                results.append(result)
+
+    if errors:
+        bb.fatal("Fatal errors occurred in subprocesses:\n%s" % "\n".join(errors))
+    return results
+
 def squashspaces(string):
     import re
     return re.sub("\s+", " ", string).strip()
@@ -123,6 +123,23 @@ class SdkUpdateTest(OESDKExtTestCase):
     def test_sdk_update_http(self):
         output = self._run("devtool sdk-update \"%s\"" % self.http_url)
 
+    def test_sdk_update_local(self):
+        self._run("devtool sdk-update \"file://%s\"" % self.publish_dir)
+
+        # The sstate objects of the locked signatures are installed from
+        # the published SDK, hardlinked as both are on the same filesystem
+        publish_sstate = os.path.join(self.publish_dir, 'sstate-cache')
+        with open(os.path.join(self.tc.sdk_dir, 'conf', 'locked-sigs.inc')) as f:
+            hashes = set(l.rpartition(':')[2].split()[0] for l in f if ':' in l)
+        count = 0
+        for root, _, files in os.walk(publish_sstate):
+            for fn in files:
+                if fn.endswith('.tgz') and fn.rpartition(':')[2].partition('_')[0] in hashes:
+                    installed = os.path.join(self.tc.sdk_dir, 'sstate-cache', os.path.relpath(os.path.join(root, fn), publish_sstate))
+                    self.assertTrue(os.path.exists(installed), msg="%s was not installed" % installed)
+                    count += 1
+        self.assertGreater(count, 0, msg="No sstate objects of the locked signatures found in %s" % publish_sstate)
+
     @classmethod
     def tearDownClass(self):
         self.http_service.stop()
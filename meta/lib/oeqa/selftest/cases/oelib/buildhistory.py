@@ -1,4 +1,7 @@
 import os
+import shutil
+import subprocess
+from unittest.case import TestCase
 from oeqa.selftest.case import OESelftestTestCase
 import tempfile
 from oeqa.utils.commands import get_bb_var
@@ -97,3 +100,94 @@ class TestBlobParsing(OESelftestTestCase):
             var_changes[x.fieldname] = (oldvalue, x.newvalue)
 
         self.assertEqual(defaultmap, var_changes, "Defaults not set properly")
+
+    def test_link_related_changes(self):
+        """
+        Test linking of related changes
+        """
+        from oe.buildhistory_analysis import ChangeRecord, link_related_changes
+
+        rdepends = ChangeRecord('packages/arch/foo/foo', 'RDEPENDS', 'a', 'b', True)
+        depends = ChangeRecord('packages/arch/foo', 'DEPENDS', 'a', 'b', False)
+        pr = ChangeRecord('packages/arch/foo/foo', 'PR', 'r0', 'r1', False)
+        files = ChangeRecord('packages/arch/foo/foo', 'FILES', 'a', 'b', False)
+        otherpr = ChangeRecord('packages/arch/foo/foo-dev', 'PR', 'r0', 'r1', False)
+        link_related_changes([rdepends, depends, pr, files, otherpr])
+
+        self.assertEqual([depends, pr], rdepends.related, "Related changes not linked correctly")
+        self.assertEqual([], pr.related, "Unmonitored change should not have related changes")
+
+class TestStageWritten(TestCase):
+    class Data(object):
+        def __init__(self, histdir):
+            self.values = { 'BUILDHISTORY_DIR': histdir }
+        def getVar(self, var):
+            return self.values.get(var)
+
+    def setUp(self):
+        try:
+            import bb
+        except ImportError:
+            self.skipTest("Cannot import bb")
+        self.histdir = tempfile.mkdtemp(prefix='buildhistory-written')
+        self.d = self.Data(self.histdir)
+        self.env = dict(os.environ, GIT_AUTHOR_NAME='test', GIT_AUTHOR_EMAIL='test@example.com',
+                        GIT_COMMITTER_NAME='test', GIT_COMMITTER_EMAIL='test@example.com')
+        self.git('init', '-q')
+        for path in [ 'packages/foo/latest', 'packages/foo/foo/latest', 'packages/bar/latest',
+                      'images/img/files-in-image.txt', 'unrecorded' ]:
+            self.write(path, 'old')
+        self.git('add', '-A', '.')
+        self.git('commit', '-q', '-m', 'first')
+
+    def tearDown(self):
+        shutil.rmtree(self.histdir)
+
+    def git(self, *args):
+        return subprocess.check_output(('git',) + args, cwd=self.histdir, env=self.env).decode('utf-8')
+
+    def write(self, path, content):
+        path = os.path.join(self.histdir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_stage_written(self):
+        """
+        Test that the additions, modifications and removals of the paths
+        recorded by oe.buildhistory.record_written() are staged, and
+        nothing else.
+        """
+        from oe.buildhistory import record_written, stage_written
+
+        def path(p):
+            return os.path.join(self.histdir, p)
+
+        # Modify and add below a recorded directory and remove one of its
+        # subdirectories
+        record_written(self.d, path('packages/foo'))
+        self.write('packages/foo/latest', 'new')
+        self.write('packages/foo/foo-dev/latest', 'new')
+        shutil.rmtree(path('packages/foo/foo'))
+        # Remove a whole recorded directory and a recorded file
+        record_written(self.d, path('packages/bar'))
+        shutil.rmtree(path('packages/bar'))
+        record_written(self.d, path('images/img/files-in-image.txt'))
+        os.unlink(path('images/img/files-in-image.txt'))
+        # Changes to paths which were not recorded are left alone
+        self.write('unrecorded', 'new')
+
+        self.assertTrue(stage_written(self.d))
+        self.assertFalse(os.path.exists(path('.git/buildhistory-written')))
+        self.git('commit', '-q', '-m', 'second')
+        self.assertEqual(self.git('show', '--name-status', '--format=', 'HEAD').splitlines(),
+                         [ 'D\timages/img/files-in-image.txt', 'D\tpackages/bar/latest',
+                           'A\tpackages/foo/foo-dev/latest', 'D\tpackages/foo/foo/latest',
+                           'M\tpackages/foo/latest' ])
+        self.assertEqual(self.git('status', '--porcelain'), ' M unrecorded\n')
+
+        # Without a record, or with everything invalidated, the whole tree
+        # has to be looked at
+        self.assertFalse(stage_written(self.d))
+        record_written(self.d, self.histdir)
+        self.assertFalse(stage_written(self.d))
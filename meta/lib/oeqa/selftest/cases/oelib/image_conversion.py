@@ -0,0 +1,90 @@
+from unittest.case import TestCase
+from oe.image_conversion import Conversion, conversion_commands
+import os
+import shutil
+import subprocess
+import tempfile
+
+class TestConversionCommands(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, "img"), "w") as f:
+            f.write("image\n" * 10000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def conversion(self, parent, ctype, keep, streamed=True):
+        # "up" upper-cases the input and "rev" reverses each line, "copy"
+        # can only work on files
+        filters = { "up": "tr a-z A-Z", "rev": "rev", "copy": None }
+        filename = parent.filename + "." + ctype
+        cmd = "%s < %s > %s" % (filters[ctype] or "cat", parent.filename, filename)
+        return parent.add(Conversion(filename, keep, cmd, filters[ctype] if streamed else None))
+
+    def run_commands(self, image):
+        cmds = conversion_commands(image, self.tmpdir)
+        subprocess.check_call(["sh", "-e", "-c", "\n".join(cmds)], cwd=self.tmpdir)
+        return cmds, sorted(os.listdir(self.tmpdir))
+
+    def read(self, filename):
+        with open(os.path.join(self.tmpdir, filename)) as f:
+            return f.read()
+
+    def test_single(self):
+        """A single conversion works on the files"""
+        image = Conversion("img", False)
+        self.conversion(image, "up", True)
+        cmds, files = self.run_commands(image)
+        self.assertEqual(cmds, [ "\ttr a-z A-Z < img > img.up", "\trm img" ])
+        self.assertEqual(files, [ "img.up" ])
+
+    def test_chained(self):
+        image = Conversion("img", True)
+        up = self.conversion(image, "up", False)
+        uprev = self.conversion(up, "rev", True)
+        self.conversion(uprev, "copy", True)
+        self.conversion(up, "copy", True)
+        self.conversion(image, "rev", True)
+        cmds, files = self.run_commands(image)
+        self.assertEqual(files, [ "img", "img.rev", "img.up.copy", "img.up.rev", "img.up.rev.copy" ])
+        self.assertEqual(self.read("img.rev"), "egami\n" * 10000)
+        self.assertEqual(self.read("img.up.rev"), "EGAMI\n" * 10000)
+        self.assertEqual(self.read("img.up.rev.copy"), "EGAMI\n" * 10000)
+        self.assertEqual(self.read("img.up.copy"), "IMAGE\n" * 10000)
+        # img is only read once and img.up is only written for the copy
+        self.assertEqual(len([cmd for cmd in cmds if "< img " in cmd]), 1)
+        self.assertIn("\trm img.up", cmds)
+
+    def test_streamed_only(self):
+        """Intermediate files that are only streamed are never written"""
+        image = Conversion("img", True)
+        up = self.conversion(image, "up", False)
+        self.conversion(up, "rev", True)
+        cmds, files = self.run_commands(image)
+        self.assertEqual(files, [ "img", "img.up.rev" ])
+        self.assertFalse([cmd for cmd in cmds if cmd.startswith("\trm img")])
+
+    def test_failure(self):
+        image = Conversion("img", True)
+        up = image.add(Conversion("img.up", False, "false", "false"))
+        self.conversion(up, "rev", True)
+        self.conversion(image, "rev", True)
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.run_commands(image)
+
+    def test_checksum(self):
+        """Checksums (as in image_types.bbclass) keep the exit status of the tool"""
+        for tool, fails in (("md5sum", False), ("false", True)):
+            image = Conversion("img", True)
+            up = self.conversion(image, "up", False)
+            streamcmd = 'sum=$(%s) && echo "${sum%%-}img.up.md5sum"' % tool
+            up.add(Conversion("img.up.md5sum", True, None, streamcmd))
+            self.conversion(up, "rev", True)
+            if fails:
+                with self.assertRaises(subprocess.CalledProcessError):
+                    self.run_commands(image)
+            else:
+                self.run_commands(image)
+                md5sum = subprocess.check_output("tr a-z A-Z < img | md5sum", shell=True, cwd=self.tmpdir).decode()
+                self.assertEqual(self.read("img.up.md5sum"), md5sum.replace("  -", "  img.up.md5sum"))
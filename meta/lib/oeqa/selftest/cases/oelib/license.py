@@ -1,3 +1,6 @@
+import hashlib
+import os
+import unittest.mock
 from unittest.case import TestCase
 import oe.license
 
@@ -66,3 +69,60 @@ class TestComplexCombinations(TestSimpleCombinations):
         "(GPL-2.0|Proprietary)&BSD-4-clause&MIT": ["GPL-2.0", "BSD-4-clause", "MIT"],
     }
     preferred = ["BAR", "OMEGA", "BETA", "GPL-2.0"]
+
+class TestManifestLicenses(TestCase):
+    tests = {
+        "FOO & BAR": ("FOO & BAR", ["FOO", "BAR"]),
+        "FOO & GPLv3": ("FOO", ["FOO"]),
+        "(GPLv3 | BAR) & FOO": ("(BAR) & FOO", ["BAR", "FOO"]),
+        "FOO | (BAR & BAZ)": ("FOO | (BAR & BAZ)", ["FOO", "BAR", "BAZ"]),
+    }
+
+    def test_tests(self):
+        def canonical_license(d, license):
+            return license
+
+        for license, expected in self.tests.items():
+            result = oe.license.manifest_licenses(license, ["GPLv3"], canonical_license, None)
+            self.assertEqual(result, expected)
+
+class TestListLicenses(TestCase):
+    def test_list_licenses(self):
+        self.assertEqual(oe.license.list_licenses("FOO & (BAR | BAZ) MOO"), {"FOO", "BAR", "BAZ", "MOO"})
+        self.assertEqual(oe.license.list_licenses(""), set())
+
+    def test_syntax_error(self):
+        with self.assertRaises(oe.license.LicenseSyntaxError):
+            oe.license.list_licenses("FOO & (BAR | BAZ")
+
+class TestLicenseFiles(TestCase):
+    def setUp(self):
+        import tempfile
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.licfile = os.path.join(self.tempdir.name, 'COPYING')
+        with open(self.licfile, 'wb') as f:
+            f.write(b'line 1\nline 2\nline 3\nline 4\n')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_read_license_file(self):
+        self.assertEqual(oe.license.read_license_file(self.licfile), b'line 1\nline 2\nline 3\nline 4\n')
+        self.assertEqual(oe.license.read_license_file(self.licfile, 2, 3), b'line 2\nline 3\n')
+        self.assertEqual(oe.license.read_license_file(self.licfile, '3'), b'line 3\nline 4\n')
+        self.assertEqual(oe.license.read_license_file(self.licfile, None, 1), b'line 1\n')
+
+    def test_checksums(self):
+        md5, sha256 = oe.license.license_file_checksums(self.licfile, 2, 3)
+        self.assertEqual(md5, hashlib.md5(b'line 2\nline 3\n').hexdigest())
+        self.assertEqual(sha256, hashlib.sha256(b'line 2\nline 3\n').hexdigest())
+
+    def test_copy_license_file(self):
+        dst = os.path.join(self.tempdir.name, 'copy')
+        oe.license.copy_license_file(self.licfile, dst, 2, 3)
+        with open(dst, 'rb') as f:
+            self.assertEqual(f.read(), b'line 2\nline 3\n')
+        # The checksums are known without reading the file again
+        with unittest.mock.patch('builtins.open', side_effect=AssertionError):
+            md5, sha256 = oe.license.license_file_checksums(self.licfile, 2, 3)
+        self.assertEqual(md5, hashlib.md5(b'line 2\nline 3\n').hexdigest())
@@ -0,0 +1,283 @@
+from unittest.case import TestCase
+import oe, oe.package
+import glob
+import os
+import shutil
+import stat
+import tempfile
+from unittest import mock
+
+class TestFileTree(TestCase):
+    DIRS = [ "usr", "usr/bin", "usr/lib", "usr/lib/.debug", "usr/lib/foo", "usr/share", "usr/share/doc", "etc", "empty" ]
+    FILES = [ "usr/bin/prog", "usr/bin/.hidden", "usr/lib/libfoo.so.1.0", "usr/lib/libfoo.a",
+              "usr/lib/.debug/libfoo.so.1.0", "usr/lib/foo/plugin.so", "usr/share/doc/README", "etc/foo.conf" ]
+    LINKS = [
+        ( "usr/lib/libfoo.so.1", "libfoo.so.1.0" ),
+        ( "usr/lib/libfoo.so",   "libfoo.so.1" ),
+        ( "usr/lib/dangling",    "missing" ),
+        ( "usr/lib/bar",         "foo" ),
+        ( "lib",                 "usr/lib" ),
+    ]
+
+    PATTERNS = [ "./usr/bin/*", "./usr/lib/lib*.so.*", "./usr/lib/*.so", "./usr/lib/.*", "./usr/lib/*/*.so",
+                 "./usr/*/doc", "./lib/*.a", "./usr/lib/*.[ab]", "./missing/*", "./etc/*.conf/*", "./usr/lib/" ]
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for d in self.DIRS:
+            os.mkdir(os.path.join(self.root, d))
+        for f in self.FILES:
+            with open(os.path.join(self.root, f), "w") as fd:
+                fd.write(f)
+        for l, target in self.LINKS:
+            os.symlink(target, os.path.join(self.root, l))
+        self.cwd = os.getcwd()
+        os.chdir(self.root)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.root)
+
+    def test_glob(self):
+        tree = oe.package.FileTree(self.root)
+        for pattern in self.PATTERNS:
+            self.assertEqual(sorted(tree.glob(pattern)), sorted(glob.glob(pattern)), pattern)
+
+    def test_types(self):
+        tree = oe.package.FileTree(self.root)
+        for path in self.DIRS + self.FILES + [l for l, target in self.LINKS] + [ "lib/foo/plugin.so", "missing" ]:
+            path = "./" + path
+            self.assertEqual(tree.lexists(path), os.path.lexists(path), path)
+            self.assertEqual(tree.islink(path), os.path.islink(path), path)
+            self.assertEqual(tree.isdir(path), os.path.isdir(path) and not os.path.islink(path), path)
+
+    def test_walk(self):
+        expected = []
+        for root, dirs, files in os.walk("."):
+            expected.extend(os.path.join(root, f) for f in files + dirs)
+        self.assertEqual(list(oe.package.FileTree(self.root).walk()), expected)
+
+    def test_files_from_filevars(self):
+        filevars = [ "/usr/bin/*", "usr/lib/lib*.so.*", "/usr/share/doc", "etc/foo.conf", "/usr/lib/missing*" ]
+        expected = [ "./usr/bin/prog", "./usr/lib/libfoo.so.1", "./usr/lib/libfoo.so.1.0",
+                     "./usr/share/doc", "./usr/share/doc/README", "./etc/foo.conf", "./usr/lib/missing*" ]
+        files, symlink_paths = oe.package.files_from_filevars(filevars)
+        self.assertEqual(sorted(files), sorted(expected))
+        self.assertEqual(symlink_paths, [])
+
+class TestDebugSources(TestCase):
+    SOURCES = [ "/usr/src/debug/foo/1.0-r0/src/a.c", "/usr/src/debug/foo/1.0-r0/src/link.c",
+                "/usr/src/debug/foo/1.0-r0/src/a.c", "<internal>", "/usr/src/debug/foo/1.0-r0/<built-in>",
+                "/usr/src/debug/foo/1.0-r0/recipe-sysroot/usr/include/stdio.h",
+                "/usr/src/debug/foo/1.0-r0/src/missing.h", "/usr/src/debug/foo/1.0-r0/src/sub/",
+                "/usr/src/debug/bar/2.0-r0/x.c", "/usr/src/debug/foo/1.0-r0x/y.c" ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.workparentdir = os.path.join(self.tmpdir, "work")
+        srcdir = os.path.join(self.workparentdir, "foo/1.0-r0/src")
+        os.makedirs(os.path.join(srcdir, "sub"))
+        with open(os.path.join(srcdir, "a.c"), "w") as f:
+            f.write("int main() { return 0; }\n")
+        os.symlink("a.c", os.path.join(srcdir, "link.c"))
+        self.sourcefile = os.path.join(self.tmpdir, "debugsources.list")
+        with open(self.sourcefile, "w") as f:
+            f.write("\0".join(self.SOURCES) + "\0")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_debug_sources(self):
+        sources = oe.package.read_debug_sources(self.sourcefile, "foo/1.0-r0", "/usr/src/debug/")
+        self.assertEqual(sources, [ b"foo/1.0-r0/src/a.c", b"foo/1.0-r0/src/link.c",
+                                    b"foo/1.0-r0/src/missing.h", b"foo/1.0-r0/src/sub/" ])
+
+    def test_copy_debug_sources(self):
+        destdir = os.path.join(self.tmpdir, "pkgd/usr/src/debug")
+        sources = oe.package.read_debug_sources(self.sourcefile, "foo/1.0-r0", "/usr/src/debug/")
+        oe.package.copy_debug_sources(sources, self.workparentdir, destdir)
+        a = os.path.join(destdir, "foo/1.0-r0/src/a.c")
+        link = os.path.join(destdir, "foo/1.0-r0/src/link.c")
+        self.assertFalse(os.path.islink(link))
+        self.assertTrue(os.path.samefile(a, os.path.join(self.workparentdir, "foo/1.0-r0/src/a.c")))
+        self.assertTrue(os.path.samefile(a, link))
+        self.assertFalse(os.path.exists(os.path.join(destdir, "foo/1.0-r0/src/missing.h")))
+        # The empty directory gets removed again
+        self.assertFalse(os.path.exists(os.path.join(destdir, "foo/1.0-r0/src/sub")))
+
+class TestFiledepsCache(TestCase):
+    # Provides the file name and requires /bin/sh for files starting with
+    # "#!", like rpmdeps would. Also logs which files it was run on.
+    RPMDEPS = """#!/bin/sh
+for f in "$@"; do
+    echo "$f" >> %s
+    echo "$f Provides: $(basename $f)"
+    if head -n 1 $f | grep -q '^#!'; then
+        echo "$f Requires: /bin/sh"
+        echo "$f Requires: rpmlib(PayloadFilesHavePrefix) <= 4.0-1"
+    fi
+done
+"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pkgdest = os.path.join(self.tmpdir, "packages-split")
+        self.cachedir = os.path.join(self.tmpdir, "cache")
+        self.log = os.path.join(self.tmpdir, "rpmdeps.log")
+        self.rpmdeps = os.path.join(self.tmpdir, "rpmdeps")
+        with open(self.rpmdeps, "w") as f:
+            f.write(self.RPMDEPS % self.log)
+        os.chmod(self.rpmdeps, 0o755)
+        self.files = []
+        for name, content in [ ("script", "#!/bin/sh\n"), ("data_1", "data\n"), ("other", "other\n") ]:
+            path = os.path.join(self.pkgdest, "foo/usr/bin", name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def filedeps(self, cachedir):
+        if os.path.exists(self.log):
+            os.unlink(self.log)
+        result = oe.package.filedeprunner(("foo", self.files, self.rpmdeps, self.pkgdest, "", cachedir))
+        rpmdeps_files = []
+        if os.path.exists(self.log):
+            with open(self.log) as f:
+                rpmdeps_files = f.read().split()
+        return result, rpmdeps_files
+
+    def test_filedeps(self):
+        uncached, rpmdeps_files = self.filedeps(None)
+        self.assertEqual(rpmdeps_files, self.files)
+        self.assertEqual(uncached, ("foo", { "/usr/bin/script": [ "script" ], "/usr/bin/data@underscore@1": [ "data_1" ],
+                                             "/usr/bin/other": [ "other" ] },
+                                           { "/usr/bin/script": [ "/bin/sh" ] }, 0))
+
+        # Filling the cache, then using it
+        self.assertEqual(self.filedeps(self.cachedir), (uncached, self.files))
+        self.assertEqual(self.filedeps(self.cachedir), (uncached[:3] + (3,), []))
+
+        # Only changed files are passed to rpmdeps
+        with open(self.files[0], "w") as f:
+            f.write("#!/bin/bash\n")
+        self.assertEqual(self.filedeps(self.cachedir), (uncached[:3] + (2,), self.files[:1]))
+        os.chmod(self.files[1], 0o755)
+        self.assertEqual(self.filedeps(self.cachedir), (uncached[:3] + (2,), self.files[1:2]))
+
+    def test_tools_hash(self):
+        def sysroot(name, macros, fileattrs):
+            libdir = os.path.join(self.tmpdir, name, "usr/lib")
+            os.makedirs(os.path.join(libdir, "rpm/fileattrs"))
+            for path, content in [ ("librpm.so.8", "lib"), ("rpm/rpmdeps", "rpmdeps"), ("rpm/macros", macros),
+                                   ("rpm/fileattrs/elf.attr", fileattrs), ("magic.mgc", "magic") ]:
+                with open(os.path.join(libdir, path), "w") as f:
+                    f.write(content)
+            return oe.package.filedeps_tools_hash(libdir, os.path.join(libdir, "magic.mgc"))
+
+        # The macros contain the (relocated) path of the sysroot
+        foo = sysroot("foo", "%_prefix /work/foo/recipe-sysroot-native/usr", "elf")
+        self.assertEqual(sysroot("bar", "%_prefix /work/bar/recipe-sysroot-native/usr", "elf"), foo)
+        self.assertNotEqual(sysroot("baz", "%_prefix /work/baz/recipe-sysroot-native/usr", "elf2"), foo)
+
+class TestFsPermsRules(TestCase):
+    class Entry(object):
+        def __init__(self, path, mode, walk, fmode):
+            self.path = path
+            self.mode, self.uid, self.gid = mode, -1, -1
+            self.walk = walk
+            self.fmode, self.fuid, self.fgid = fmode, -1, -1
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for path in [ "usr/share/doc/foo", "usr/share/locale/de", "usr/bin" ]:
+            os.makedirs(os.path.join(self.root, path))
+        for path in [ "usr/share/doc/foo/README", "usr/share/locale/de/foo.mo", "usr/bin/prog" ]:
+            with open(os.path.join(self.root, path), "w") as f:
+                f.write(path)
+            os.chmod(os.path.join(self.root, path), 0o600)
+        os.symlink("../bin", os.path.join(self.root, "usr/share/doc/bin"))
+        os.chmod(os.path.join(self.root, "usr/share"), 0o700)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def mode(self, path):
+        return stat.S_IMODE(os.lstat(os.path.join(self.root, path)).st_mode)
+
+    def test_apply(self):
+        entries = [ self.Entry("/usr", 0o755, "false", None),
+                    self.Entry("/usr/share", 0o755, "true", 0o644),
+                    self.Entry("/usr/share/doc", 0o750, "true", None),
+                    self.Entry("/missing", 0o755, "true", 0o644) ]
+        changed = oe.package.FsPermsRules(entries).apply(self.root)
+        self.assertEqual(self.mode("usr/share"), 0o755)
+        self.assertEqual(self.mode("usr/share/locale/de"), 0o755)
+        self.assertEqual(self.mode("usr/share/locale/de/foo.mo"), 0o644)
+        # The later entry wins for the directories, the earlier one still
+        # sets the file mode
+        self.assertEqual(self.mode("usr/share/doc/foo"), 0o750)
+        self.assertEqual(self.mode("usr/share/doc/foo/README"), 0o644)
+        # Symlinks are not followed when walking
+        self.assertEqual(self.mode("usr/bin/prog"), 0o600)
+        self.assertEqual(changed, { "/usr/share": { "/usr/share", "/usr/share/locale/de/foo.mo",
+                                                    "/usr/share/doc/foo/README" },
+                                    "/usr/share/doc": { "/usr/share/doc", "/usr/share/doc/foo" } })
+
+        # Nothing left to change
+        self.assertEqual(oe.package.FsPermsRules(entries).apply(self.root), {})
+
+class TestShlibsIndex(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.shlibsdir = os.path.join(self.tmpdir, "shlibs2")
+        os.mkdir(self.shlibsdir)
+        self.write("libfoo", "libfoo.so.1:/usr/lib:1.0\n")
+        self.write("libbar", "libbar.so.2:/usr/lib:2.0\nlibbaz.so.0:/lib:2.0\n")
+        with open(os.path.join(self.shlibsdir, "libfoo.pclist"), "w") as f:
+            f.write("foo\n")
+        self.mtime = 1000000000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        oe.package._shlibs_dir_cache.clear()
+
+    def write(self, pkg, content):
+        with open(os.path.join(self.shlibsdir, pkg + ".list"), "w") as f:
+            f.write(content)
+
+    def read(self):
+        # Pretend the directory was modified a while ago, so that the
+        # index gets used
+        self.mtime += 1
+        os.utime(self.shlibsdir, (self.mtime, self.mtime))
+        with mock.patch("oe.package._read_shlibs_list", wraps=oe.package._read_shlibs_list) as read_list:
+            shlibs = oe.package.read_shlibs_dir(self.shlibsdir)
+        return shlibs, sorted(os.path.basename(call[0][0]) for call in read_list.call_args_list)
+
+    def test_read_shlibs_dir(self):
+        expected = { "libfoo": [ [ "libfoo.so.1", "/usr/lib", "1.0" ] ],
+                     "libbar": [ [ "libbar.so.2", "/usr/lib", "2.0" ], [ "libbaz.so.0", "/lib", "2.0" ] ] }
+        self.assertEqual(self.read(), (expected, [ "libbar.list", "libfoo.list" ]))
+        self.assertTrue(os.path.exists(self.shlibsdir + ".index"))
+
+        # Only the new file is read
+        self.write("libqux", "libqux.so.3:/usr/lib:3.0\n")
+        expected["libqux"] = [ [ "libqux.so.3", "/usr/lib", "3.0" ] ]
+        self.assertEqual(self.read(), (expected, [ "libqux.list" ]))
+
+        # The index is used without looking at the files, both from
+        # memory and from disk
+        self.assertEqual(oe.package.read_shlibs_dir(self.shlibsdir), expected)
+        oe.package._shlibs_dir_cache.clear()
+        with mock.patch("os.scandir") as scandir:
+            self.assertEqual(oe.package.read_shlibs_dir(self.shlibsdir), expected)
+            self.assertFalse(scandir.called)
+
+        os.unlink(os.path.join(self.shlibsdir, "libfoo.list"))
+        del expected["libfoo"]
+        self.assertEqual(self.read(), (expected, []))
+
+        self.assertEqual(oe.package.read_shlibs_dir(os.path.join(self.tmpdir, "missing")), {})
@@ -0,0 +1,96 @@
+from unittest.case import TestCase
+import oe.package_writer
+import gzip
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+
+class TestPackageWriter(TestCase):
+    CONTROL = "Package: foo\nVersion: 1:1.0-r0\nArchitecture: all\nMaintainer: Foo <foo@example.com>\nDescription: foo\n Long description.\n"
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, "foo")
+        os.makedirs(os.path.join(self.root, "usr/bin"))
+        os.makedirs(os.path.join(self.root, "etc"))
+        with open(os.path.join(self.root, "usr/bin/prog"), "wb") as f:
+            f.write(os.urandom(100001))
+        os.chmod(os.path.join(self.root, "usr/bin/prog"), 0o755)
+        os.link(os.path.join(self.root, "usr/bin/prog"), os.path.join(self.root, "usr/bin/prog2"))
+        os.symlink("prog", os.path.join(self.root, "usr/bin/link"))
+        with open(os.path.join(self.root, "etc/foo.conf"), "w") as f:
+            f.write("foo=1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_control(self, controlname):
+        controldir = os.path.join(self.root, controlname)
+        os.mkdir(controldir)
+        with open(os.path.join(controldir, "control"), "w") as f:
+            f.write(self.CONTROL)
+        with open(os.path.join(controldir, "postinst"), "w") as f:
+            f.write("#!/bin/sh\nexit 0\n")
+        os.chmod(os.path.join(controldir, "postinst"), 0o755)
+
+    def extract_member(self, pkgfile, member):
+        outfile = os.path.join(self.tmpdir, member)
+        with open(outfile, "wb") as f:
+            subprocess.check_call(["ar", "p", pkgfile, member], stdout=f)
+        return outfile
+
+    def test_ipk(self):
+        self.write_control("CONTROL")
+        with open(os.path.join(self.root, "etc/foo.conf~"), "w") as f:
+            f.write("backup\n")
+        pkgfile = oe.package_writer.write_ipk(self.root, self.tmpdir)
+        self.assertEqual(pkgfile, os.path.join(self.tmpdir, "foo_1.0-r0_all.ipk"))
+        members = subprocess.check_output(["ar", "t", pkgfile]).decode().split()
+        self.assertEqual(members, ["debian-binary", "control.tar.gz", "data.tar.gz"])
+
+        with tarfile.open(self.extract_member(pkgfile, "control.tar.gz")) as tar:
+            self.assertEqual(tar.getnames(), [".", "./control", "./postinst"])
+            self.assertEqual(tar.extractfile("./control").read().decode(), self.CONTROL)
+            self.assertEqual(tar.getmember("./postinst").mode, 0o755)
+            self.assertEqual(tar.getmember("./postinst").uname, "root")
+
+        with tarfile.open(self.extract_member(pkgfile, "data.tar.gz")) as tar:
+            self.assertEqual(tar.getnames(), [".", "./etc", "./etc/foo.conf", "./usr", "./usr/bin",
+                                              "./usr/bin/link", "./usr/bin/prog", "./usr/bin/prog2"])
+            self.assertEqual(tar.getmember("./usr/bin/link").linkname, "prog")
+            self.assertTrue(tar.getmember("./usr/bin/prog2").islnk())
+            with open(os.path.join(self.root, "usr/bin/prog"), "rb") as f:
+                self.assertEqual(tar.extractfile("./usr/bin/prog").read(), f.read())
+
+    def test_data_tarball(self):
+        """The data tarball must be what GNU tar creates"""
+        try:
+            subprocess.check_output(["tar", "--sort=name", "--format=gnu", "-cf", os.devnull, "-C", self.root, "."])
+        except (OSError, subprocess.CalledProcessError):
+            self.skipTest("GNU tar with --sort not available")
+        self.write_control("CONTROL")
+        pkgfile = oe.package_writer.write_ipk(self.root, self.tmpdir)
+        expected = subprocess.check_output(["tar", "--sort=name", "--format=gnu", "--exclude=./CONTROL",
+                                            "-cf", "-", "-C", self.root, "."])
+        with gzip.open(self.extract_member(pkgfile, "data.tar.gz")) as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_deb(self):
+        """The package must have the same content as one from dpkg-deb"""
+        if not shutil.which("dpkg-deb"):
+            self.skipTest("dpkg-deb not available")
+        self.write_control("DEBIAN")
+        dpkgdir = os.path.join(self.tmpdir, "dpkg")
+        os.mkdir(dpkgdir)
+        subprocess.check_output(["dpkg-deb", "-b", self.root, dpkgdir])
+        pkgfile = oe.package_writer.write_deb(self.root, self.tmpdir)
+        self.assertEqual(os.listdir(dpkgdir), [os.path.basename(pkgfile)])
+
+        def contents(pkgfile):
+            listing = subprocess.check_output(["dpkg-deb", "--contents", pkgfile]).decode()
+            info = subprocess.check_output(["dpkg-deb", "--info", pkgfile]).decode()
+            # The sizes in the info are those of the compressed members
+            return sorted(listing.splitlines()), [l for l in info.splitlines() if "bytes" not in l]
+        self.assertEqual(contents(pkgfile), contents(os.path.join(dpkgdir, os.path.basename(pkgfile))))
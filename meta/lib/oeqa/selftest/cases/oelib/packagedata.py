@@ -0,0 +1,114 @@
+from unittest.case import TestCase
+import oe.packagedata
+import json
+import os
+import shutil
+import tempfile
+
+class TestEmitSubpkgdata(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pkgdest = os.path.join(self.tmpdir, "packages-split")
+        self.pkgdatadir = os.path.join(self.tmpdir, "pkgdata")
+        for subdir in ("runtime", "runtime-reverse", "runtime-rprovides"):
+            os.makedirs(os.path.join(self.pkgdatadir, subdir))
+        os.makedirs(os.path.join(self.pkgdest, "foo/usr/bin"))
+        os.makedirs(os.path.join(self.pkgdest, "foo-dev"))
+        self.files = [ os.path.join(self.pkgdest, "foo/usr/bin", name) for name in ("prog", "prog2") ]
+        with open(self.files[0], "w") as f:
+            f.write("1234")
+        os.link(self.files[0], self.files[1])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def emit(self, pkg, pkgval, entries, files, rprovides, allow_empty):
+        return oe.packagedata.emit_subpkgdata((pkg, pkgval, entries, files, self.pkgdest, self.pkgdatadir,
+                                                rprovides, allow_empty))
+
+    def test_packaged(self):
+        entries = [ ("PN", "foo"), ("DESCRIPTION_foo", "Tab\tand é"), ("FILES_INFO", None) ]
+        self.assertEqual(self.emit("foo", "libfoo", entries, self.files, [ "bar", "baz" ], None),
+                         ("foo", [ "/usr/bin/prog", "/usr/bin/prog2" ]))
+        runtime = os.path.join(self.pkgdatadir, "runtime/foo")
+        data = oe.packagedata.read_pkgdatafile(runtime)
+        self.assertEqual(data, { "PN": "foo", "DESCRIPTION_foo": "Tab\tand é",
+                                 "FILES_INFO": json.dumps({ "/usr/bin/prog": 4, "/usr/bin/prog2": 4 }),
+                                 "PKGSIZE_foo": "4" })
+        self.assertEqual(os.readlink(os.path.join(self.pkgdatadir, "runtime-reverse/libfoo")), "../runtime/foo")
+        for p in ("bar", "baz"):
+            link = os.path.join(self.pkgdatadir, "runtime-rprovides", p, "foo")
+            self.assertTrue(os.path.samefile(link, runtime))
+        self.assertTrue(os.path.exists(runtime + ".packaged"))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.pkgdatadir, "runtime"))), [ "foo", "foo.packaged" ])
+
+        # Existing links get replaced
+        self.assertEqual(self.emit("foo", "libfoo", entries, self.files, [ "bar" ], None)[0], "foo")
+
+    def test_empty(self):
+        self.assertEqual(self.emit("foo-dev", "foo-dev", [ ("PN", "foo") ], [], [], None), ("foo-dev", None))
+        self.assertFalse(os.path.exists(os.path.join(self.pkgdatadir, "runtime/foo-dev.packaged")))
+        self.assertFalse(os.path.lexists(os.path.join(self.pkgdatadir, "runtime-reverse/foo-dev")))
+        self.assertEqual(self.emit("foo-dev", "foo-dev", [ ("PN", "foo") ], [], [], "1"), ("foo-dev", []))
+        self.assertTrue(os.path.exists(os.path.join(self.pkgdatadir, "runtime/foo-dev.packaged")))
+
+class TestSearchIndex(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pkgdatadir = os.path.join(self.tmpdir, "pkgdata")
+        os.makedirs(os.path.join(self.pkgdatadir, "search"))
+        self.cachefile = os.path.join(self.tmpdir, "search-index.cache")
+        self.mtime = 1000000000 * 10**9
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, pn, files, pv="1.0"):
+        path = os.path.join(self.pkgdatadir, "search", pn)
+        with open(path, "w") as f:
+            json.dump({ "PN": pn, "PV": pv, "PR": "r0", "SUMMARY": "%s summary" % pn, "PACKAGES": [ pn, pn + "-dev" ],
+                        "packaged": { pn: { "PKG": pn, "DESCRIPTION": "", "files": files, "rprovides": [] } } }, f)
+        # Every write gets a different modification time
+        self.mtime += 1
+        os.utime(path, ns=(self.mtime, self.mtime))
+
+    def search(self, keyword):
+        index = oe.packagedata.read_search_index(self.pkgdatadir, self.cachefile)
+        return [ recipe[0] for recipe in oe.packagedata.search_index(index, keyword) ]
+
+    def trigrams(self, index):
+        # The recipes (rather than indexes) containing each trigram
+        names = dict((i, name) for name, i in index["slots"].items())
+        return dict((trigram, set(name for i, name in names.items() if mask >> i & 1))
+                    for trigram, mask in index["trigrams"].items())
+
+    def test_search(self):
+        self.write("foo", [ "/usr/bin/foo", "/usr/lib/libshared.so" ])
+        self.write("bar", [ "/usr/bin/bar", "/usr/lib/libshared.so" ])
+        self.write("baz", [ "/usr/bin/baz" ])
+        self.assertEqual(self.search("libshared"), [ "bar", "foo" ])
+        self.assertEqual(self.search("^/usr/bin/ba."), [ "bar", "baz" ])
+        self.assertEqual(self.search("baz-dev"), [ "baz" ])
+        self.assertEqual(self.search("baz summary"), [ "baz" ])
+        self.assertEqual(self.search("missing"), [])
+        # Each field is matched on its own
+        self.assertEqual(self.search("^ba.-dev$"), [ "bar", "baz" ])
+        self.assertEqual(self.search(r"baz\s+/usr"), [])
+        self.assertEqual(self.search("baz-devbaz"), [])
+
+        # Only what changed is indexed again, and removed recipes free
+        # their index for new ones
+        index = oe.packagedata.read_search_index(self.pkgdatadir, self.cachefile)
+        slots = dict(index["slots"])
+        self.write("foo", [ "/usr/bin/foo" ], pv="2.0")
+        os.unlink(os.path.join(self.pkgdatadir, "search", "baz"))
+        self.write("qux", [ "/usr/lib/libshared.so" ])
+        self.assertEqual(self.search("libshared"), [ "bar", "qux" ])
+        self.assertEqual(self.search("foo"), [ "foo" ])
+        index = oe.packagedata.read_search_index(self.pkgdatadir, self.cachefile)
+        self.assertEqual(index["slots"]["bar"], slots["bar"])
+        self.assertEqual(index["recipes"][index["slots"]["foo"]], ("foo", "2.0", "r0", "foo summary"))
+        self.assertEqual(len(index["recipes"]), 3)
+
+        # The result is the same as indexing everything from scratch
+        self.assertEqual(self.trigrams(index), self.trigrams(oe.packagedata.read_search_index(self.pkgdatadir)))
@@ -0,0 +1,132 @@
+from unittest.case import TestCase
+import os
+import shutil
+import tempfile
+import time
+
+class TestFindSiginfo(TestCase):
+    TASK = 'do_populate_sysroot'
+
+    def setUp(self):
+        try:
+            import bb
+        except ImportError:
+            self.skipTest("Cannot import bb")
+        import oe.sstatesig
+        self.sstatesig = oe.sstatesig
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.sstatedir = os.path.join(self.tmpdir, 'sstate-cache')
+        os.mkdir(self.sstatedir)
+        self.d = bb.data_smart.DataSmart()
+        self.d.setVar('TMPDIR', self.tmpdir)
+        self.d.setVar('STAMP', '${TMPDIR}/stamps/${MULTIMACH_TARGET_SYS}/${PN}/${PV}-${PR}')
+        self.d.setVar('SSTATE_DIR', self.sstatedir)
+        self.d.setVar('SSTATE_PKG', '${SSTATE_DIR}/*/sstate:${PN}:*:${PV}:${PR}:*:3:${BB_TASKHASH}')
+        self.d.setVar('SSTATE_SIGINFO_INDEX', '${SSTATE_DIR}/siginfo-index')
+        self.indexfile = self.d.getVar('SSTATE_SIGINFO_INDEX')
+
+    def tearDown(self):
+        self.sstatesig._siginfo_indexes.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, pn, hashval, mtime=None):
+        """
+        Write the siginfo file of a task to the sstate cache the way
+        sstate.bbclass would, as if written at mtime if given
+        """
+        path = os.path.join(self.sstatedir, hashval[:2],
+                            'sstate:%s:core2-64-poky-linux:1.0:r0:core2-64:3:%s_%s.tgz.siginfo' % (pn, hashval, self.TASK[3:]))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(hashval)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+        self.sstatesig.siginfo_index_add(self.d, path)
+        return path
+
+    def age(self, mtime):
+        """
+        Make the index and the sstate cache directories look like they were
+        last changed at mtime
+        """
+        for root, dirs, _ in os.walk(self.sstatedir):
+            for name in dirs:
+                os.utime(os.path.join(root, name), (mtime, mtime))
+        os.utime(self.indexfile, (mtime, mtime))
+
+    def test_find_hashes(self):
+        """
+        Test looking up the siginfo files of given task hashes, as
+        bitbake-diffsigs does when comparing two task hashes
+        """
+        foo1 = self.write('foo', '11aa')
+        foo2 = self.write('foo', '22bb')
+        self.write('bar', '33cc')
+        find = lambda hashes: self.sstatesig.find_siginfo('foo', self.TASK, hashes, self.d)
+
+        self.assertEqual(find(['11aa', '22bb', '44dd']), {'11aa': foo1, '22bb': foo2})
+        # The index is built on first use, later writes are appended to it
+        self.assertTrue(os.path.exists(self.indexfile))
+        foo4 = self.write('foo', '44dd')
+        self.assertEqual(find(['44dd']), {'44dd': foo4})
+
+        # A file which isn't in the index (e.g. copied into the cache while
+        # the index was up to date) is still found by globbing, and indexed
+        self.age(time.time() - 60)
+        path = foo4.replace('44dd', '55ee')
+        shutil.copy(foo4, path)
+        os.utime(os.path.dirname(path), (time.time() - 60, time.time() - 60))
+        self.assertEqual(find(['55ee']), {'55ee': path})
+        self.assertIn('55ee', self.sstatesig.load_siginfo_index(self.d)[('foo', self.TASK)])
+
+        # Removed files are not returned
+        os.unlink(foo1)
+        self.assertEqual(find(['11aa', '22bb']), {'22bb': foo2})
+
+    def test_find_all(self):
+        """
+        Test looking up the siginfo files of all hashes of a task, as
+        bitbake-diffsigs -t does
+        """
+        now = time.time()
+        foo1 = self.write('foo', '11aa', now - 20)
+        foo2 = self.write('foo', '22bb', now - 10)
+        bar = self.write('bar', '33cc', now - 10)
+        find = lambda pn: self.sstatesig.find_siginfo(pn, self.TASK, None, self.d)
+
+        self.assertEqual(find('foo'), {foo1: now - 20, foo2: now - 10})
+        self.assertEqual(find('bar'), {bar: now - 10})
+
+        # Files added or removed other than by sstate.bbclass make the
+        # index stale, so that it is rebuilt
+        self.age(now - 60)
+        with open(self.indexfile) as f:
+            self.assertNotIn('44dd', f.read())
+        os.makedirs(os.path.join(self.sstatedir, '44'))
+        foo4 = foo1.replace('11aa', '44dd').replace('/11/', '/44/')
+        shutil.copy(foo1, foo4)
+        os.utime(foo4, (now, now))
+        os.unlink(foo2)
+        self.assertEqual(find('foo'), {foo1: now - 20, foo4: now})
+        with open(self.indexfile) as f:
+            self.assertIn('44dd', f.read())
+
+        # Tasks without entries in the index are looked up by globbing
+        baz = self.write('baz', '55ee', now)
+        open(self.indexfile, 'w').close()
+        self.age(now - 30)
+        self.assertEqual(find('baz'), {baz: now})
+
+    def test_compact(self):
+        """
+        Test that the index doesn't keep growing with duplicate entries
+        """
+        path = self.write('foo', '11aa')
+        self.sstatesig.load_siginfo_index(self.d)
+        for i in range(2000):
+            self.sstatesig.siginfo_index_add(self.d, path)
+        self.assertEqual(self.sstatesig.load_siginfo_index(self.d),
+                         {('foo', self.TASK): {'11aa': os.path.relpath(path, self.sstatedir)}})
+        with open(self.indexfile) as f:
+            self.assertEqual(len(f.readlines()), 1)
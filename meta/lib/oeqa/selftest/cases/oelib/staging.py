@@ -0,0 +1,232 @@
+from unittest.case import TestCase
+import oe.staging
+import os
+import shutil
+import stat
+import tempfile
+
+class TestInstallManifest(TestCase):
+    FILES = [ "usr/bin/foo", "usr/bin/postinst-foo", "usr/lib/libfoo.so.1", "usr/share/foo/data" ]
+    LINKS = [ ("usr/lib/libfoo.so", "libfoo.so.1"), ("usr/lib/dangling", "missing") ]
+    DIRS = [ "usr/share/empty" ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.stagingdir = os.path.join(self.tmpdir, "sysroots-components")
+        self.staged = os.path.join(self.stagingdir, "core2-64/foo")
+        self.sysroot = os.path.join(self.tmpdir, "recipe-sysroot")
+        lines = []
+        for f in self.FILES:
+            path = os.path.join(self.staged, f)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as fd:
+                fd.write(f)
+            lines.append(path)
+        for l, target in self.LINKS:
+            os.symlink(target, os.path.join(self.staged, l))
+            lines.append(os.path.join(self.staged, l))
+        for d in self.DIRS:
+            os.makedirs(os.path.join(self.staged, d))
+            lines.append(os.path.join(self.staged, d) + "/")
+        lines.append(os.path.join(self.staged, "fixmepath"))
+        lines.append(os.path.join(self.staged, "fixmepath.cmd"))
+        self.manifest = os.path.join(self.tmpdir, "manifest-core2-64-foo.populate_sysroot")
+        with open(self.manifest, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def install(self, **kwargs):
+        entries, fixme = oe.staging.read_manifest(self.manifest, self.stagingdir, self.sysroot)
+        postinsts = []
+        oe.staging.install_manifest(entries, postinsts, set(), **kwargs)
+        return fixme, postinsts
+
+    def check(self):
+        for f in self.FILES:
+            self.assertTrue(os.path.samefile(os.path.join(self.sysroot, f), os.path.join(self.staged, f)), f)
+        for l, target in self.LINKS:
+            self.assertEqual(os.readlink(os.path.join(self.sysroot, l)), target)
+        for d in self.DIRS:
+            self.assertTrue(os.path.isdir(os.path.join(self.sysroot, d)))
+
+    def test_install(self):
+        fixme, postinsts = self.install()
+        self.assertEqual(fixme, [ os.path.join(self.staged, "fixmepath") ])
+        self.assertEqual(postinsts, [ os.path.join(self.sysroot, "usr/bin/postinst-foo") ])
+        self.check()
+
+        with self.assertRaises(FileExistsError):
+            self.install()
+        self.install(ignore_existing=True)
+        self.check()
+
+    def test_install_threads(self):
+        self.install(threads=4, chunksize=2)
+        self.check()
+
+    def test_existing_symlink(self):
+        # The same symlink is fine, a different one is not
+        for target in ("other", "missing"):
+            shutil.rmtree(self.sysroot, ignore_errors=True)
+            os.makedirs(os.path.join(self.sysroot, "usr/lib"))
+            os.symlink("libfoo.so.1", os.path.join(self.sysroot, "usr/lib/libfoo.so"))
+            os.symlink(target, os.path.join(self.sysroot, "usr/lib/dangling"))
+            if target == "other":
+                with self.assertRaises(FileExistsError):
+                    self.install()
+            else:
+                self.install()
+                self.check()
+
+    def test_fingerprint(self):
+        copy = os.path.join(self.tmpdir, "copy")
+        os.link(self.manifest, copy)
+        self.assertEqual(oe.staging.manifest_fingerprint(copy), oe.staging.manifest_fingerprint(self.manifest))
+        os.unlink(self.manifest)
+        with open(self.manifest, "w") as f:
+            f.write("changed\n")
+        self.assertNotEqual(oe.staging.manifest_fingerprint(copy), oe.staging.manifest_fingerprint(self.manifest))
+
+    def test_reinstall(self):
+        # Like sstate installing a new version of the component, which
+        # replaces one file and drops another
+        self.install()
+        oldentries = oe.staging.read_manifest(self.manifest, self.stagingdir, self.sysroot)[0]
+        foo = os.path.join(self.staged, "usr/bin/foo")
+        os.unlink(foo)
+        with open(foo, "w") as f:
+            f.write("new")
+        os.unlink(os.path.join(self.staged, "usr/share/foo/data"))
+        with open(self.manifest) as f:
+            lines = [l for l in f if not l.strip().endswith("usr/share/foo/data")]
+        with open(self.manifest, "w") as f:
+            f.writelines(lines)
+
+        oe.staging.remove_manifest(oldentries)
+        self.install()
+        with open(os.path.join(self.sysroot, "usr/bin/foo")) as f:
+            self.assertEqual(f.read(), "new")
+        self.assertFalse(os.path.exists(os.path.join(self.sysroot, "usr/share/foo/data")))
+        self.assertTrue(os.path.isdir(os.path.join(self.sysroot, "usr/share/empty")))
+
+class TestSharedComponents(TestCase):
+    COMPONENTS = {
+        "a-native": [ "usr/bin/a", "usr/lib/liba.so.1", "usr/share/a/data/x", "usr/share/a/a.pc" ],
+        "b-native": [ "usr/bin/b", "usr/share/a/data/y", "usr/share/b/b" ],
+        "c-native": [ "usr/bin/postinst-c", "usr/share/c/c" ],
+    }
+    FIXME = { "a-native": [ "usr/share/a/a.pc" ] }
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.workdir = os.path.join(self.tmpdir, "work")
+        self.stagingdir = os.path.join(self.tmpdir, "sysroots")
+        self.sharedroot = os.path.join(self.tmpdir, "sysroots-components/shared-native")
+        self.sysroot = os.path.join(self.workdir, "recipe-sysroot-native")
+        self.depdir = os.path.join(self.sysroot, "installeddeps")
+        os.makedirs(self.depdir)
+        self.manifests = {}
+        for c, files in self.COMPONENTS.items():
+            staged = os.path.join(self.stagingdir, "x86_64", c)
+            lines = []
+            for f in files:
+                path = os.path.join(staged, f)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as fd:
+                    fd.write(f)
+                lines.append(path)
+            if c in self.FIXME:
+                with open(os.path.join(staged, "fixmepath"), "w") as fd:
+                    fd.write("".join("sysroot-destdir/%s\n" % f for f in self.FIXME[c]))
+                lines.append(os.path.join(staged, "fixmepath"))
+            self.manifests[c] = os.path.join(self.tmpdir, "manifest-x86_64-%s.populate_sysroot" % c)
+            with open(self.manifests[c], "w") as fd:
+                fd.write("\n".join(lines) + "\n")
+
+    def tearDown(self):
+        for root, dirs, files in os.walk(self.tmpdir):
+            os.chmod(root, 0o755)
+        shutil.rmtree(self.tmpdir)
+
+    def install(self, c, taskhash="1234", shared=True):
+        name = c + "." + taskhash
+        taskmanifest = os.path.join(self.depdir, name)
+        entries, fixme = oe.staging.read_manifest(self.manifests[c], self.stagingdir, self.sysroot)
+        fixmefiles = oe.staging.read_fixme_files(fixme)
+        shareddir = os.path.join(self.sharedroot, name) if shared else None
+        install = oe.staging.SharedComponentInstall(entries, self.sysroot, shareddir, self.sharedroot, fixmefiles)
+        with open(taskmanifest, "w") as m:
+            for l in install.plan():
+                m.write(os.path.join(self.sysroot, l).replace(self.workdir + "/", "") + "\n")
+        if shared:
+            oe.staging.materialize_shared_component(entries, self.sysroot, self.sharedroot, name, taskmanifest, fixmefiles)
+        install.execute(self.depdir, self.workdir)
+        return taskmanifest
+
+    def remove(self, taskmanifest):
+        # What sstate_clean_manifest() does
+        with open(taskmanifest) as f:
+            for entry in f.read().split():
+                entry = os.path.join(self.workdir, entry)
+                try:
+                    if entry.endswith("/"):
+                        if os.path.islink(entry[:-1]):
+                            os.remove(entry[:-1])
+                        elif os.path.exists(entry) and len(os.listdir(entry)) == 0:
+                            os.rmdir(entry[:-1])
+                    else:
+                        os.remove(entry)
+                except OSError:
+                    pass
+        os.unlink(taskmanifest)
+
+    def path(self, f):
+        return os.path.join(self.sysroot, f)
+
+    def check(self, *components):
+        for c in components:
+            for f in self.COMPONENTS[c]:
+                with open(self.path(f)) as fd:
+                    self.assertEqual(fd.read(), f)
+
+    def test_shared(self):
+        a = self.install("a-native")
+        # Directories only a-native has are symlinks, those with files to
+        # relocate are not
+        self.assertTrue(os.path.islink(self.path("usr/bin")))
+        self.assertTrue(os.path.islink(self.path("usr/share/a/data")))
+        self.assertFalse(os.path.islink(self.path("usr/share/a")))
+        self.assertFalse(os.path.exists(os.path.join(self.sharedroot, "a-native.1234/usr/share/a/a.pc")))
+        self.check("a-native")
+
+        self.install("b-native")
+        self.assertFalse(os.path.islink(self.path("usr/bin")))
+        self.assertFalse(os.path.islink(self.path("usr/share/a/data")))
+        self.assertTrue(os.path.islink(self.path("usr/share/b")))
+        self.check("a-native", "b-native")
+        # The shared trees are not writable
+        self.assertEqual(stat.S_IMODE(os.stat(self.path("usr/share/b")).st_mode), 0o555)
+
+        # c-native has a postinst, so it is not shared
+        self.install("c-native", shared=False)
+        self.assertFalse(os.path.exists(os.path.join(self.sharedroot, "c-native.1234")))
+        self.assertFalse(os.path.islink(self.path("usr/share/c")))
+        self.check("a-native", "b-native", "c-native")
+
+        # Removing a-native leaves nothing of it behind, even in the
+        # directories b-native unfolded
+        self.remove(a)
+        self.check("b-native", "c-native")
+        for f in self.COMPONENTS["a-native"]:
+            self.assertFalse(os.path.lexists(self.path(f)), f)
+        self.assertFalse(os.path.lexists(self.path("usr/lib")))
+        self.assertEqual(os.listdir(self.path("usr/share/a/data")), [ "y" ])
+
+        # The unused tree of a-native goes once another version gets
+        # installed, the one of b-native is still in use
+        self.install("a-native", "5678")
+        self.check("a-native", "b-native", "c-native")
+        self.assertEqual(sorted(f for f in os.listdir(self.sharedroot) if not f.endswith(".lock")),
+                         [ "a-native.5678", "a-native.5678.users", "b-native.1234", "b-native.1234.users" ])
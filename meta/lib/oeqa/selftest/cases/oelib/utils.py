@@ -1,5 +1,5 @@
 from unittest.case import TestCase
-from oe.utils import packages_filter_out_system, trim_version
+from oe.utils import packages_filter_out_system, trim_version, multiprocess_launch
 
 class TestPackagesFilterOutSystem(TestCase):
     def test_filter(self):
@@ -49,3 +49,21 @@ class TestTrimVersion(TestCase):
         self.assertEqual(trim_version("1.2.3", 2), "1.2")
         self.assertEqual(trim_version("1.2.3", 3), "1.2.3")
         self.assertEqual(trim_version("1.2.3", 4), "1.2.3")
+
+class TestMultiprocessLaunch(TestCase):
+    def test_launch(self):
+        try:
+            import bb
+        except ImportError:
+            self.skipTest("Cannot import bb")
+
+        d = bb.data_smart.DataSmart()
+        d.setVar("BB_NUMBER_THREADS", "2")
+
+        # Neither the target nor the extra argument can be pickled
+        offset = lambda: 10
+        def square(i, offset):
+            return i * i + offset()
+
+        results = multiprocess_launch(square, range(5), d, extraargs=(offset,))
+        self.assertEqual(sorted(results), [10, 11, 14, 19, 26])
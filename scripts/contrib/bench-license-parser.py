@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Microbenchmark for the license string handling in oe.license
+#
+# Collects the literal LICENSE values assigned in the recipes of the
+# specified layers (OE-Core by default) and times parsing them with the
+# ast-based LicenseVisitor against the compiled and cached expression
+# trees used by flattened_licenses(), is_included() and friends.
+#
+# Copyright (C) 2017 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import argparse
+import os
+import re
+import sys
+import timeit
+import warnings
+
+scripts_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+oecore_path = os.path.dirname(scripts_path)
+sys.path.insert(0, os.path.join(oecore_path, 'meta', 'lib'))
+
+import oe.license
+
+license_re = re.compile(r'^LICENSE(_[^\s?=]+)?\s*\??=\s*"([^"$]*)"', re.MULTILINE)
+
+def find_license_values(layers):
+    values = []
+    for layer in layers:
+        for root, dirs, files in os.walk(layer):
+            for fn in files:
+                if fn.endswith(('.bb', '.inc', '.bbappend')):
+                    with open(os.path.join(root, fn), errors='replace') as f:
+                        values.extend(m.group(2) for m in license_re.finditer(f.read()))
+    return values
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parsing of LICENSE values')
+    parser.add_argument('layers', nargs='*', default=[os.path.join(oecore_path, 'meta')],
+                        help='Layer directories to collect LICENSE values from (default: OE-Core)')
+    parser.add_argument('-n', '--number', type=int, default=20,
+                        help='Number of passes over all values (default: %(default)s)')
+    args = parser.parse_args()
+
+    values = []
+    for value in find_license_values(args.layers):
+        try:
+            oe.license.compile_license(value)
+            values.append(value)
+        except (oe.license.LicenseError, SyntaxError):
+            pass
+    print('%d LICENSE values (%d distinct)' % (len(values), len(set(values))))
+
+    def choose(alpha, beta):
+        return alpha
+
+    def ast_parse():
+        for value in values:
+            oe.license.LicenseVisitor().visit_string(value)
+
+    def flatten_cold():
+        oe.license.compile_license.cache_clear()
+        for value in values:
+            oe.license.flattened_licenses(value, choose)
+
+    def flatten_warm():
+        for value in values:
+            oe.license.flattened_licenses(value, choose)
+
+    def is_included():
+        for value in values:
+            oe.license.is_included(value, ['*'], ['GPL-3.0*', 'LGPL-3.0*'])
+
+    warnings.simplefilter('ignore', DeprecationWarning)
+    for name, func in [('ast parse (previous implementation)', ast_parse),
+                       ('flattened_licenses, empty cache', flatten_cold),
+                       ('flattened_licenses, cached', flatten_warm),
+                       ('is_included, cached', is_included)]:
+        elapsed = timeit.timeit(func, number=args.number)
+        print('%-40s %8.2f ms per pass' % (name, elapsed * 1000 / args.number))
+
+if __name__ == '__main__':
+    main()
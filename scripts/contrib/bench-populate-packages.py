@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# Benchmark for the file assignment done by populate_packages
+#
+# Creates a synthetic PKGD with the given number of files (spread over
+# binaries, libraries, headers, documentation and locales) and times
+# expanding typical FILES values for a set of packages, tracking which
+# paths were already shipped and computing the installed but not shipped
+# paths. The hard linking into PKGDEST is the same for both variants and
+# is not included.
+#
+# Copyright (C) 2017 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+scripts_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+oecore_path = os.path.dirname(scripts_path)
+sys.path.insert(0, os.path.join(oecore_path, 'meta', 'lib'))
+
+import oe.cachedpath
+import oe.package
+
+PACKAGES = [
+    ('${PN}-dbg', ['/usr/lib/.debug', '/usr/bin/.debug', '/usr/src/debug']),
+    ('${PN}-staticdev', ['/usr/lib/*.a']),
+    ('${PN}-dev', ['/usr/include', '/usr/lib/lib*.so', '/usr/lib/pkgconfig']),
+    ('${PN}-doc', ['/usr/share/doc', '/usr/share/man', '/usr/share/info']),
+    ('${PN}-locale', ['/usr/share/locale']),
+    ('${PN}', ['/usr/bin/*', '/usr/sbin/*', '/usr/lib/lib*.so.*', '/etc', '/usr/share/${PN}']),
+]
+
+def create_tree(rootdir, count):
+    layout = [('usr/bin', 'prog%d', 0.05), ('usr/lib', 'lib%d.so.1.0', 0.1), ('usr/lib', 'lib%d.a', 0.05),
+              ('usr/lib/.debug', 'lib%d.so.1.0', 0.1), ('usr/include/sub%d', 'header%d.h', 0.3),
+              ('usr/share/doc/pkg%d', 'page%d.html', 0.2), ('usr/share/locale/l%d/LC_MESSAGES', 'domain%d.mo', 0.15),
+              ('usr/share/unshipped', 'data%d', 0.05)]
+    for dirname, filename, share in layout:
+        files = int(count * share)
+        for i in range(files):
+            path = os.path.join(rootdir, dirname % (i // 100) if '%' in dirname else dirname)
+            if i % 100 == 0:
+                os.makedirs(path, exist_ok=True)
+            open(os.path.join(path, filename % i), 'w').close()
+
+def populate(dvar, filevars):
+    tree = oe.package.FileTree(dvar)
+    installed = list(tree.walk())
+    seen = set()
+    for pkg, pattern in filevars:
+        files = oe.package.files_from_filevars(pattern, tree)[0]
+        for file in files:
+            if tree.lexists(file) and file not in seen:
+                seen.add(file)
+    return [path[1:] for path in installed if path not in seen]
+
+def populate_previous(dvar, filevars):
+    cpath = oe.cachedpath.CachedPath()
+    seen = []
+    for pkg, pattern in filevars:
+        files = []
+        for f in pattern:
+            f = '.' + f
+            globbed = glob.glob(f)
+            if globbed and [f] != globbed:
+                files += globbed
+            else:
+                files.append(f)
+        for f in files:
+            if not cpath.islink(f) and cpath.isdir(f):
+                files += [os.path.join(f, x) for x in os.listdir(f)]
+        for file in files:
+            if (not cpath.islink(file)) and (not cpath.exists(file)):
+                continue
+            if file in seen:
+                continue
+            seen.append(file)
+    unshipped = []
+    for root, dirs, files in cpath.walk(dvar):
+        dir = root[len(dvar):] or os.sep
+        for f in (files + dirs):
+            path = os.path.join(dir, f)
+            if ('.' + path) not in seen:
+                unshipped.append(path)
+    return unshipped
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the file assignment of populate_packages')
+    parser.add_argument('-n', '--files', type=int, default=200000,
+                        help='Number of files in the synthetic recipe (default: %(default)s)')
+    parser.add_argument('--previous', action='store_true',
+                        help='Also time the previous, list based implementation (quadratic, use with -n 20000 or less)')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench-populate-packages-')
+    cwd = os.getcwd()
+    try:
+        dvar = os.path.join(tmpdir, 'package')
+        create_tree(dvar, args.files)
+        os.chdir(dvar)
+        variants = [('set and cached tree', populate)]
+        if args.previous:
+            variants.append(('list and glob (previous implementation)', populate_previous))
+        for name, func in variants:
+            start = time.time()
+            unshipped = func(dvar, PACKAGES)
+            print('%-40s %8.2f s, %d not shipped' % (name, time.time() - start, len(unshipped)))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Benchmark for task signature generation
+#
+# Times "bitbake -S none <target>" (which computes the signatures of all
+# tasks needed for the target without running any of them) in the
+# current build directory, optionally with locked signatures and unlocked
+# recipes configured as in the extensible SDK. One untimed run is done
+# first so that the parse cache is up to date.
+#
+# Copyright (C) 2017 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark task signature generation')
+    parser.add_argument('target', nargs='?', default='world',
+                        help='Target to generate signatures for (default: %(default)s)')
+    parser.add_argument('-n', '--number', type=int, default=3,
+                        help='Number of timed runs (default: %(default)s)')
+    parser.add_argument('-l', '--locked-sigs',
+                        help='locked-sigs.inc file to use, e.g. as written by bitbake -S none')
+    parser.add_argument('-u', '--unlocked', default='',
+                        help='Space separated list of recipes to set in SIGGEN_UNLOCKED_RECIPES')
+    args = parser.parse_args()
+
+    if not os.environ.get('BUILDDIR'):
+        print('ERROR: please run this script from a build environment', file=sys.stderr)
+        return 1
+
+    with tempfile.NamedTemporaryFile('w', suffix='.conf') as conf:
+        if args.locked_sigs:
+            conf.write('require %s\n' % os.path.abspath(args.locked_sigs))
+        conf.write('SIGGEN_UNLOCKED_RECIPES = "%s"\n' % args.unlocked)
+        conf.flush()
+
+        # bitbake -S writes locked-sigs.inc to the current directory, so run
+        # it from a temporary one to not overwrite an existing one. BBPATH
+        # lets it find the build directory's configuration from there.
+        env = dict(os.environ, BBPATH=os.environ['BUILDDIR'])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cmd = ['bitbake', '-R', conf.name, '-S', 'none', args.target]
+            subprocess.check_call(cmd, cwd=tmpdir, env=env, stdout=subprocess.DEVNULL)
+            times = []
+            for _ in range(args.number):
+                start = time.time()
+                subprocess.check_call(cmd, cwd=tmpdir, env=env, stdout=subprocess.DEVNULL)
+                times.append(time.time() - start)
+
+    print('bitbake -S none %s: best %.2f s, mean %.2f s over %d runs' %
+          (args.target, min(times), sum(times) / len(times), len(times)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+# Benchmark for devtool/recipetool command latency
+#
+# Runs the specified command (by default "devtool search busybox")
+# repeatedly in the current build directory, first parsing from scratch
+# each time and then reusing a memory resident bitbake server as enabled
+# by setting OE_TINFOIL_SERVER=1, and reports the time taken per run.
+#
+# Copyright (C) 2017 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+def time_command(cmd, env, number):
+    times = []
+    for _ in range(number):
+        start = time.time()
+        subprocess.check_call(cmd, env=env, stdout=subprocess.DEVNULL)
+        times.append(time.time() - start)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark devtool/recipetool command latency with and without a reused bitbake server')
+    parser.add_argument('command', nargs=argparse.REMAINDER,
+                        help='Command to run (default: devtool search busybox)')
+    parser.add_argument('-n', '--number', type=int, default=5,
+                        help='Number of timed runs in each mode (default: %(default)s)')
+    args = parser.parse_args()
+
+    builddir = os.environ.get('BUILDDIR')
+    if not builddir:
+        print('ERROR: please run this script from a build environment', file=sys.stderr)
+        return 1
+    if os.environ.get('BBSERVER'):
+        print('ERROR: please run this script without a memory resident bitbake server (BBSERVER) set up', file=sys.stderr)
+        return 1
+    cmd = args.command or ['devtool', 'search', 'busybox']
+
+    env = dict(os.environ)
+    env.pop('OE_TINFOIL_SERVER', None)
+    results = [('without server', time_command(cmd, env, args.number))]
+
+    env['OE_TINFOIL_SERVER'] = '1'
+    try:
+        # The first run starts the server and parses everything
+        results.append(('with server, first run', time_command(cmd, env, 1)))
+        results.append(('with server', time_command(cmd, env, args.number)))
+    finally:
+        lockfile = os.path.join(builddir, 'bitbake.lock')
+        address = ''
+        if os.path.exists(lockfile):
+            with open(lockfile, 'r') as f:
+                address = f.read().strip()
+        if ':' in address:
+            subprocess.call(['bitbake', '-m'], cwd=builddir, env=dict(os.environ, BBSERVER=address),
+                            stdout=subprocess.DEVNULL)
+
+    print(' '.join(cmd))
+    for name, times in results:
+        print('  %-25s best %6.2f s, mean %6.2f s' % (name, min(times), sum(times) / len(times)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -113,10 +113,13 @@ def setup_tinfoil(config_only=False, basepath=None, tracking=False):
             sys.exit(1)
 
         import bb.tinfoil
+        import scriptutils
+        scriptutils.setup_tinfoil_server(basepath or os.environ.get('BUILDDIR'), logger)
         tinfoil = bb.tinfoil.Tinfoil(tracking=tracking)
         try:
             tinfoil.prepare(config_only)
             tinfoil.logger.setLevel(logger.getEffectiveLevel())
+            scriptutils.record_tinfoil_server_state(tinfoil)
         except bb.tinfoil.TinfoilUIException:
             tinfoil.shutdown()
             raise DevtoolError('Failed to start bitbake environment')
@@ -28,13 +28,21 @@ logger = logging.getLogger('devtool')
 
 deploylist_path = '/.devtool'
 
-def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=False, nopreserve=False, nocheckspace=False):
+def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=False, nopreserve=False, nocheckspace=False, delta=False):
     """
     Prepare a shell script for running on the target to
     deploy/undeploy files. We have to be careful what we put in this
     script - only commands that are likely to be available on the
     target are suitable (the target might be constrained, e.g. using
     busybox rather than bash with coreutils).
+
+    When deploying, the script is run as:
+      sh script recipename destdir filelist hashes [deploylist removedlist]
+    with the tar stream to extract on stdin. With delta=True the tar
+    stream only contains what changed since the last deployment, the
+    previously deployed files listed in removedlist are deleted and
+    deploylist replaces the manifest, rather than removing all
+    previously deployed files and recording what was extracted.
     """
     lines = []
     lines.append('#!/bin/sh')
@@ -48,10 +56,16 @@ def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=Fals
         if not deploy:
             lines.append('echo "Previously deployed files for $1:"')
     lines.append('manifest="%s/$1.list"' % deploylist_path)
+    lines.append('hashes="%s/$1.hashes"' % deploylist_path)
     lines.append('preservedir="%s/$1.preserve"' % deploylist_path)
-    lines.append('if [ -f $manifest ] ; then')
+    if deploy and delta:
+        # Only delete the previously deployed files that are gone now
+        lines.append('removed=$6')
+    else:
+        lines.append('removed=$manifest')
+    lines.append('if [ -f $removed ] ; then')
     # Read manifest in reverse and delete files / remove empty dirs
-    lines.append('    sed \'1!G;h;$!d\' $manifest | while read file')
+    lines.append('    sed \'1!G;h;$!d\' $removed | while read file')
     lines.append('    do')
     if dryrun:
         lines.append('        if [ ! -d $file ] ; then')
@@ -68,7 +82,9 @@ def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=Fals
         lines.append('        fi')
     lines.append('    done')
     if not dryrun:
-        lines.append('    rm $manifest')
+        lines.append('    rm $removed')
+        if not (deploy and delta):
+            lines.append('    rm -f $hashes')
     if not deploy and not dryrun:
         # May as well remove all traces
         lines.append('    rmdir `dirname $manifest` > /dev/null 2>&1 || true')
@@ -110,11 +126,19 @@ def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=Fals
             lines.append('rm $3')
         lines.append('mkdir -p `dirname $manifest`')
         lines.append('mkdir -p $2')
-        if verbose:
-            lines.append('    tar xv -C $2 -f - | tee $manifest')
+        if delta:
+            if verbose:
+                lines.append('    tar xv -C $2 -f -')
+            else:
+                lines.append('    tar x -C $2 -f -')
+            lines.append('mv $5 $manifest')
         else:
-            lines.append('    tar xv -C $2 -f - > $manifest')
-        lines.append('sed -i "s!^./!$2!" $manifest')
+            if verbose:
+                lines.append('    tar xv -C $2 -f - | tee $manifest')
+            else:
+                lines.append('    tar xv -C $2 -f - > $manifest')
+            lines.append('sed -i "s!^./!$2!" $manifest')
+        lines.append('mv $4 $hashes')
     elif not dryrun:
         # Put any preserved files back
         lines.append('if [ -d $preservedir ] ; then')
@@ -140,6 +164,65 @@ def _prepare_remote_script(deploy, verbose=False, dryrun=False, undeployall=Fals
     return '\n'.join(lines)
 
 
+def _deploy_hashes(recipe_outdir):
+    """
+    Return a dict mapping the path (relative to recipe_outdir, starting
+    with ./) of everything to deploy to its mode and a digest of its
+    content (for symlinks, of the link target)
+    """
+    import hashlib
+    import stat
+
+    entries = {}
+    for root, dirs, files in os.walk(recipe_outdir):
+        relroot = os.path.join('.', os.path.relpath(root, recipe_outdir)) if root != recipe_outdir else '.'
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            st = os.lstat(path)
+            if stat.S_ISLNK(st.st_mode):
+                digest = 'l' + hashlib.sha256(os.readlink(path).encode('utf-8', 'surrogateescape')).hexdigest()
+            elif stat.S_ISREG(st.st_mode):
+                h = hashlib.sha256()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(65536), b''):
+                        h.update(chunk)
+                digest = h.hexdigest()
+            else:
+                digest = '-'
+            entries[os.path.join(relroot, name)] = ('%o' % st.st_mode, digest)
+    return entries
+
+def _format_deploy_hashes(destdir, entries):
+    """Format the manifest of hashes kept on the target"""
+    lines = ['%s\n' % destdir]
+    for path in sorted(entries):
+        lines.append('%s %s %s\n' % (entries[path] + (path,)))
+    return ''.join(lines)
+
+def _parse_deploy_hashes(data):
+    """
+    Parse the manifest of hashes read back from the target, returning
+    (destdir, entries) or (None, None) if there is no usable manifest
+    """
+    lines = data.splitlines()
+    if not lines:
+        return None, None
+    entries = {}
+    for line in lines[1:]:
+        fields = line.split(' ', 2)
+        if len(fields) != 3:
+            return None, None
+        entries[fields[2]] = (fields[0], fields[1])
+    return lines[0], entries
+
+def _target_path(destdir, path, mode):
+    """Return the path as it appears in the deployed files list on the target"""
+    import stat
+    targetpath = os.path.normpath(os.path.join(destdir, path))
+    if stat.S_ISDIR(int(mode, 8)) and not targetpath.endswith('/'):
+        targetpath += '/'
+    return targetpath
+
 def deploy(args, config, basepath, workspace):
     """Entry point for the devtool 'deploy' subcommand"""
     import re
@@ -204,6 +287,38 @@ def deploy(args, config, basepath, workspace):
             scp_port = "-P %s" % args.port
             ssh_port = "-p %s" % args.port
 
+        hashes = _deploy_hashes(recipe_outdir)
+        delta = False
+        if not args.no_delta:
+            # Find out what was deployed last time (if anything), so that
+            # only what changed since then needs to be transferred
+            try:
+                output = subprocess.check_output('ssh %s %s %s \'cat %s/%s.hashes 2>/dev/null || true\'' % (ssh_port, extraoptions, args.target, deploylist_path, args.recipename), shell=True)
+            except subprocess.CalledProcessError:
+                raise DevtoolError('Failed to connect to %s - rerun with -s to '
+                                'get a complete error message' % args.target)
+            olddestdir, oldhashes = _parse_deploy_hashes(output.decode('utf-8', errors='surrogateescape'))
+            delta = oldhashes is not None and olddestdir == destdir
+        if delta:
+            changed = sorted(path for path in hashes if oldhashes.get(path) != hashes[path])
+            removed = sorted(path for path in oldhashes if path not in hashes)
+            if not changed and not removed:
+                logger.info('%s is already deployed to %s and has not changed' % (recipe_outdir, args.target))
+                return 0
+            changedset = set(changed)
+            newfiles = set(path for path in changed if path not in oldhashes)
+            ftotalsize = 0
+            deltafilelist = []
+            for fpath, fsize in filelist:
+                path = os.path.join('.', os.path.relpath(fpath, destdir))
+                if path in changedset:
+                    ftotalsize += fsize
+                    if path in newfiles:
+                        deltafilelist.append((fpath, fsize))
+            filelist = deltafilelist
+            logger.info('Deploying %d changed and removing %d deleted files/directories'
+                        % (len(changed), len(removed)))
+
         # In order to delete previously deployed files and have the manifest file on
         # the target, we write out a shell script and then copy it to the target
         # so we can then run it (piping tar output to it).
@@ -212,10 +327,14 @@ def deploy(args, config, basepath, workspace):
         try:
             tmpscript = '/tmp/devtool_deploy.sh'
             tmpfilelist = os.path.join(os.path.dirname(tmpscript), 'devtool_deploy.list')
+            tmphashes = os.path.join(os.path.dirname(tmpscript), 'devtool_deploy.hashes')
+            tmpdeploylist = os.path.join(os.path.dirname(tmpscript), 'devtool_deploy.deployed')
+            tmpremoved = os.path.join(os.path.dirname(tmpscript), 'devtool_deploy.removed')
             shellscript = _prepare_remote_script(deploy=True,
                                                 verbose=args.show_status,
                                                 nopreserve=args.no_preserve,
-                                                nocheckspace=args.no_check_space)
+                                                nocheckspace=args.no_check_space,
+                                                delta=delta)
             # Write out the script to a file
             with open(os.path.join(tmpdir, os.path.basename(tmpscript)), 'w') as f:
                 f.write(shellscript)
@@ -224,20 +343,42 @@ def deploy(args, config, basepath, workspace):
                 f.write('%d\n' % ftotalsize)
                 for fpath, fsize in filelist:
                     f.write('%s %d\n' % (fpath, fsize))
+            # Write out the hashes of what is being deployed for next time
+            with open(os.path.join(tmpdir, os.path.basename(tmphashes)), 'w') as f:
+                f.write(_format_deploy_hashes(destdir, hashes))
+            if delta:
+                # The list of deployed files is normally produced by tar
+                # on the target, but tar only sees the changes here
+                with open(os.path.join(tmpdir, os.path.basename(tmpdeploylist)), 'w') as f:
+                    f.write('%s\n' % destdir)
+                    for path in sorted(hashes):
+                        f.write('%s\n' % _target_path(destdir, path, hashes[path][0]))
+                with open(os.path.join(tmpdir, os.path.basename(tmpremoved)), 'w') as f:
+                    for path in removed:
+                        f.write('%s\n' % _target_path(destdir, path, oldhashes[path][0]))
+                with open(os.path.join(tmpdir, 'tarlist'), 'w') as f:
+                    f.write(''.join('%s\0' % path for path in changed))
             # Copy them to the target
-            ret = subprocess.call("scp %s %s %s/* %s:%s" % (scp_port, extraoptions, tmpdir, args.target, os.path.dirname(tmpscript)), shell=True)
+            ret = subprocess.call("scp %s %s %s/devtool_deploy* %s:%s" % (scp_port, extraoptions, tmpdir, args.target, os.path.dirname(tmpscript)), shell=True)
             if ret != 0:
                 raise DevtoolError('Failed to copy script to %s - rerun with -s to '
                                 'get a complete error message' % args.target)
+
+            # Now run the script
+            if delta:
+                # Only the changes, in one (ssh compressed) stream
+                tarcmd = 'tar cf - --no-recursion --null -T %s' % os.path.join(tmpdir, 'tarlist')
+                sshcmd = 'ssh -C %s %s %s \'sh %s %s %s %s %s %s %s\'' % (ssh_port, extraoptions, args.target, tmpscript, args.recipename, destdir, tmpfilelist, tmphashes, tmpdeploylist, tmpremoved)
+            else:
+                tarcmd = 'tar cf - .'
+                sshcmd = 'ssh  %s %s %s \'sh %s %s %s %s %s\'' % (ssh_port, extraoptions, args.target, tmpscript, args.recipename, destdir, tmpfilelist, tmphashes)
+            ret = exec_fakeroot(rd, '%s | %s' % (tarcmd, sshcmd), cwd=recipe_outdir, shell=True)
+            if ret != 0:
+                raise DevtoolError('Deploy failed - rerun with -s to get a complete '
+                                'error message')
         finally:
             shutil.rmtree(tmpdir)
 
-        # Now run the script
-        ret = exec_fakeroot(rd, 'tar cf - . | ssh  %s %s %s \'sh %s %s %s %s\'' % (ssh_port, extraoptions, args.target, tmpscript, args.recipename, destdir, tmpfilelist), cwd=recipe_outdir, shell=True)
-        if ret != 0:
-            raise DevtoolError('Deploy failed - rerun with -s to get a complete '
-                            'error message')
-
         logger.info('Successfully deployed %s' % recipe_outdir)
 
         files_list = []
@@ -312,6 +453,7 @@ def register_commands(subparsers, context):
     parser_deploy.add_argument('-n', '--dry-run', help='List files to be deployed only', action='store_true')
     parser_deploy.add_argument('-p', '--no-preserve', help='Do not preserve existing files', action='store_true')
     parser_deploy.add_argument('--no-check-space', help='Do not check for available space before deploying', action='store_true')
+    parser_deploy.add_argument('--no-delta', help='Transfer all files, rather than only those that changed since the recipe was last deployed to the target', action='store_true')
     parser_deploy.add_argument('-P', '--port', default='22', help='Port to use for connection to the target')
     parser_deploy.set_defaults(func=deploy)
 
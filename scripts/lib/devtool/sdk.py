@@ -55,15 +55,29 @@ def generate_update_dict(sigfile_new, sigfile_old):
 
 def get_sstate_objects(update_dict, sstate_dir):
     """Return a list containing sstate objects which are to be installed"""
+    # Index the available objects by hash in a single pass over the
+    # sstate directory rather than globbing it for each hash. Objects are
+    # named sstate:<pn>:...:<hash>_<task>.tgz and live in <hash[:2]>/
+    # subdirectories, optionally below a further (e.g. NATIVELSBSTRING)
+    # directory.
+    available = {}
+    for subdir in [sstate_dir] + [os.path.join(sstate_dir, d) for d in os.listdir(sstate_dir)
+                                  if len(d) != 2 and os.path.isdir(os.path.join(sstate_dir, d))]:
+        for prefix in os.listdir(subdir):
+            prefixdir = os.path.join(subdir, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefixdir):
+                continue
+            with os.scandir(prefixdir) as it:
+                for entry in it:
+                    if not entry.name.endswith('.tgz'):
+                        continue
+                    hashval = entry.name.rpartition(':')[2].partition('_')[0]
+                    available.setdefault(hashval, []).append(entry.path)
+
     sstate_objects = []
     for k in update_dict:
-        files = set()
         hashval = update_dict[k]
-        p = sstate_dir + '/' + hashval[:2] + '/*' + hashval + '*.tgz'
-        files |= set(glob.glob(p))
-        p = sstate_dir + '/*/' + hashval[:2] + '/*' + hashval + '*.tgz'
-        files |= set(glob.glob(p))
-        files = list(files)
+        files = available.get(hashval, [])
         if len(files) == 1:
             sstate_objects.extend(files)
         elif len(files) > 1:
@@ -80,16 +94,51 @@ def mkdir(d):
 
 def install_sstate_objects(sstate_objects, src_sdk, dest_sdk):
     """Install sstate objects into destination SDK"""
+    import concurrent.futures
+
     sstate_dir = os.path.join(dest_sdk, 'sstate-cache')
     if not os.path.exists(sstate_dir):
-        logger.error("Missing sstate-cache directory in %s, it might not be an extensible SDK." % dest_sdk)
-        raise
+        raise DevtoolError("Missing sstate-cache directory in %s, it might not be an extensible SDK." % dest_sdk)
+    tocopy = []
+    destdirs = set()
     for sb in sstate_objects:
-        dst = sb.replace(src_sdk, dest_sdk)
+        dst = os.path.join(dest_sdk, os.path.relpath(sb, src_sdk))
+        # The object name includes the task signature, so an object that is
+        # already there with the same size is the same object
+        if os.path.exists(dst) and os.path.getsize(dst) == os.path.getsize(sb):
+            logger.debug("%s already installed" % dst)
+            continue
         destdir = os.path.dirname(dst)
-        mkdir(destdir)
-        logger.debug("Copying %s to %s" % (sb, dst))
-        shutil.copy(sb, dst)
+        if destdir not in destdirs:
+            mkdir(destdir)
+            destdirs.add(destdir)
+        if os.path.lexists(dst):
+            os.remove(dst)
+        try:
+            os.link(sb, dst)
+            logger.debug("Linked %s to %s" % (sb, dst))
+        except OSError:
+            tocopy.append((sb, dst))
+
+    if tocopy:
+        # The source SDK is on a different filesystem, copy in parallel
+        def copy(item):
+            logger.debug("Copying %s to %s" % item)
+            shutil.copy(*item)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
+            for _ in executor.map(copy, tocopy):
+                pass
+
+def fetch_update_file(updateserver, path, destfile, cwd):
+    """Fetch path from the update server, which may be a local (file://) one"""
+    if updateserver.startswith('file://'):
+        try:
+            shutil.copy(os.path.join(updateserver[len('file://'):], path), os.path.join(cwd, destfile))
+        except OSError as e:
+            logger.debug("Copying %s failed: %s" % (path, e))
+            return 1
+        return 0
+    return subprocess.call("wget -q -O %s %s/%s" % (destfile, updateserver, path), shell=True, cwd=cwd)
 
 def check_manifest(fn, basepath):
     import bb.utils
@@ -144,7 +193,10 @@ def sdk_update(args, config, basepath, workspace):
         new_locked_sig_file_path = os.path.join(tmpsdk_dir, 'conf', 'locked-sigs.inc')
         # Fetch manifest from server
         tmpmanifest = os.path.join(tmpsdk_dir, 'conf', 'sdk-conf-manifest')
-        ret = subprocess.call("wget -q -O %s %s/conf/sdk-conf-manifest" % (tmpmanifest, updateserver), shell=True)
+        ret = fetch_update_file(updateserver, 'conf/sdk-conf-manifest', tmpmanifest, tmpsdk_dir)
+        if ret != 0:
+            logger.error("Fetching conf/sdk-conf-manifest from %s failed" % updateserver)
+            return ret
         changedfiles = check_manifest(tmpmanifest, basepath)
         if not changedfiles:
             logger.info("Already up-to-date")
@@ -169,7 +221,7 @@ def sdk_update(args, config, basepath, workspace):
                 return ret
         logger.debug("Updating conf files ...")
         for changedfile in changedfiles:
-            ret = subprocess.call("wget -q -O %s %s/%s" % (changedfile, updateserver, changedfile), shell=True, cwd=tmpsdk_dir)
+            ret = fetch_update_file(updateserver, changedfile, changedfile, tmpsdk_dir)
             if ret != 0:
                 logger.error("Updating %s failed" % changedfile)
                 return ret
@@ -194,7 +246,17 @@ def sdk_update(args, config, basepath, workspace):
                 for buildarch, chksum in newsums:
                     uninative_file = os.path.join('downloads', 'uninative', chksum, '%s-nativesdk-libc.tar.bz2' % buildarch)
                     mkdir(os.path.join(tmpsdk_dir, os.path.dirname(uninative_file)))
-                    ret = subprocess.call("wget -q -O %s %s/%s" % (uninative_file, updateserver, uninative_file), shell=True, cwd=tmpsdk_dir)
+                    ret = fetch_update_file(updateserver, uninative_file, uninative_file, tmpsdk_dir)
+
+        # Install the sstate objects of a local update server directly,
+        # hardlinking them where possible, rather than having each of them
+        # fetched through SSTATE_MIRRORS
+        if updateserver.startswith('file://') and 'conf/locked-sigs.inc' in changedfiles:
+            src_sdk = updateserver[len('file://'):]
+            update_dict = generate_update_dict(new_locked_sig_file_path, old_locked_sig_file_path)
+            logger.debug("Installing sstate objects for %d changed signatures ..." % len(update_dict))
+            sstate_objects = get_sstate_objects(update_dict, os.path.join(src_sdk, 'sstate-cache'))
+            install_sstate_objects(sstate_objects, src_sdk, basepath)
 
         # Ok, all is well at this point - move everything over
         tmplayers_dir = os.path.join(tmpsdk_dir, 'layers')
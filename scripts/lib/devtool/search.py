@@ -26,54 +26,90 @@ from devtool import setup_tinfoil, parse_recipe, DevtoolError
 
 logger = logging.getLogger('devtool')
 
+def _search_pkgdata_files(pkgdata_dir, pns, keyword_rc):
+    """Search the pkgdata of recipes that have no search record"""
+    matches = []
+    for fn in pns:
+        pfn = os.path.join(pkgdata_dir, fn)
+
+        packages = []
+        match = False
+        if keyword_rc.search(fn):
+            match = True
+
+        if not match:
+            with open(pfn, 'r') as f:
+                for line in f:
+                    if line.startswith('PACKAGES:'):
+                        packages = line.split(':', 1)[1].strip().split()
+
+            for pkg in packages:
+                if keyword_rc.search(pkg):
+                    match = True
+                    break
+                if os.path.exists(os.path.join(pkgdata_dir, 'runtime', pkg + '.packaged')):
+                    with open(os.path.join(pkgdata_dir, 'runtime', pkg), 'r') as f:
+                        for line in f:
+                            if ': ' in line:
+                                splitline = line.split(':', 1)
+                                key = splitline[0]
+                                value = splitline[1].strip()
+                            if key in ['PKG_%s' % pkg, 'DESCRIPTION', 'FILES_INFO'] or key.startswith('FILERPROVIDES_'):
+                                if keyword_rc.search(value):
+                                    match = True
+                                    break
+
+        if match:
+            matches.append(fn)
+    return matches
+
 def search(args, config, basepath, workspace):
     """Entry point for the devtool 'search' subcommand"""
 
-    tinfoil = setup_tinfoil(config_only=False, basepath=basepath)
+    # Recipes only need to be parsed for pkgdata written before search
+    # records were (see emit_pkgdata), which is rare
+    tinfoil = setup_tinfoil(config_only=True, basepath=basepath)
     try:
+        import oe.packagedata
+
         pkgdata_dir = tinfoil.config_data.getVar('PKGDATA_DIR')
         defsummary = tinfoil.config_data.getVar('SUMMARY', False) or ''
+        persistent_dir = tinfoil.config_data.getVar('PERSISTENT_DIR')
 
         keyword_rc = re.compile(args.keyword)
 
-        for fn in os.listdir(pkgdata_dir):
-            pfn = os.path.join(pkgdata_dir, fn)
-            if not os.path.isfile(pfn):
-                continue
-
-            packages = []
-            match = False
-            if keyword_rc.search(fn):
-                match = True
-
-            if not match:
-                with open(pfn, 'r') as f:
-                    for line in f:
-                        if line.startswith('PACKAGES:'):
-                            packages = line.split(':', 1)[1].strip().split()
-
-                for pkg in packages:
-                    if keyword_rc.search(pkg):
-                        match = True
-                        break
-                    if os.path.exists(os.path.join(pkgdata_dir, 'runtime', pkg + '.packaged')):
-                        with open(os.path.join(pkgdata_dir, 'runtime', pkg), 'r') as f:
-                            for line in f:
-                                if ': ' in line:
-                                    splitline = line.split(':', 1)
-                                    key = splitline[0]
-                                    value = splitline[1].strip()
-                                if key in ['PKG_%s' % pkg, 'DESCRIPTION', 'FILES_INFO'] or key.startswith('FILERPROVIDES_'):
-                                    if keyword_rc.search(value):
-                                        match = True
-                                        break
-
-            if match:
+        cachefile = None
+        if persistent_dir:
+            bb.utils.mkdirhier(persistent_dir)
+            cachefile = os.path.join(persistent_dir, 'devtool-search-index.cache')
+        index = oe.packagedata.read_search_index(pkgdata_dir, cachefile)
+
+        results = {}
+        localdata = bb.data.createCopy(tinfoil.config_data)
+        for pn, pv, pr, summary in oe.packagedata.search_index(index, args.keyword):
+            localdata.setVar('PN', pn)
+            localdata.setVar('PV', pv)
+            localdata.setVar('PR', pr)
+            if summary == localdata.expand(defsummary):
+                summary = ''
+            results[pn] = summary
+
+        indexed = set(index['recipes'][i][0] for i in index['slots'].values())
+        unindexed = [fn for fn in os.listdir(pkgdata_dir)
+                     if fn not in indexed and os.path.isfile(os.path.join(pkgdata_dir, fn))]
+        unindexed_matches = _search_pkgdata_files(pkgdata_dir, unindexed, keyword_rc)
+        if unindexed_matches:
+            tinfoil.shutdown()
+            tinfoil = setup_tinfoil(config_only=False, basepath=basepath)
+            for fn in unindexed_matches:
                 rd = parse_recipe(config, tinfoil, fn, True)
                 summary = rd.getVar('SUMMARY')
                 if summary == rd.expand(defsummary):
                     summary = ''
-                print("%s  %s" % (fn.ljust(20), summary))
+                results[fn] = summary
+
+        for fn in sorted(results):
+            print("%s  %s" % (fn.ljust(20), results[fn]))
     finally:
         tinfoil.shutdown()
 
@@ -82,7 +118,7 @@ def search(args, config, basepath, workspace):
 def register_commands(subparsers, context):
     """Register devtool subcommands from this plugin"""
     parser_search = subparsers.add_parser('search', help='Search available recipes',
-                                            description='Searches for available target recipes. Matches on recipe name, package name, description and installed files, and prints the recipe name on match.',
+                                            description='Searches for available target recipes. Matches on recipe name, summary, package name, description and installed files, and prints the recipe name on match.',
                                             group='info')
     parser_search.add_argument('keyword', help='Keyword to search for (regular expression syntax allowed)')
     parser_search.set_defaults(func=search, no_workspace=True)
@@ -417,6 +417,12 @@ def create_recipe(args):
         pkgarch = "${MACHINE_ARCH}"
 
     extravalues = {}
+    if args.fuzzy_license is not None:
+        # Minimum similarity for guess_license() to accept a fuzzy match
+        # against a common license. Passed through extravalues (as a string
+        # like the other values) so that plugins calling handle_license_vars()
+        # get it as well.
+        extravalues['fuzzylicense'] = str(args.fuzzy_license)
     checksums = (None, None)
     tempsrc = ''
     source = args.source
@@ -758,6 +764,7 @@ def create_recipe(args):
     postrm = ("postrm", extravalues.pop('postrm', None))
     preinst = ("preinst", extravalues.pop('preinst', None))
     prerm = ("prerm", extravalues.pop('prerm', None))
+    extravalues.pop('fuzzylicense', None)
     funcs = [postinst, postrm, preinst, prerm]
     for func in funcs:
         if func[1]:
@@ -813,7 +820,8 @@ def create_recipe(args):
     return 0
 
 def handle_license_vars(srctree, lines_before, handled, extravalues, d):
-    licvalues = guess_license(srctree, d)
+    fuzzy_threshold = extravalues.get('fuzzylicense')
+    licvalues = guess_license(srctree, d, float(fuzzy_threshold) if fuzzy_threshold else None)
     lic_files_chksum = []
     lic_unknown = []
     if licvalues:
@@ -863,15 +871,79 @@ def handle_license_vars(srctree, lines_before, handled, extravalues, d):
     handled.append(('license', licvalues))
     return licvalues
 
-def get_license_md5sums(d, static_only=False):
+def _fingerprint_license_file(licfile, md5sums=None):
+    """
+    Return the md5sum of a license file along with the license,
+    md5sum and text crunch_license() determines for it (None if the
+    md5sum is already in md5sums)
+    """
     import bb.utils
+    md5value = bb.utils.md5_file(licfile)
+    if md5sums and md5value in md5sums:
+        return md5value, None, None, None
+    license, crunched_md5, lictext = crunch_license(licfile)
+    return md5value, license, crunched_md5, lictext
+
+def _fingerprint_license_files(licfiles, md5sums=None):
+    """
+    Fingerprint the specified license files, in parallel if there are
+    enough of them to make it worthwhile
+    """
+    if len(licfiles) < 4:
+        return [_fingerprint_license_file(licfile, md5sums) for licfile in licfiles]
+    import concurrent.futures
+    import functools
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        return list(executor.map(functools.partial(_fingerprint_license_file, md5sums=md5sums),
+                                 licfiles, chunksize=8))
+
+def get_common_license_fingerprints(d):
+    """
+    Return a dict with the md5sums ('md5sums') and the md5sums
+    ('crunched') and texts ('texts') as produced by crunch_license() of
+    the license files in COMMON_LICENSE_DIR, each mapping to the license
+    name. The fingerprints are cached in PERSISTENT_DIR until the mtime
+    of the directory changes.
+    """
+    commonlicdir = d.getVar('COMMON_LICENSE_DIR')
+    mtime = os.stat(commonlicdir).st_mtime_ns
+    cachefile = None
+    if d.getVar('PERSISTENT_DIR'):
+        cachefile = os.path.join(d.getVar('PERSISTENT_DIR'), 'recipetool-license-fingerprints.json')
+        try:
+            with open(cachefile, 'r') as f:
+                cache = json.load(f)
+            if cache['dir'] == commonlicdir and cache['mtime'] == mtime:
+                return cache['fingerprints']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    # Sort so that the result doesn't depend on the directory order when
+    # several files have the same content
+    licnames = sorted(os.listdir(commonlicdir))
+    results = _fingerprint_license_files([os.path.join(commonlicdir, fn) for fn in licnames])
+    fingerprints = {'md5sums': {}, 'crunched': {}, 'texts': {}}
+    for fn, (md5value, _, crunched_md5, lictext) in zip(licnames, results):
+        fingerprints['md5sums'][md5value] = fn
+        if crunched_md5:
+            fingerprints['crunched'][crunched_md5] = fn
+            fingerprints['texts'][fn] = ' '.join(lictext)
+
+    if cachefile:
+        try:
+            bb.utils.mkdirhier(os.path.dirname(cachefile))
+            with open(cachefile + '.new', 'w') as f:
+                json.dump({'dir': commonlicdir, 'mtime': mtime, 'fingerprints': fingerprints}, f)
+            os.rename(cachefile + '.new', cachefile)
+        except OSError as e:
+            logger.debug('Unable to write license fingerprint cache %s: %s' % (cachefile, e))
+    return fingerprints
+
+def get_license_md5sums(d, static_only=False):
     md5sums = {}
     if not static_only:
         # Gather md5sums of license files in common license dir
-        commonlicdir = d.getVar('COMMON_LICENSE_DIR')
-        for fn in os.listdir(commonlicdir):
-            md5value = bb.utils.md5_file(os.path.join(commonlicdir, fn))
-            md5sums[md5value] = fn
+        md5sums.update(get_common_license_fingerprints(d)['md5sums'])
     # The following were extracted from common values in various recipes
     # (double checking the license against the license file itself, not just
     # the LICENSE value in the recipe)
@@ -983,25 +1055,61 @@ def crunch_license(licfile):
     license = crunched_md5sums.get(md5val, None)
     return license, md5val, lictext
 
-def guess_license(srctree, d):
-    import bb
-    md5sums = get_license_md5sums(d)
+def license_shingles(text, size=5):
+    """
+    Return the set of runs of size consecutive words in a license text
+    (ignoring case and punctuation), for comparing texts by similarity
+    """
+    words = re.findall(r'[a-z0-9]+', text.lower())
+    return set(' '.join(words[i:i+size]) for i in range(max(len(words) - size + 1, 1)))
+
+_common_license_shingles = None
+
+def fuzzy_match_license(lictext, fingerprints, threshold):
+    """
+    Return the name of the common license whose text is most similar
+    (by Jaccard similarity of word shingles) to lictext, if that is at
+    least threshold, otherwise None
+    """
+    global _common_license_shingles
+    if _common_license_shingles is None:
+        _common_license_shingles = {fn: license_shingles(text) for fn, text in fingerprints['texts'].items()}
+    shingles = license_shingles(lictext)
+    best, bestscore = None, 0
+    for fn, commonshingles in _common_license_shingles.items():
+        # The similarity can't reach the threshold if the sizes differ too much
+        if min(len(shingles), len(commonshingles)) < threshold * max(len(shingles), len(commonshingles)):
+            continue
+        common = len(shingles & commonshingles)
+        score = common / (len(shingles) + len(commonshingles) - common)
+        if score > bestscore:
+            best, bestscore = fn, score
+    if bestscore >= threshold:
+        return best
+    return None
+
+licspecs = ['*LICEN[CS]E*', 'COPYING*', '*[Ll]icense*', 'LEGAL*', '[Ll]egal*', '*GPL*', 'README.lic*', 'COPYRIGHT*', '[Cc]opyright*']
+licfile_re = re.compile('|'.join('(?:%s)' % fnmatch.translate(spec) for spec in licspecs))
+
+def guess_license(srctree, d, fuzzy_threshold=None):
+    fingerprints = get_common_license_fingerprints(d)
+    md5sums = dict(fingerprints['md5sums'])
+    md5sums.update(get_license_md5sums(d, static_only=True))
 
     licenses = []
-    licspecs = ['*LICEN[CS]E*', 'COPYING*', '*[Ll]icense*', 'LEGAL*', '[Ll]egal*', '*GPL*', 'README.lic*', 'COPYRIGHT*', '[Cc]opyright*']
     licfiles = []
     for root, dirs, files in os.walk(srctree):
         for fn in files:
-            for spec in licspecs:
-                if fnmatch.fnmatch(fn, spec):
-                    fullpath = os.path.join(root, fn)
-                    if not fullpath in licfiles:
-                        licfiles.append(fullpath)
-    for licfile in licfiles:
-        md5value = bb.utils.md5_file(licfile)
-        license = md5sums.get(md5value, None)
-        if not license:
-            license, crunched_md5, lictext = crunch_license(licfile)
+            if licfile_re.match(fn):
+                licfiles.append(os.path.join(root, fn))
+    results = _fingerprint_license_files(licfiles, md5sums)
+    for licfile, (md5value, license, crunched_md5, lictext) in zip(licfiles, results):
+        if md5value in md5sums:
+            license = md5sums[md5value]
+        elif not license:
+            license = fingerprints['crunched'].get(crunched_md5, None)
+            if not license and fuzzy_threshold and lictext:
+                license = fuzzy_match_license(' '.join(lictext), fingerprints, fuzzy_threshold)
             if not license:
                 license = 'Unknown'
         licenses.append((license, os.path.relpath(licfile, srctree), md5value))
@@ -1179,6 +1287,7 @@ def register_commands(subparsers):
     parser_create.add_argument('-a', '--autorev', help='When fetching from a git repository, set SRCREV in the recipe to a floating revision instead of fixed', action="store_true")
     parser_create.add_argument('--keep-temp', action="store_true", help='Keep temporary directory (for debugging)')
     parser_create.add_argument('--fetch-dev', action="store_true", help='For npm, also fetch devDependencies')
+    parser_create.add_argument('--fuzzy-license', type=float, nargs='?', const=0.9, metavar='THRESHOLD', help='Identify license files that are not an exact match for a known license text by their similarity to the common licenses, accepting matches of at least THRESHOLD (0-1, default 0.9)')
     parser_create.add_argument('--devtool', action="store_true", help=argparse.SUPPRESS)
     # FIXME I really hate having to set parserecipes for this, but given we may need
     # to call into npm (and we don't know in advance if we will or not) and in order
@@ -150,3 +150,199 @@ def is_src_url(param):
     elif param.startswith('git@') or ('@' in param and param.endswith('.git')):
         return True
     return False
+
+# Shared lock on the state file held by each process using the bitbake
+# server set up by setup_tinfoil_server(), for as long as it runs
+_tinfoil_server_lock = None
+
+def _tinfoil_server_statefile(builddir):
+    return os.path.join(builddir, 'tinfoil-server.state')
+
+def _touch_tinfoil_server_state(statefile):
+    try:
+        os.utime(statefile)
+    except OSError:
+        pass
+
+def _lock_tinfoil_server(statefile):
+    global _tinfoil_server_lock
+    import atexit
+    import fcntl
+
+    if _tinfoil_server_lock is None:
+        _tinfoil_server_lock = open(statefile + '.lock', 'a')
+        fcntl.flock(_tinfoil_server_lock, fcntl.LOCK_SH)
+        # The server's idle time counts from when it was last used
+        atexit.register(_touch_tinfoil_server_state, statefile)
+
+def _tinfoil_server_watchdog(builddir, address, timeout):
+    """
+    Stop the bitbake server at address (with bitbake -m) once no process
+    has used it for timeout seconds, or return when it gets replaced
+    """
+    import fcntl
+    import json
+    import time
+
+    statefile = _tinfoil_server_statefile(builddir)
+    while True:
+        time.sleep(min(timeout, 60))
+        try:
+            with open(statefile, 'r') as f:
+                if json.load(f).get('address') != address:
+                    return
+            if time.time() - os.stat(statefile).st_mtime < timeout:
+                continue
+            with open(statefile + '.lock', 'a') as lockfile:
+                try:
+                    fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Still in use
+                    continue
+                if time.time() - os.stat(statefile).st_mtime < timeout:
+                    continue
+                subprocess.call(['bitbake', '-m'], cwd=builddir, env=dict(os.environ, BBSERVER=address),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                os.unlink(statefile)
+                return
+        except (OSError, ValueError):
+            return
+
+def _start_tinfoil_server_watchdog(builddir, address, timeout):
+    """Run _tinfoil_server_watchdog() in a daemon process"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.setsid()
+            if os.fork() == 0:
+                # Don't keep the lock or the caller's output open
+                _tinfoil_server_lock.close()
+                devnull = os.open(os.devnull, os.O_RDWR)
+                for fd in range(3):
+                    os.dup2(devnull, fd)
+                os.closerange(3, os.sysconf('SC_OPEN_MAX'))
+                _tinfoil_server_watchdog(builddir, address, timeout)
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+def _metadata_signature(dirs):
+    """
+    Return a signature of the metadata (recipes, appends, classes,
+    configuration and python files) below the specified directories that
+    changes when any of it is added, removed or modified
+    """
+    count = 0
+    latest = 0
+    for topdir in dirs:
+        pending = [topdir]
+        while pending:
+            try:
+                it = os.scandir(pending.pop())
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif not entry.name.endswith(('.bb', '.bbappend', '.bbclass', '.conf', '.inc', '.py')):
+                        continue
+                    count += 1
+                    latest = max(latest, entry.stat(follow_symlinks=False).st_mtime_ns)
+    return [count, latest]
+
+def _bitbake_server_address(builddir):
+    try:
+        with open(os.path.join(builddir, 'bitbake.lock'), 'r') as f:
+            address = f.read().strip()
+    except OSError:
+        return None
+    if ':' not in address:
+        return None
+    env = dict(os.environ, BBSERVER=address)
+    ret = subprocess.call(['bitbake', '--status-only'], cwd=builddir, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if ret != 0:
+        return None
+    return address
+
+def setup_tinfoil_server(builddir, logger):
+    """
+    Opt-in (by setting OE_TINFOIL_SERVER=1 in the environment) reuse of a
+    memory resident bitbake server for the build directory across
+    devtool/recipetool invocations, so that configuration and recipes are
+    not parsed from scratch by each of them. Starts the server if needed,
+    or restarts it if any of the metadata it parsed has changed since, and
+    points tinfoil at it through BBSERVER. Does nothing if BBSERVER is
+    already set (e.g. by oe-init-build-env-memres).
+
+    The server holds the build directory's bitbake.lock, so it is stopped
+    once it has not been used for OE_TINFOIL_SERVER_TIMEOUT seconds (1800
+    by default, 0 to keep it running). To stop it earlier, e.g. to run
+    bitbake directly, run "bitbake -m" with BBSERVER set to the address in
+    tinfoil-server.state in the build directory.
+    """
+    import json
+
+    if os.environ.get('OE_TINFOIL_SERVER') != '1' or os.environ.get('BBSERVER') or not builddir:
+        return
+
+    statefile = _tinfoil_server_statefile(builddir)
+    _lock_tinfoil_server(statefile)
+    try:
+        with open(statefile, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+
+    address = _bitbake_server_address(builddir)
+    if address:
+        if state.get('address') == address and state.get('dirs') is not None and \
+                _metadata_signature(state['dirs']) == state.get('signature'):
+            logger.debug('Reusing bitbake server %s' % address)
+            _touch_tinfoil_server_state(statefile)
+            os.environ['BBSERVER'] = address
+            return
+        logger.info('Metadata has changed, restarting bitbake server')
+        subprocess.call(['bitbake', '-m'], cwd=builddir, env=dict(os.environ, BBSERVER=address),
+                        stdout=subprocess.DEVNULL)
+
+    logger.info('Starting memory resident bitbake server')
+    subprocess.check_call(['bitbake', '--server-only', '-t', 'xmlrpc', '-B', 'localhost:-1'],
+                          cwd=builddir, stdout=subprocess.DEVNULL)
+    address = _bitbake_server_address(builddir)
+    if not address:
+        logger.warning('Unable to connect to bitbake server, parsing locally instead')
+        return
+    with open(statefile, 'w') as f:
+        json.dump({'address': address, 'dirs': None}, f)
+    timeout = int(os.environ.get('OE_TINFOIL_SERVER_TIMEOUT') or 1800)
+    if timeout > 0:
+        _start_tinfoil_server_watchdog(builddir, address, timeout)
+    os.environ['BBSERVER'] = address
+
+def record_tinfoil_server_state(tinfoil):
+    """
+    Record which metadata the bitbake server set up by
+    setup_tinfoil_server() has parsed (and its current state), once
+    tinfoil is connected, so that later invocations can tell if it has
+    become stale
+    """
+    import json
+
+    builddir = tinfoil.config_data.getVar('TOPDIR')
+    address = os.environ.get('BBSERVER')
+    statefile = _tinfoil_server_statefile(builddir)
+    if not address or not os.path.exists(statefile):
+        return
+    with open(statefile, 'r') as f:
+        state = json.load(f)
+    if state.get('address') != address or state.get('dirs') is not None:
+        return
+    dirs = (tinfoil.config_data.getVar('BBLAYERS') or '').split() + [os.path.join(builddir, 'conf')]
+    state['dirs'] = dirs
+    state['signature'] = _metadata_signature(dirs)
+    with open(statefile, 'w') as f:
+        json.dump(state, f)